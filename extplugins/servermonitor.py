@@ -18,96 +18,1778 @@
 #
 #
 import StringIO
-from contextlib import closing
+import array
+import bisect
+import collections
+import functools
 import gzip
+import httplib
+import itertools
 import json
+import math
+import mmap
+import os
+import Queue
+import random
 import re
 import socket
+import string
+import struct
+import threading
+import time
 import urllib2
-from b3.parsers.frostbite.connection import FrostbiteConnection
+import urlparse
+import b3
+from b3.parsers.frostbite.connection import FrostbiteConnection, FrostbiteNetworkException
 from b3.plugin import Plugin
 #noinspection PyUnresolvedReferences
-from b3.events import EVT_GAME_MAP_CHANGE
-from b3.parsers.bf3 import Bf3Parser, MAP_NAME_BY_ID as bf3_MAP_NAME_BY_ID, GAME_MODES_NAMES as bf3_GAME_MODES_NAMES
+from b3.events import EVT_GAME_MAP_CHANGE, EVT_STOP, EVT_EXIT
+from b3.parsers.bf3 import MAP_NAME_BY_ID as bf3_MAP_NAME_BY_ID, GAME_MODES_NAMES as bf3_GAME_MODES_NAMES
+try:
+    from b3.parsers.bf4 import MAP_NAME_BY_ID as bf4_MAP_NAME_BY_ID, GAME_MODES_NAMES as bf4_GAME_MODES_NAMES
+except ImportError:
+    # B3 older than 1.10
+    bf4_MAP_NAME_BY_ID = bf4_GAME_MODES_NAMES = {}
+try:
+    from b3.parsers.bfh import MAP_NAME_BY_ID as bfh_MAP_NAME_BY_ID, GAME_MODES_NAMES as bfh_GAME_MODES_NAMES
+except ImportError:
+    # B3 older than 1.10
+    bfh_MAP_NAME_BY_ID = bfh_GAME_MODES_NAMES = {}
 
-__version__ = '1.3'
+__version__ = '1.4'
 __author__ = 'Courgette'
 
 
 USER_AGENT = "B3 gamemonitor plugin/%s" % __version__
 
 
+def split_address(address):
+    """
+    return the (host, port) tuple from a <host:port> string
+    """
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+class DNSCache(object):
+    """
+    Cache of host name resolutions so that game server queries never wait for a DNS resolver.
+    Host names are resolved when the game servers are loaded from the config. Afterwards, resolutions older than TTL
+    seconds are refreshed from a background thread while the previous IP keeps being used. Host names which could not
+    be resolved are tried again after NEGATIVE_TTL seconds. IP addresses are not looked up.
+    """
+    TTL = 300  # seconds
+    NEGATIVE_TTL = 30  # seconds
+    IP_PATTERN = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+
+    def __init__(self, resolver=socket.gethostbyname):
+        self.resolver = resolver
+        self._lock = threading.Lock()
+        self._entries = {}  # host -> (ip or None, time of the resolution)
+        self._refreshing = set()
+
+    def resolve(self, host):
+        """
+        return the IP of the given host name. The DNS resolver is only queried from the calling thread the first time
+        a host name is seen. Raise socket.gaierror if the host name cannot be resolved.
+        """
+        if self.IP_PATTERN.match(host):
+            return host
+        entry = self._entries.get(host)
+        if entry is None:
+            ip = self._resolve(host)
+        else:
+            ip, resolved_at = entry
+            if time.time() - resolved_at > (self.TTL if ip else self.NEGATIVE_TTL):
+                self._refresh(host)
+        if ip is None:
+            raise socket.gaierror("could not resolve %s" % host)
+        return ip
+
+    def resolve_address(self, address):
+        """
+        return the (ip, port) tuple from a <host:port> string
+        """
+        host, port = split_address(address)
+        return self.resolve(host), port
+
+    def _resolve(self, host):
+        try:
+            ip = self.resolver(host)
+        except socket.error:
+            ip = None
+        self._lock.acquire()
+        try:
+            previous = self._entries.get(host)
+            if ip is None and previous is not None and previous[0] is not None:
+                # keep using the last known IP, try again in a while
+                self._entries[host] = (previous[0], time.time() - self.TTL + self.NEGATIVE_TTL)
+            else:
+                self._entries[host] = (ip, time.time())
+            self._refreshing.discard(host)
+        finally:
+            self._lock.release()
+        return ip
+
+    def _refresh(self, host):
+        self._lock.acquire()
+        try:
+            if host in self._refreshing:
+                return
+            self._refreshing.add(host)
+        finally:
+            self._lock.release()
+        refresh = threading.Thread(target=self._resolve, args=(host,), name="servermonitor-dns")
+        refresh.setDaemon(True)
+        refresh.start()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+
+dns_cache = DNSCache()
+
+
+class LatencyTracker(object):
+    """
+    Keep the round trip times recently observed with a game server to derive a timeout from them
+    """
+    SAMPLES = 50  # number of round trip times to keep
+    MIN_SAMPLES = 5  # number of round trip times required to adapt the timeout
+    FACTOR = 3  # timeout = p99 * FACTOR
+    MIN_TIMEOUT = .5  # seconds
+
+    def __init__(self):
+        self._samples = collections.deque(maxlen=self.SAMPLES)
+
+    def add(self, rtt):
+        self._samples.append(rtt)
+
+    def percentile(self, p):
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[max(0, int(math.ceil(p / 100.0 * len(samples))) - 1)]
+
+    def timeout(self, default):
+        """
+        return a timeout suited to the observed round trip times, never greater than 'default'
+        """
+        if len(self._samples) < self.MIN_SAMPLES:
+            return default
+        return min(default, max(self.MIN_TIMEOUT, self.percentile(99) * self.FACTOR))
+
+
 class Frostbite1Connection(FrostbiteConnection):
     """
-    Customize FrostbiteConnection so it can work without password
+    Customize FrostbiteConnection so it can work without password
+    """
+    TIMEOUT = 3
+
+    def __init__(self, console, host, port):
+        self.console = console
+        self._host = host
+        self._port = port
+        self._password = None
+        self._connect()
+
+    def _connect(self):
+        """
+        Establish the connection with the Frostbite server, giving up on unresponsive servers.
+        """
+        self.console.debug('opening FrostbiteConnection socket')
+        self._receiveBuffer = ''
+        self._serverSocket = socket.create_connection((self._host, self._port), self.TIMEOUT)
+
+    def set_timeout(self, timeout):
+        if self._serverSocket is not None:
+            self._serverSocket.settimeout(timeout)
+
+    def abort(self):
+        """
+        Close the socket right away. Unlike close(), no 'quit' request is sent, which would only wait for the timeout
+        again on a connection which just failed.
+        """
+        if self._serverSocket is not None:
+            try:
+                self._serverSocket.close()
+            except socket.error:
+                pass
+            self._serverSocket = None
+
+
+def frostbite_network_error(err):
+    """
+    return the socket.error B3 wrapped into the given FrostbiteNetworkException, so that timeouts can be told apart.
+    Other exceptions are returned as is.
+    """
+    if isinstance(err, FrostbiteNetworkException) and err.args and isinstance(err.args[0], socket.error):
+        return err.args[0]
+    return err
+
+
+class FrostbiteConnectionPool(object):
+    """
+    Keep one Frostbite connection open per game server across queries.
+    Requests to a same game server are serialized. A connection which fails is dropped and, unless that connection was
+    working so far, attempts to reconnect are delayed with an exponential backoff.
+    Requests time out after a delay adapted to the round trip times observed with each game server.
+    """
+    TIMEOUT = 3  # seconds
+    MIN_BACKOFF = 5  # seconds
+    MAX_BACKOFF = 300  # seconds
+    MULTIPLEXED = False  # one connection per game server, queries are best sent in parallel
+
+    def __init__(self, connection_factory=Frostbite1Connection):
+        self.connection_factory = connection_factory
+        self._lock = threading.Lock()
+        self._slots = {}  # address -> FrostbiteConnectionSlot
+
+    def _get_slot(self, address):
+        self._lock.acquire()
+        try:
+            if address not in self._slots:
+                self._slots[address] = FrostbiteConnectionSlot()
+            return self._slots[address]
+        finally:
+            self._lock.release()
+
+    def send_request(self, console, address, *words):
+        """
+        send a request to the Frostbite game server at the given <host:port> address and return the response words
+        """
+        slot = self._get_slot(address)
+        slot.lock.acquire()
+        try:
+            if slot.connection is not None:
+                try:
+                    return slot.send_request(words, self.TIMEOUT)
+                except Exception, err:
+                    slot.disconnect()
+                    err = frostbite_network_error(err)
+                    if isinstance(err, socket.timeout):
+                        # a hung game server, which a new connection would not make answer any faster
+                        raise err
+                    # the game server might have dropped our idle connection, try again with a new one
+                    console.debug("Frostbite connection to %s lost. %s" % (address, err))
+            if time.time() < slot.retry_at:
+                raise socket.timeout("not reconnecting to %s before %ss" % (address, int(slot.retry_at - time.time())))
+            try:
+                host, port = dns_cache.resolve_address(address)
+                slot.connection = self.connection_factory(console, host, port)
+                response = slot.send_request(words, self.TIMEOUT)
+            except Exception, err:
+                slot.disconnect()
+                slot.failures += 1
+                slot.retry_at = time.time() + min(self.MAX_BACKOFF, self.MIN_BACKOFF * 2 ** (slot.failures - 1))
+                raise frostbite_network_error(err)
+            else:
+                slot.failures = 0
+                slot.retry_at = 0
+                return response
+        finally:
+            slot.lock.release()
+
+    def close(self, address):
+        self._lock.acquire()
+        try:
+            slot = self._slots.pop(address, None)
+        finally:
+            self._lock.release()
+        if slot is not None:
+            slot.lock.acquire()
+            try:
+                slot.disconnect(graceful=True)
+            finally:
+                slot.lock.release()
+
+    def close_all(self):
+        for address in self._slots.keys():
+            self.close(address)
+
+
+class FrostbiteConnectionSlot(object):
+    """
+    The connection to one game server held by a FrostbiteConnectionPool
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connection = None
+        self.failures = 0
+        self.retry_at = 0
+        self.latency = LatencyTracker()
+
+    def send_request(self, words, timeout):
+        self.connection.set_timeout(self.latency.timeout(timeout))
+        start = time.time()
+        response = self.connection.sendRequest(*words)
+        self.latency.add(time.time() - start)
+        return response
+
+    def disconnect(self, graceful=False):
+        """
+        drop the connection. Only a graceful disconnection says goodbye to the game server, which is pointless (and
+        slow) for a connection which failed.
+        """
+        if self.connection is not None:
+            try:
+                if graceful:
+                    self.connection.close()
+                else:
+                    self.connection.abort()
+            except Exception:
+                pass
+            self.connection = None
+
+
+class HTTPDocument(str):
+    """
+    A document downloaded from a web server, along with the validators to use for conditional requests
+    """
+    def __new__(cls, content, etag=None, last_modified=None):
+        document = str.__new__(cls, content)
+        document.etag = etag
+        document.last_modified = last_modified
+        return document
+
+
+class HTTPConnectionPool(object):
+    """
+    Keep HTTP connections open once a request is complete so following requests to the same web server reuse them.
+    """
+    TIMEOUT = 10
+    MULTIPLEXED = True  # many requests to a same web server are efficiently pipelined
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}  # host -> list of idle httplib.HTTPConnection
+
+    def _acquire(self, host):
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(host)
+            if idle:
+                return idle.pop()
+        finally:
+            self._lock.release()
+
+    def _release(self, host, connection):
+        self._lock.acquire()
+        try:
+            self._idle.setdefault(host, []).append(connection)
+        finally:
+            self._lock.release()
+
+    def request(self, url, headers):
+        """
+        send a GET request and return the (response, body) tuple
+        """
+        scheme, host, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path += '?' + query
+        connection = self._acquire(host)
+        if connection is not None:
+            try:
+                return self._request(host, connection, path, headers)
+            except (httplib.HTTPException, socket.error):
+                # the web server might have closed our idle connection, try again with a new one
+                pass
+        return self._request(host, httplib.HTTPConnection(host, timeout=self.TIMEOUT), path, headers)
+
+    def _request(self, host, connection, path, headers):
+        try:
+            connection.request('GET', path or '/', headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(host, connection)
+        return response, body
+
+    def request_many(self, host, requests):
+        """
+        send many GET requests to a same web server, pipelined on a single connection.
+        'requests' is a list of (path, headers) tuples.
+        Return the list of (response, body) tuples in the same order as the requests.
+        """
+        results = []
+        while len(results) < len(requests):
+            pending = requests[len(results):]
+            connection = self._acquire(host)
+            reused = connection is not None
+            if not reused:
+                connection = httplib.HTTPConnection(host, timeout=self.TIMEOUT)
+            progress = len(results)
+            try:
+                if connection.sock is None:
+                    connection.connect()
+                connection.sock.sendall(''.join([self._format_request(host, path, headers) for path, headers in pending]))
+                for i in range(len(pending)):
+                    response = httplib.HTTPResponse(connection.sock, method='GET')
+                    response.begin()
+                    results.append((response, response.read()))
+                    if response.will_close:
+                        break
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if len(results) == progress and not reused:
+                    raise
+                continue
+            if results[-1][0].will_close:
+                # the remaining requests, if any, will be sent again on a new connection
+                connection.close()
+            else:
+                self._release(host, connection)
+        return results
+
+    @staticmethod
+    def _format_request(host, path, headers):
+        lines = ['GET %s HTTP/1.1' % (path or '/'), 'Host: %s' % host]
+        lines.extend(['%s: %s' % (name, value) for name, value in headers.items()])
+        return '\r\n'.join(lines) + '\r\n\r\n'
+
+    def close_all(self):
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+http_pool = HTTPConnectionPool()
+
+
+def http_headers(etag=None, last_modified=None):
+    headers = {
+        'User-Agent': USER_AGENT,
+        'Accept-encoding': 'gzip',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def http_document(url, response, body):
+    """
+    return the HTTPDocument from a web server response or raise urllib2.HTTPError
+    """
+    if response.status != 200:
+        raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+    if response.getheader('content-encoding', '') == 'gzip':
+        body = StringIO.StringIO(body)
+        gzipper = gzip.GzipFile(fileobj=body)
+        body = gzipper.read()
+    return HTTPDocument(body, response.getheader('etag'), response.getheader('last-modified'))
+
+
+def http_get(url, etag=None, last_modified=None):
+    """
+    return the document served by a web server at a given url.
+    If the etag or last_modified validators of a previously downloaded document are given and the document did not
+    change since then, urllib2.HTTPError is raised with code 304.
+    """
+    headers = http_headers(etag, last_modified)
+    for redirection in range(5):
+        response, body = http_pool.request(url, headers)
+        if response.status in (301, 302, 303, 307) and response.getheader('location'):
+            url = urlparse.urljoin(url, response.getheader('location'))
+        else:
+            break
+    return http_document(url, response, body)
+
+
+def http_get_many(requests):
+    """
+    download many documents at once, pipelining the requests sent to a same web server on a single connection.
+    'requests' is a list of (url, validators) tuples where validators is a dict which can have the etag and
+    last_modified keys (see http_get).
+    Return a list with, for each request, either the HTTPDocument or the exception raised trying to download it.
+    """
+    results = [None] * len(requests)
+    by_host = {}
+    for index, (url, validators) in enumerate(requests):
+        scheme, host, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path += '?' + query
+        by_host.setdefault(host, []).append((index, path, http_headers(**validators)))
+    for host, host_requests in by_host.items():
+        try:
+            responses = http_pool.request_many(host, [(path, headers) for index, path, headers in host_requests])
+        except Exception, err:
+            responses = [err] * len(host_requests)
+        for (index, path, headers), response in zip(host_requests, responses):
+            url, validators = requests[index]
+            if isinstance(response, Exception):
+                results[index] = response
+                continue
+            response, body = response
+            try:
+                if response.status in (301, 302, 303, 307) and response.getheader('location'):
+                    results[index] = http_get(urlparse.urljoin(url, response.getheader('location')), **validators)
+                else:
+                    results[index] = http_document(url, response, body)
+            except Exception, err:
+                results[index] = err
+    return results
+
+
+class UDPQuery(object):
+    """
+    A query sent through a UDPMultiplexer and waiting for its reply
+    """
+    def __init__(self, address, target, expect=None):
+        self.address = address
+        self.target = target
+        self.expect = expect  # function telling if a datagram is the reply to this query, None to accept any
+        self.response = None
+        self.timeout = None
+        self.sent_at = None
+        self.answered = threading.Event()
+
+
+class UDPResponse(str):
+    """
+    reply received from a game server, along with its round trip time in seconds ('rtt')
+    """
+    rtt = None
+
+
+class UDPMultiplexer(object):
+    """
+    Send queries to many game servers through a single UDP socket.
+    A single thread receives all the replies and dispatches them to the pending queries by source address, and by
+    content for queries given an 'expect' function. Replies nobody is waiting for anymore (late or duplicated ones) are
+    dropped.
+    Queries time out after a delay adapted to the round trip times observed with each game server.
+    """
+    BUFFER_SIZE = 65535
+    RECEIVE_TIMEOUT = 1  # seconds between two checks by the receiving thread that the socket is still in use
+    MULTIPLEXED = True  # many queries are efficiently sent at once
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._socket = None
+        self._receiver = None
+        self._pending = {}  # (ip, port) -> list of UDPQuery
+        self._latencies = {}  # address -> LatencyTracker
+
+    def _get_socket(self):
+        """
+        return the shared socket, creating it (and its receiving thread) if needed. Must be called with the lock held.
+        """
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.settimeout(self.RECEIVE_TIMEOUT)
+            self._receiver = threading.Thread(target=self._receive_loop, args=(self._socket,), name="servermonitor-udp")
+            self._receiver.setDaemon(True)
+            self._receiver.start()
+        return self._socket
+
+    def _receive_loop(self, sock, socket_error=socket.error):
+        # datagrams are received into a single buffer allocated once, then copied out at their actual size.
+        # socket.error is bound as a default argument because module globals are cleared at interpreter shutdown
+        # while this daemon thread may still be waiting for a datagram
+        buf = bytearray(self.BUFFER_SIZE)
+        try:
+            while sock is self._socket:
+                try:
+                    size, source = sock.recvfrom_into(buf)
+                except socket_error:
+                    # timeouts let us notice the socket was closed. On Windows, ICMP port unreachable messages are
+                    # also reported on the next recvfrom call
+                    continue
+                self._dispatch(source, str(buffer(buf, 0, size)))
+        finally:
+            sock.close()
+
+    def _dispatch(self, source, data):
+        received_at = time.time()
+        self._lock.acquire()
+        try:
+            pending = self._pending.get(source, [])
+            queries = [x for x in pending if x.expect is None or x.expect(data)]
+            if len(queries) == len(pending):
+                self._pending.pop(source, None)
+            else:
+                pending[:] = [x for x in pending if x not in queries]
+            responses = []
+            for query in queries:
+                response = UDPResponse(data)
+                if query.sent_at is not None:
+                    response.rtt = received_at - query.sent_at
+                    self._latency(query.address).add(response.rtt)
+                responses.append(response)
+        finally:
+            self._lock.release()
+        for query, response in zip(queries, responses):
+            query.response = response
+            query.answered.set()
+
+    def _latency(self, address):
+        """
+        return the LatencyTracker for the given address. Must be called with the lock held.
+        """
+        if address not in self._latencies:
+            self._latencies[address] = LatencyTracker()
+        return self._latencies[address]
+
+    def close(self):
+        """
+        close the socket once the receiving thread stopped using it
+        """
+        self._lock.acquire()
+        try:
+            sock, self._socket = self._socket, None
+            receiver, self._receiver = self._receiver, None
+            self._pending.clear()
+        finally:
+            self._lock.release()
+        if sock is not None:
+            # wake up the receiving thread rather than waiting for its timeout
+            try:
+                sock.sendto('', ('127.0.0.1', sock.getsockname()[1]))
+            except socket.error:
+                pass
+            receiver.join(self.RECEIVE_TIMEOUT * 2)
+
+    def close_all(self):
+        self.close()
+
+    def query_many(self, addresses, payload, timeout, expect=None):
+        """
+        send the payload to each of the given <host:port> addresses all at once and wait at most 'timeout' seconds
+        (less for game servers known to answer quickly) for their replies. 'payload' can also be a dict of address ->
+        payload to send a different payload to each address. If given, 'expect' is a function telling if a datagram is
+        a reply to this payload, others are ignored.
+        Return a dict of address -> reply. Addresses which did not reply in time are missing from that dict.
+        """
+        queries = []
+        self._lock.acquire()
+        try:
+            sock = self._get_socket()
+            for address in addresses:
+                try:
+                    target = dns_cache.resolve_address(address)
+                except socket.error:
+                    continue
+                query = UDPQuery(address, target, expect)
+                query.timeout = self._latency(address).timeout(timeout)
+                self._pending.setdefault(target, []).append(query)
+                queries.append(query)
+        finally:
+            self._lock.release()
+        for query in queries:
+            try:
+                query.sent_at = time.time()
+                sock.sendto(payload[query.address] if isinstance(payload, dict) else payload, query.target)
+            except socket.error:
+                pass
+        for query in queries:
+            query.answered.wait(max(0, query.sent_at + query.timeout - time.time()))
+        self._lock.acquire()
+        try:
+            for query in queries:
+                pending = self._pending.get(query.target)
+                if pending and query in pending:
+                    pending.remove(query)
+                    if not pending:
+                        del self._pending[query.target]
+        finally:
+            self._lock.release()
+        return dict([(x.address, x.response) for x in queries if x.response is not None])
+
+    def query(self, address, payload, timeout, expect=None):
+        """
+        send the payload to the game server at the given <host:port> address and return its reply.
+        Raise socket.timeout if no reply is received within 'timeout' seconds.
+        """
+        responses = self.query_many([address], payload, timeout, expect)
+        if address not in responses:
+            raise socket.timeout("no reply from %s within %ss" % (address, timeout))
+        return responses[address]
+
+
+udp_multiplexer = UDPMultiplexer()
+frostbite_pool = FrostbiteConnectionPool()
+
+QUAKE3_GETINFO = '\377\377\377\377getinfo\n'
+QUAKE3_GETSTATUS = '\377\377\377\377getstatus\n'
+QUAKE3_TIMEOUT = 3
+
+
+QUAKE3_INFO_RESPONSE = '\377\377\377\377infoResponse\n'
+QUAKE3_STATUS_RESPONSE = '\377\377\377\377statusResponse\n'
+
+
+def quake3_query(command, response_header):
+    """
+    return the payload of a quake3 'command' query carrying a new challenge, and a function telling if a datagram is
+    the reply to that query. Game servers echo the challenge in their reply, which tells late replies to previous
+    queries apart. Replies without challenge, from game servers which do not echo it, only have to be of the right type.
+    """
+    challenge = "%08x" % random.getrandbits(32)
+    echo = "\\challenge\\"
+    def expect(data):
+        if not data.startswith(response_header):
+            return False
+        end = data.find('\n', len(response_header))
+        infostring = data[len(response_header):] if end == -1 else data[len(response_header):end]
+        position = infostring.find(echo)
+        if position == -1:
+            return True
+        return infostring[position + len(echo):].split('\\', 1)[0] == challenge
+    return '\377\377\377\377%s %s\n' % (command, challenge), expect
+
+
+def parse_infostring(infostring):
+    """
+    return a dict from a Quake3 \\key1\\value1\\key2\\value2 info string. Anything before the first backslash is
+    ignored.
+    """
+    tokens = infostring.split('\\')
+    return dict(itertools.izip(itertools.islice(tokens, 1, None, 2), itertools.islice(tokens, 2, None, 2)))
+
+
+class PlayerList(object):
+    """
+    Players of a game server. Scores and pings are kept in arrays of machine integers and names in a list, all three
+    indexed alike.
+    """
+    __slots__ = ('scores', 'pings', 'names')
+
+    def __init__(self):
+        self.scores = array.array('i')
+        self.pings = array.array('H')
+        self.names = []
+
+    def append(self, score, ping, name):
+        self.scores.append(score)
+        self.pings.append(ping)
+        self.names.append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def average_ping(self):
+        """
+        return the average ping of the players, or None if there is no player
+        """
+        if not self.names:
+            return None
+        return sum(self.pings) // len(self.pings)
+
+    def top_player(self):
+        """
+        return the name of the player with the highest score, or None if there is no player
+        """
+        if not self.names:
+            return None
+        return self.names[self.scores.index(max(self.scores))]
+
+
+def parse_status_players(lines):
+    """
+    return a PlayerList from the player lines of a Quake3 statusResponse, each of them looking like: 12 50 "name"
+    Malformed lines are skipped.
+    """
+    players = PlayerList()
+    for line in lines:
+        tokens = line.split(' ', 2)
+        if len(tokens) != 3:
+            continue
+        try:
+            players.append(int(tokens[0]), min(int(tokens[1]), 0xFFFF), tokens[2].strip('"'))
+        except (ValueError, OverflowError):
+            continue
+    return players
+
+
+def quake3_info(address):
+    """
+    return getinfo response from a quake3 based game server.
+    """
+    payload, expect = quake3_query('getinfo', QUAKE3_INFO_RESPONSE)
+    return udp_multiplexer.query(address, payload, QUAKE3_TIMEOUT, expect)
+
+
+def quake3_info_many(addresses):
+    """
+    return a dict of address -> getinfo response from many quake3 based game servers queried all at once.
+    Game servers which did not reply in time are missing from the dict.
+    """
+    payload, expect = quake3_query('getinfo', QUAKE3_INFO_RESPONSE)
+    return udp_multiplexer.query_many(addresses, payload, QUAKE3_TIMEOUT, expect)
+
+
+def quake3_status(address):
+    """
+    return getstatus response from a quake3 based game server.
+    """
+    payload, expect = quake3_query('getstatus', QUAKE3_STATUS_RESPONSE)
+    return udp_multiplexer.query(address, payload, QUAKE3_TIMEOUT, expect)
+
+
+def quake3_status_many(addresses):
+    """
+    return a dict of address -> getstatus response from many quake3 based game servers queried all at once.
+    Game servers which did not reply in time are missing from the dict.
+    """
+    payload, expect = quake3_query('getstatus', QUAKE3_STATUS_RESPONSE)
+    return udp_multiplexer.query_many(addresses, payload, QUAKE3_TIMEOUT, expect)
+
+
+QUAKE3_GETSERVERS = '\377\377\377\377getservers %s full empty\n'
+QUAKE3_GETSERVERS_RESPONSE = '\377\377\377\377getserversResponse'
+QUAKE3_MASTER_TIMEOUT = 3
+QUAKE3_MASTER_ENTRY = struct.Struct('!4sH')
+
+
+def parse_getservers_response(data, addresses):
+    """
+    append to 'addresses' the <ip:port> addresses of a getserversResponse packet (without its header), each encoded
+    as a backslash followed by 4 bytes of IP and 2 bytes of port in network order. Entries are read by position since
+    the IP and port bytes may contain backslashes too.
+    Return True if the packet ends the list (EOT marker), False if more packets are to come.
+    Raise ValueError if the packet is malformed.
+    """
+    i = 0
+    while i < len(data):
+        if data[i] != '\\':
+            raise ValueError("unexpected byte %r at offset %s of getserversResponse" % (data[i], i))
+        entry = data[i + 1:i + 1 + QUAKE3_MASTER_ENTRY.size]
+        # the EOT marker reads as an entry of port 0, which tells it from a game server at 69.79.84.x
+        if entry[:3] in ('EOT', 'EOF') and not entry[3:].strip('\0'):
+            return True
+        if len(entry) < QUAKE3_MASTER_ENTRY.size:
+            raise ValueError("truncated getserversResponse entry %r" % entry)
+        ip, port = QUAKE3_MASTER_ENTRY.unpack(entry)
+        if port and ip != '\0\0\0\0':
+            addresses.append("%s:%s" % (socket.inet_ntoa(ip), port))
+        i += 1 + QUAKE3_MASTER_ENTRY.size
+    return False
+
+
+def quake3_master_servers(address, protocol, timeout=QUAKE3_MASTER_TIMEOUT):
+    """
+    return the <ip:port> addresses of the game servers listed by the quake3 master server at the given <host:port>
+    address for the given protocol version. The list spans many reply packets, which are read until the last one or
+    until no packet comes within 'timeout' seconds, in which case what was received so far is returned.
+    Raise socket.timeout if the master server does not reply at all.
+    """
+    target = dns_cache.resolve_address(address)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(timeout)
+        sock.sendto(QUAKE3_GETSERVERS % protocol, target)
+        addresses = []
+        replied = False
+        deadline = time.time() + timeout * 5
+        while time.time() < deadline:
+            try:
+                data, source = sock.recvfrom(65535)
+            except socket.timeout:
+                if replied:
+                    break
+                raise
+            if source != target or not data.startswith(QUAKE3_GETSERVERS_RESPONSE):
+                continue
+            replied = True
+            if parse_getservers_response(data[len(QUAKE3_GETSERVERS_RESPONSE):], addresses):
+                break
+        # some game servers are listed in many packets
+        seen = set()
+        return [x for x in addresses if not (x in seen or seen.add(x))]
+    finally:
+        sock.close()
+
+
+def query_jobs(servers):
+    """
+    return the list of (job, servers) to run to update the given ServerInfo objects, grouping them by transport.
+    On a transport which multiplexes queries (a single UDP socket, pipelined HTTP requests), game servers of a type
+    which can be queried in batch are updated with a single job. Other game servers get a job each so they can be
+    queried in parallel. Batch jobs come first as they hold a worker for the longest.
+    """
+    batches = []  # list of (transport, server class, servers), in order of first appearance
+    batch_jobs = []
+    single_jobs = []
+    for server in servers:
+        if server.BATCH_UPDATE and getattr(server.TRANSPORT, 'MULTIPLEXED', False):
+            for transport, server_class, batch in batches:
+                if transport is server.TRANSPORT and server_class is server.__class__:
+                    batch.append(server)
+                    break
+            else:
+                batches.append((server.TRANSPORT, server.__class__, [server]))
+        else:
+            single_jobs.append((server.update, [server]))
+    for transport, server_class, batch in batches:
+        if len(batch) > 1:
+            batch_jobs.append((functools.partial(server_class.update_many, batch), batch))
+        else:
+            single_jobs.append((batch[0].update, batch))
+    return batch_jobs + single_jobs
+
+
+A2S_INFO = '\377\377\377\377TSource Engine Query\0'
+A2S_INFO_RESPONSE = '\377\377\377\377I'
+A2S_CHALLENGE_RESPONSE = '\377\377\377\377A'
+A2S_TIMEOUT = 3
+A2S_INFO_FIELDS = struct.Struct('<HBBBccBB')  # appid, players, max_players, bots, server type, environment, visibility, vac
+
+
+def parse_a2s_info(data):
+    """
+    return a dict from the A2S_INFO response of a Source engine game server.
+    Numbers are unpacked in place with struct.unpack_from, strings are read up to their null terminator.
+    Raise ValueError if the response is malformed.
+    """
+    if not data.startswith(A2S_INFO_RESPONSE):
+        raise ValueError("not an A2S_INFO response")
+    offset = len(A2S_INFO_RESPONSE)
+    try:
+        info = {'protocol': struct.unpack_from('<B', data, offset)[0]}
+        offset += 1
+        for key in ('name', 'map', 'folder', 'game'):
+            end = data.index('\0', offset)
+            info[key] = data[offset:end]
+            offset = end + 1
+        (info['appid'], info['players'], info['max_players'], info['bots'], info['server_type'],
+         info['environment'], info['visibility'], info['vac']) = A2S_INFO_FIELDS.unpack_from(data, offset)
+    except (struct.error, ValueError):
+        raise ValueError("truncated A2S_INFO response")
+    return info
+
+
+def a2s_info(address):
+    """
+    return A2S_INFO response from a Source engine game server.
+    Raise socket.timeout if the game server does not reply in time.
+    """
+    responses = a2s_info_many([address])
+    if address not in responses:
+        raise socket.timeout("no reply from %s within %ss" % (address, A2S_TIMEOUT))
+    return responses[address]
+
+
+def a2s_info_many(addresses):
+    """
+    return a dict of address -> A2S_INFO response from many Source engine game servers queried all at once.
+    Game servers which reply with a challenge are queried again with that challenge.
+    Game servers which did not reply in time are missing from the dict.
+    """
+    responses = udp_multiplexer.query_many(addresses, A2S_INFO, A2S_TIMEOUT)
+    challenges = dict([(address, A2S_INFO + response[5:9]) for address, response in responses.items()
+                       if response.startswith(A2S_CHALLENGE_RESPONSE) and len(response) >= 9])
+    if challenges:
+        responses.update(udp_multiplexer.query_many(challenges.keys(), challenges, A2S_TIMEOUT))
+        for address in challenges:
+            if responses[address].startswith(A2S_CHALLENGE_RESPONSE):
+                del responses[address]
+    return responses
+
+
+def update_concurrently(servers, max_workers, deadline):
+    """
+    Update the given ServerInfo objects from a bounded pool of worker threads, running the jobs given by query_jobs.
+    Wait no longer than 'deadline' seconds for all updates to complete.
+    Return the list of servers which did not complete their update in time.
+    """
+    if not servers:
+        return []
+    jobs = Queue.Queue()
+    for job in query_jobs(servers):
+        jobs.put(job)
+    pending = set(servers)
+    pending_lock = threading.Lock()
+    all_done = threading.Event()
+
+    def worker():
+        while True:
+            try:
+                job, batch = jobs.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                job()
+            except Exception, err:
+                batch[0].console.error("Could not update %r. %s" % (batch, err))
+            pending_lock.acquire()
+            try:
+                pending.difference_update(batch)
+                if not pending:
+                    all_done.set()
+            finally:
+                pending_lock.release()
+
+    for i in range(min(max_workers, jobs.qsize())):
+        thread = threading.Thread(target=worker, name="servermonitor-query-%s" % i)
+        thread.setDaemon(True)
+        thread.start()
+    all_done.wait(deadline)
+    pending_lock.acquire()
+    try:
+        return [x for x in servers if x in pending]
+    finally:
+        pending_lock.release()
+
+
+COLOR_CODE = re.compile(r"\^[0-9a-zA-Z]")
+MESSAGE_SEPARATOR = " ^7| "
+
+
+def visible_length(text):
+    """
+    return the number of characters of the given text once displayed in the game chat, without its color codes
+    """
+    return len(COLOR_CODE.sub('', text))
+
+
+def pack_lines(lines, max_length, separator=MESSAGE_SEPARATOR):
+    """
+    return the given lines joined with the separator into as few messages as possible, each at most max_length
+    characters long once displayed. Lines longer than max_length are left alone in their message.
+    If max_length is 0, each line is its own message.
+    """
+    if not max_length:
+        return list(lines)
+    separator_length = visible_length(separator)
+    messages = []
+    message = None
+    message_length = 0
+    for line in lines:
+        line_length = visible_length(line)
+        if message is not None and message_length + separator_length + line_length <= max_length:
+            message += separator + line
+            message_length += separator_length + line_length
+        else:
+            if message is not None:
+                messages.append(message)
+            message = line
+            message_length = line_length
+    if message is not None:
+        messages.append(message)
+    return messages
+
+
+def format_age(seconds):
+    """
+    return a short human readable representation of a duration in seconds
+    """
+    seconds = int(seconds)
+    if seconds < 60:
+        return "%ss" % seconds
+    elif seconds < 3600:
+        return "%sm" % (seconds // 60)
+    elif seconds < 86400:
+        return "%sh" % (seconds // 3600)
+    else:
+        return "%sd" % (seconds // 86400)
+
+
+def format_duration(seconds):
+    """
+    return a duration in seconds as a number of milliseconds
+    """
+    return "%dms" % round(seconds * 1000)
+
+
+class CircuitBreaker(object):
+    """
+    Stop querying a game server which failed to answer many times in a row, checking it again from time to time with
+    an exponential backoff.
+    """
+    FAILURES_THRESHOLD = 3
+    MIN_BACKOFF = 30  # seconds
+    MAX_BACKOFF = 3600  # seconds
+
+    def __init__(self):
+        self.failures = 0
+        self.retry_at = 0
+        self.last_seen = None
+
+    def is_open(self):
+        return self.failures >= self.FAILURES_THRESHOLD
+
+    def allows_query(self):
+        return not self.is_open() or time.time() >= self.retry_at
+
+    def record_success(self):
+        self.failures = 0
+        self.retry_at = 0
+        self.last_seen = time.time()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.is_open():
+            backoff = self.MIN_BACKOFF * 2 ** (self.failures - self.FAILURES_THRESHOLD)
+            self.retry_at = time.time() + min(self.MAX_BACKOFF, backoff)
+
+
+class QueryStats(object):
+    """
+    Counters and latency histogram of the queries sent to a game server, or to all the game servers of a type.
+    Everything recorded is also recorded into the 'parent' QueryStats, if any.
+    """
+    OUTCOMES = ('success', 'timeout', 'parse_error', 'error')
+    BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)  # upper bounds (in seconds) of the latency histogram buckets
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.histogram = [0] * (len(self.BUCKETS) + 1)  # the last bucket counts latencies above the last bound
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, outcome, duration):
+        """
+        record the outcome of a query (one of OUTCOMES) which took 'duration' seconds
+        """
+        self._lock.acquire()
+        try:
+            self.queries += 1
+            self.counts[outcome] += 1
+            self.histogram[bisect.bisect_left(self.BUCKETS, duration)] += 1
+            self.total_time += duration
+            self.max_time = max(self.max_time, duration)
+        finally:
+            self._lock.release()
+        if self.parent is not None:
+            self.parent.record(outcome, duration)
+
+    def percentile(self, p):
+        """
+        return the upper bound of the histogram bucket holding the p-th percentile latency (the max latency if above
+        the last bound), or None if no query was recorded
+        """
+        if not self.queries:
+            return None
+        rank = max(1, int(math.ceil(p / 100.0 * self.queries)))
+        for bound, count in zip(self.BUCKETS, self.histogram):
+            rank -= count
+            if rank <= 0:
+                return bound
+        return self.max_time
+
+    def summary(self):
+        if not self.queries:
+            return "no query"
+        return "%s queries, %s ok, %s timeouts, %s parse errors, %s errors, p50 %s, p95 %s, max %s" % (
+            self.queries, self.counts['success'], self.counts['timeout'], self.counts['parse_error'],
+            self.counts['error'], format_duration(self.percentile(50)), format_duration(self.percentile(95)),
+            format_duration(self.max_time))
+
+    def as_dict(self):
+        self._lock.acquire()
+        try:
+            data = dict(self.counts)
+            data['queries'] = self.queries
+            data['total_time'] = self.total_time
+            data['max_time'] = self.max_time
+            data['histogram'] = dict(zip([str(x) for x in self.BUCKETS] + ['inf'], self.histogram))
+        finally:
+            self._lock.release()
+        data['p50'] = self.percentile(50)
+        data['p95'] = self.percentile(95)
+        data['p99'] = self.percentile(99)
+        return data
+
+
+class ServerStatus(object):
+    """
+    Normalized status of a game server as produced by all ServerInfo backends, whatever the game.
+    Fields a type of game server cannot provide are None. 'ping' is the round trip time in milliseconds when measured,
+    'avg_ping' the average ping of the players, 'timestamp' the time the status was received at.
+    """
+    __slots__ = ('address', 'name', 'map', 'gamemode', 'players', 'max_players', 'ping', 'avg_ping', 'top_player',
+                 'timestamp')
+
+    def __init__(self, address, name=None, map=None, gamemode=None, players=None, max_players=None, ping=None,
+                 avg_ping=None, top_player=None, timestamp=None):
+        self.address = address
+        self.name = name
+        self.map = map
+        self.gamemode = gamemode
+        self.players = to_int(players)
+        self.max_players = to_int(max_players)
+        self.ping = ping
+        self.avg_ping = avg_ping
+        self.top_player = top_player
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ', '.join(["%s=%r" % (x, getattr(self, x)) for x in self.__slots__]))
+
+
+class PlayerCountHistory(object):
+    """
+    Fixed size ring of (time, players, max_players, up) samples of a game server, stored in a memory-mapped file so that
+    recording a sample costs the same whatever the size of the history and the history survives restarts. Without a
+    file, the samples are only kept in memory.
+    The file is made of a header (magic, capacity, index of the next sample, number of samples) followed by 'capacity'
+    samples. Unknown player counts are stored as -1.
+    """
+    MAGIC = 'SMH1'
+    HEADER = struct.Struct('<4sIII')
+    SAMPLE = struct.Struct('<Ihhb')
+    CAPACITY = 10080  # a week of samples taken every minute
+
+    def __init__(self, path=None, capacity=CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._next = 0
+        self._count = 0
+        size = self.HEADER.size + capacity * self.SAMPLE.size
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+        else:
+            f = open(path, 'r+b' if os.path.isfile(path) else 'w+b')
+            try:
+                f.seek(0, os.SEEK_END)
+                if f.tell() != size:
+                    f.truncate(size)
+                self._map = mmap.mmap(f.fileno(), size)
+            finally:
+                f.close()
+            magic, file_capacity, next_index, count = self.HEADER.unpack_from(self._map)
+            if magic == self.MAGIC and file_capacity == capacity and next_index < capacity and count <= capacity:
+                self._next = next_index
+                self._count = count
+        self._write_header()
+
+    def __len__(self):
+        return self._count
+
+    def _write_header(self):
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.capacity, self._next, self._count)
+
+    def record(self, timestamp, players, max_players, up):
+        """
+        add a sample, overwriting the oldest one when the history is full. Samples added once closed are ignored.
+        """
+        self._lock.acquire()
+        try:
+            if self._map is None:
+                return
+            self.SAMPLE.pack_into(self._map, self.HEADER.size + self._next * self.SAMPLE.size, int(timestamp),
+                                  clamp_player_count(players), clamp_player_count(max_players), 1 if up else 0)
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._write_header()
+        finally:
+            self._lock.release()
+
+    def samples(self):
+        """
+        return the (time, players, max_players, up) samples, most recent first
+        """
+        self._lock.acquire()
+        try:
+            samples = []
+            if self._map is None:
+                return samples
+            for i in xrange(self._count):
+                index = (self._next - 1 - i) % self.capacity
+                timestamp, players, max_players, up = self.SAMPLE.unpack_from(
+                    self._map, self.HEADER.size + index * self.SAMPLE.size)
+                samples.append((timestamp, None if players < 0 else players,
+                                None if max_players < 0 else max_players, bool(up)))
+            return samples
+        finally:
+            self._lock.release()
+
+    def summary(self, since):
+        """
+        return the min, average and max number of players while the game server was up and the share of samples it was
+        up in, over the samples taken after the time 'since'. Return None if there is no such sample. Player counts are
+        None if the game server was never up.
+        """
+        players = array.array('i')
+        samples = up = 0
+        for timestamp, count, max_players, is_up in self.samples():
+            if timestamp < since:
+                break
+            samples += 1
+            if is_up:
+                up += 1
+                if count is not None:
+                    players.append(count)
+        if not samples:
+            return None
+        if not players:
+            return None, None, None, float(up) / samples
+        return min(players), float(sum(players)) / len(players), max(players), float(up) / samples
+
+    def flush(self):
+        """
+        write the samples to the file
+        """
+        if self.path is not None and self._map is not None:
+            self._map.flush()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self.flush()
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        finally:
+            self._lock.release()
+
+
+def clamp_player_count(value):
+    if value is None:
+        return -1
+    return max(-1, min(value, 0x7FFF))
+
+
+def parse_duration(text):
+    """
+    return the number of seconds of a duration such as '90s', '30m', '1h', '1d' or '1w'
     """
-    def __init__(self, console, host, port):
-        self.console = console
-        self._host = host
-        self._port = port
-        self._password = None
-        self._connect()
+    match = re.match(r"^\s*(\d+)\s*([smhdw])\s*$", text.lower())
+    if not match or not int(match.group(1)):
+        raise ValueError("invalid duration %r" % text)
+    return int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}[match.group(2)]
 
 
-def http_get(url):
+def latin1_strings(value):
     """
-    return the document served by a web server at a given url
+    return the given value read from JSON with its unicode strings encoded back to latin-1
     """
-    req =  urllib2.Request(url, None)
-    req.add_header('User-Agent', USER_AGENT)
-    req.add_header('Accept-encoding', 'gzip')
-    opener = urllib2.build_opener()
-    webFile = opener.open(req)
-    result = webFile.read()
-    webFile.close()
-    if webFile.headers.get('content-encoding', '') == 'gzip':
-        result = StringIO.StringIO(result)
-        gzipper = gzip.GzipFile(fileobj=result)
-        result = gzipper.read()
-    return result
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    elif isinstance(value, dict):
+        return dict([(latin1_strings(k), latin1_strings(v)) for k, v in value.items()])
+    elif isinstance(value, list):
+        return [latin1_strings(x) for x in value]
+    return value
 
 
-def quake3_info(address):
+def write_json_file(path, document, **kwargs):
     """
-    return getstatus response from a quake3 based game server.
+    write the document as JSON to the file at 'path'. The JSON is written to a temporary file first, then renamed into
+    place so that the file never holds a partial document. Keyword arguments are given to json.dump.
     """
-    host = (address.split(':')[0], int(address.split(':')[1]))
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(3)
-    sock.connect(host)
-    sock.send('\377\377\377\377%s\n' % 'getinfo')
-    return sock.recv(1024)
+    temp_path = path + '.tmp'
+    f = open(temp_path, 'w')
+    try:
+        json.dump(document, f, **kwargs)
+    finally:
+        f.close()
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # on Windows, rename does not replace an existing file
+        os.remove(path)
+        os.rename(temp_path, path)
+
+
+def to_int(value):
+    """
+    return the given value as an int, or None if it cannot be converted
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdvertisementTemplate(object):
+    """
+    Advertisement format compiled once into a format string of positional fields, rendered from the attributes of a
+    ServerStatus. Templates are shared by all the game servers advertised with the same format, see compile().
+    'keywords' are the keywords the format refers to, in order of appearance. Keywords the game server cannot provide
+    (None attributes) are rendered as '?'.
+    """
+    KEYWORDS = ('address', 'map', 'players', 'max_players', 'name', 'gamemode', 'avg_ping', 'top_player')
+    MISSING = "?"
+    _templates = {}
+
+    @classmethod
+    def compile(cls, format):
+        """
+        return the template of the given advertisement format, compiling it only the first time
+        """
+        template = cls._templates.get(format)
+        if template is None:
+            template = cls._templates.setdefault(format, cls(format))
+        return template
+
+    def __init__(self, format):
+        """
+        raise KeyError for unknown keywords and ValueError for invalid formats
+        """
+        self.format = format
+        keywords = []
+        positional = []
+        for literal, field_name, spec, conversion in string.Formatter().parse(format):
+            positional.append(literal.replace('{', '{{').replace('}', '}}'))
+            if field_name is None:
+                continue
+            keyword = field_name._formatter_field_name_split()[0]
+            if keyword not in self.KEYWORDS:
+                raise KeyError(keyword)
+            if '{' in spec:
+                raise ValueError("nested fields are not supported")
+            if keyword not in keywords:
+                keywords.append(keyword)
+            positional.append("{%s%s%s%s}" % (keywords.index(keyword), field_name[len(keyword):],
+                                               "!" + conversion if conversion else "", ":" + spec if spec else ""))
+        if 'address' not in keywords:
+            raise ValueError, "missing mandatory keyword {address}"
+        self.keywords = tuple(keywords)
+        self._positional = ''.join(positional)
+        self.render_values((self.MISSING,) * len(self.keywords))
+
+    def values(self, status):
+        """
+        return the tuple of the values of the keywords for the given ServerStatus
+        """
+        values = []
+        for keyword in self.keywords:
+            value = getattr(status, keyword)
+            values.append(self.MISSING if value is None else value)
+        return tuple(values)
+
+    def render_values(self, values):
+        return self._positional.format(*values)
+
+    def render(self, status):
+        return self.render_values(self.values(status))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.format)
+
+
+backends = []  # ServerInfo subclasses which can be loaded from the config, in loading order
+backend_stats = {}  # ServerInfo subclass name -> QueryStats of all its game servers
+
+
+def register_backend(server_info_class):
+    """
+    class decorator registering a ServerInfo subclass so game servers of that type can be loaded from the config
+    """
+    if server_info_class not in backends:
+        backends.append(server_info_class)
+    return server_info_class
+
+
+def backend_name(server_info_class):
+    """
+    return the name of a type of game server, as displayed in the statistics
+    """
+    name = server_info_class.__name__
+    if name.endswith('ServerInfo') and name != 'ServerInfo':
+        name = name[:-len('ServerInfo')]
+    return name
 
 
 class ServerInfo(object):
     """
     ServerInfo abstract base class.
-    Subclasses must implement the update method which must fill in the 'info' property.
+    Subclasses must implement the _update method which must fill in the 'info' property.
+    Subclasses able to query many game servers at once should set BATCH_UPDATE and override _update_many.
+    Subclasses registered with register_backend are loaded from the config option CONFIG_KEY of the 'servers' section
+    which lists addresses matching ADDRESS_PATTERN. TRANSPORT is the object (a connection pool, the UDP multiplexer)
+    the game servers are queried through. The host names of their addresses are resolved through dns_cache.
     """
+    BATCH_UPDATE = False
+    HISTORY_SIZE = 10  # number of recent ServerStatus kept per game server
+    CONFIG_KEY = None
+    ADDRESS_PATTERN = r"\S+:\d+"
+    TRANSPORT = None
 
     @staticmethod
     def validate_advertisement_format(format):
-        format.format(address=None, map=None, players=None, max_players=None, name=None)
-        if '{address}' not in format:
-            raise ValueError, "missing mandatory keyword {address}"
+        AdvertisementTemplate.compile(format)
 
-    def __init__(self, console, address, msg_format):
+    def __init__(self, console, address, msg_format, cache_ttl=0, advertised_only=False):
         self.console = console
         self.address = address
-        self.msg_format = msg_format
+        if isinstance(msg_format, AdvertisementTemplate):
+            self.template = msg_format
+        else:
+            self.template = AdvertisementTemplate.compile(msg_format)
+        self.msg_format = self.template.format
+        self.format_keywords = self.template.keywords
+        self.cache_ttl = cache_ttl
+        self.advertised_only = advertised_only  # when True, player statistics not advertised are not computed
         self.info = None
         self._data = None
+        self.status = None  # last known ServerStatus
+        self.history = collections.deque(maxlen=self.HISTORY_SIZE)  # recent ServerStatus, oldest first
+        self.last_update = None
+        self.breaker = CircuitBreaker()
+        self.listeners = []
+        self._fingerprint = None
+        self._rendered = None
+        self._update_lock = threading.Lock()
+        self._update_in_flight = None
+        self.stats = QueryStats(parent=self.backend_stats())
+        self._failure = None  # kind of failure of the last query, one of QueryStats.OUTCOMES
+        self._response_time = None  # response time of the last query, when known better than the update duration
+        self.player_history = None  # PlayerCountHistory the outcome of each query is recorded to
+        self.restored = False  # True while the info comes from a snapshot and the game server was not queried yet
 
     @property
     def data(self):
         return self._data
 
+    @property
+    def age(self):
+        """
+        number of seconds since the last update or None if never updated
+        """
+        if self.last_update is None:
+            return None
+        return time.time() - self.last_update
+
+    def is_fresh(self):
+        """
+        tell if the info is recent enough to be advertised without querying the game server again
+        """
+        return not self.restored and self.last_update is not None and self.age < self.cache_ttl
+
     def update(self):
         """
-        Query some service to get up to date info about the game server
+        Query some service to get up to date info about the game server.
+        Nothing is done if the info is not older than cache_ttl seconds. If a query is already in flight, wait for it
+        to complete instead of sending another one.
+        Game servers which failed to answer many times in a row are not queried until their circuit breaker allows it.
+        """
+        if self._start_update():
+            try:
+                if self.breaker.allows_query():
+                    self._begin_query()
+                    started = time.time()
+                    self._update()
+                    self._check_health(time.time() - started)
+                else:
+                    self.info = self._down_info()
+            finally:
+                self._end_update()
+        else:
+            self._wait_update()
+
+    def snapshot(self):
+        """
+        return the last known status of the game server as a dict which can be saved as JSON and given to restore()
+        """
+        return {
+            'backend': backend_name(self.__class__),
+            'address': self.address,
+            'info': self.info,
+            'last_update': self.last_update,
+            'status': None if self.status is None else dict([(x, getattr(self.status, x)) for x in ServerStatus.__slots__
+                                                              if x != 'address']),
+        }
+
+    def restore(self, snapshot):
+        """
+        advertise the last known status from a snapshot made by snapshot() until the game server is queried again
+        """
+        self.info = snapshot['info']
+        self.last_update = snapshot['last_update']
+        if snapshot['status']:
+            self.status = ServerStatus(self.address, **dict([(str(k), v) for k, v in snapshot['status'].items()
+                                                             if k in ServerStatus.__slots__ and k != 'address']))
+            self.history.append(self.status)
+        self.restored = True
+
+    def add_listener(self, listener):
+        """
+        register a function to call with (server, changes) each time the advertised fields of the game server change.
+        'changes' is a dict of keyword -> (old value, new value) for each advertised field which changed. All new values
+        are None when the game server stops answering.
+        """
+        self.listeners.append(listener)
+
+    def _on_failure(self, info=None):
+        """
+        forget the data of the game server once its query failed and advertise 'info' instead. Until then, the
+        previous info is still advertised while the query is in flight.
+        """
+        self._data = None
+        self.info = info
+
+    def _set_status(self, **fields):
+        """
+        record a new ServerStatus made of the given fields as the last known status of the game server
+        """
+        if self._response_time is not None:
+            fields.setdefault('ping', int(round(self._response_time * 1000)))
+        status = ServerStatus(self.address, **fields)
+        self.status = status
+        self.history.append(status)
+        return status
+
+    def _render(self, status):
+        """
+        set the 'info' property from the given ServerStatus.
+        The advertisement is formatted again only if the fields it uses changed since the last update.
+        """
+        fingerprint = self.template.values(status)
+        if fingerprint != self._fingerprint or self._rendered is None:
+            self._rendered = self.template.render_values(fingerprint)
+            self._set_fingerprint(fingerprint)
+        self.info = self._rendered
+
+    def _set_fingerprint(self, fingerprint):
+        old_fingerprint, self._fingerprint = self._fingerprint, fingerprint
+        if fingerprint == old_fingerprint or not self.listeners:
+            return
+        old_values = old_fingerprint or (None,) * len(self.format_keywords)
+        new_values = fingerprint or (None,) * len(self.format_keywords)
+        changes = dict([(k, (old, new)) for k, old, new in zip(self.format_keywords, old_values, new_values)
+                        if old != new])
+        for listener in self.listeners:
+            try:
+                listener(self, changes)
+            except Exception, err:
+                self.console.error("Could not notify %r changes to %r. %s" % (self, listener, err))
+
+    @classmethod
+    def config_kwargs(cls, plugin):
+        """
+        return the keyword arguments to create game servers of this type with, from the settings of the plugin. Each
+        of them is kept in the attribute of the same name.
+        """
+        return {}
+
+    @classmethod
+    def backend_stats(cls):
+        """
+        return the QueryStats of all game servers of this type
+        """
+        return backend_stats.setdefault(cls.__name__, QueryStats())
+
+    def _begin_query(self):
+        self._failure = None
+        self._response_time = None
+
+    def _check_health(self, elapsed):
+        """
+        feed the circuit breaker and the query statistics with the outcome of the last query, which took 'elapsed'
+        seconds
+        """
+        if self.data:
+            outcome = 'success'
+        else:
+            outcome = self._failure or 'error'
+        self.stats.record(outcome, elapsed if self._response_time is None else self._response_time)
+        self._record_player_count()
+        if self.data:
+            self.breaker.record_success()
+        else:
+            self._set_fingerprint(None)
+            self.breaker.record_failure()
+            if self.breaker.is_open():
+                self.info = self._down_info()
+                self.console.info("%r failed %s times in a row, next query in %ss" % (
+                    self, self.breaker.failures, int(self.breaker.retry_at - time.time())))
+
+    def _record_player_count(self):
+        history = self.player_history
+        if history is None:
+            return
+        if self.data and self.status is not None:
+            history.record(self.status.timestamp, self.status.players, self.status.max_players, True)
+        else:
+            history.record(time.time(), None, None, False)
+
+    def _down_info(self):
+        if self.breaker.last_seen is None:
+            return "%s : down" % self.address
+        return "%s : down (last seen %s ago)" % (self.address, format_age(time.time() - self.breaker.last_seen))
+
+    def _start_update(self):
+        """
+        return True if the caller has to query the game server, in which case it must call _end_update once done.
         """
+        self._update_lock.acquire()
+        try:
+            if self._update_in_flight is not None or self.is_fresh():
+                return False
+            self._update_in_flight = threading.Event()
+            return True
+        finally:
+            self._update_lock.release()
+
+    def _end_update(self):
+        self._update_lock.acquire()
+        try:
+            self.last_update = time.time()
+            self.restored = False
+            in_flight, self._update_in_flight = self._update_in_flight, None
+        finally:
+            self._update_lock.release()
+        in_flight.set()
+
+    def _wait_update(self):
+        in_flight = self._update_in_flight
+        if in_flight is not None:
+            in_flight.wait()
+
+    def _update(self):
         raise NotImplemented
 
+    @classmethod
+    def update_many(cls, servers):
+        """
+        Update many game servers at once
+        """
+        claimed = []
+        in_flight = []
+        for server in servers:
+            if server._start_update():
+                claimed.append(server)
+            else:
+                in_flight.append(server)
+        if claimed:
+            try:
+                queried = []
+                for server in claimed:
+                    if server.breaker.allows_query():
+                        queried.append(server)
+                    else:
+                        server.info = server._down_info()
+                if queried:
+                    for server in queried:
+                        server._begin_query()
+                    started = time.time()
+                    cls._update_many(queried)
+                    elapsed = time.time() - started
+                    for server in queried:
+                        server._check_health(elapsed)
+            finally:
+                for server in claimed:
+                    server._end_update()
+        for server in in_flight:
+            server._wait_update()
+
+    @classmethod
+    def _update_many(cls, servers):
+        for server in servers:
+            server._update()
+
     def __str__(self):
         if not self.info:
             return "%s : unknown" % self.address
@@ -118,10 +1800,16 @@ class ServerInfo(object):
         return "%s(%r)" % (self.__class__.__name__, self.address)
 
 
+@register_backend
 class GamemonitorServerInfo(ServerInfo):
     """
     ServerInfo subclass which reads the status of game servers querying the webservice at www.game-monitor.com.
     """
+    BATCH_UPDATE = True
+    CONFIG_KEY = 'game-monitor.com'
+    ADDRESS_PATTERN = r"(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9]):\d+"
+    TRANSPORT = http_pool
+    URL = "http://module.game-monitor.com/%s/data/server.js"
 
     @ServerInfo.data.setter
     def data(self, value):
@@ -130,10 +1818,12 @@ class GamemonitorServerInfo(ServerInfo):
                 json_data = json.loads(value[1:], encoding='UTF-8')
             except Exception, err:
                 self.console.error("Could not decode info from game-monitor.com. %s \"\"\"%s\"\"\"" % (err.message, value))
+                self._failure = 'parse_error'
                 self._data = None
             else:
                 if not "error" in json_data:
                     self.console.error("Unexpected json data from game-monitor.com. %r" % json_data)
+                    self._failure = 'parse_error'
                     self._data = None
                 elif json_data.get('error') != 0:
                     self.console.error("Unexpected error from game-monitor.com. %r" % json_data)
@@ -143,123 +1833,530 @@ class GamemonitorServerInfo(ServerInfo):
                     self.console.debug("data: %r" % self._data)
         else:
             self.console.error("Unexpected info from game-monitor.com. \"\"\"%s\"\"\"" % value)
+            self._failure = 'parse_error'
             self._data = None
 
-    def update(self):
+    def __init__(self, *args, **kwargs):
+        ServerInfo.__init__(self, *args, **kwargs)
+        self.validators = {}  # etag/last_modified of the last document downloaded
+
+    @property
+    def url(self):
+        return self.URL % self.address
+
+    def _update(self):
+        self.console.info("Updating info for %r" % self)
+        self.console.debug("Downloading json from %s" % self.url)
+        try:
+            raw_data = http_get(self.url, **self.validators)
+        except Exception, err:
+            self._on_error(err)
+        else:
+            self._on_response(raw_data)
+
+    def _on_error(self, err):
+        if isinstance(err, urllib2.HTTPError) and err.code == 304:
+            self.console.debug("no change since last update")
+            return
+        if isinstance(err, socket.timeout) or isinstance(getattr(err, 'reason', None), socket.timeout):
+            self._failure = 'timeout'
+        self.console.error(err)
+        self._on_failure()
+        self.validators = {}
+
+    def _on_response(self, raw_data):
+        self.data = raw_data
+        if self.data:
+            self.validators = {}
+            if getattr(raw_data, 'etag', None):
+                self.validators['etag'] = raw_data.etag
+            if getattr(raw_data, 'last_modified', None):
+                self.validators['last_modified'] = raw_data.last_modified
+            self._render(self._set_status(
+                name=self.data.get("name"),
+                map="",  # sadly no map info is provided by game-monitor.com
+                players=self.data.get("player"),
+                max_players=self.data.get("maxplayer")
+            ))
+        else:
+            self.info = None
+            self.validators = {}
+
+    @classmethod
+    def _update_many(cls, servers):
+        """
+        Download the documents of many game servers at once from game-monitor.com over a single connection
+        """
+        for server in servers:
+            server.console.info("Updating info for %r" % server)
+        results = http_get_many([(x.url, x.validators) for x in servers])
+        for server, result in zip(servers, results):
+            if isinstance(result, Exception):
+                server._on_error(result)
+            else:
+                server._on_response(result)
+
+
+@register_backend
+class Quake3ServerInfo(ServerInfo):
+    """
+    ServerInfo subclass which is able to query directly the status of game servers based on the Quake3 engine.
+    With the 'getstatus' query, the player list is also retrieved which provides the {avg_ping} and {top_player}
+    keywords.
+    """
+    BATCH_UPDATE = True
+    CONFIG_KEY = 'quake3 server'
+    TRANSPORT = udp_multiplexer
+    QUERIES = ('getinfo', 'getstatus')
+
+    @classmethod
+    def config_kwargs(cls, plugin):
+        return {'query': plugin.quake3_query}
+
+    def __init__(self, *args, **kwargs):
+        self.query = kwargs.pop('query', 'getinfo')
+        if self.query not in self.QUERIES:
+            raise ValueError("unknown quake3 query %r" % self.query)
+        ServerInfo.__init__(self, *args, **kwargs)
+        self.players = None
+
+    @ServerInfo.data.setter
+    def data(self, value):
+        self.players = None
+        if value.startswith(QUAKE3_INFO_RESPONSE):
+            self._data = parse_infostring(value)
+            self.console.debug("data: %r" % self._data)
+        elif value.startswith(QUAKE3_STATUS_RESPONSE):
+            lines = value[len(QUAKE3_STATUS_RESPONSE):].split('\n')
+            self._data = parse_infostring(lines[0])
+            self.players = parse_status_players(lines[1:])
+            self.console.debug("data: %r, %s players" % (self._data, len(self.players)))
+        else:
+            self.console.error("Unexpected response from quake3 server %s. %r" % (self.address, value))
+            self._failure = 'parse_error'
+            self._data = None
+
+    def _update(self):
         self.console.info("Updating info for %r" % self)
-        url = "http://module.game-monitor.com/%s/data/server.js" % self.address
-        self.console.debug("Downloading json from %s" % url)
-        self._data = None
-        self.info = None
         try:
-            raw_data = http_get(url)
-        except urllib2.HTTPError, err:
-            if err.code == 304:
-                self.console.debug("no change since last update")
+            if self.query == 'getstatus':
+                raw_data = quake3_status(self.address)
+            else:
+                raw_data = quake3_info(self.address)
+        except socket.timeout:
+            self._failure = 'timeout'
+            self._on_failure("%s : down" % self.address)
+        except Exception, err:
+            self.console.error(err)
+            self._on_failure()
+        else:
+            self._on_response(raw_data)
+
+    def _on_response(self, raw_data):
+        self.console.verbose(repr(raw_data))
+        self._response_time = getattr(raw_data, 'rtt', None)
+        self.data = raw_data
+        if self.data is None:
+            self.info = None
+            return
+        if self.players is None:
+            self._render(self._set_status(
+                name=self.data.get("hostname"),
+                map=self.data.get("mapname"),
+                players=self.data.get("clients"),
+                max_players=self.data.get("sv_maxclients")
+            ))
+        else:
+            keywords = self.format_keywords if self.advertised_only else AdvertisementTemplate.KEYWORDS
+            self._render(self._set_status(
+                name=self.data.get("sv_hostname"),
+                map=self.data.get("mapname"),
+                players=len(self.players),
+                max_players=self.data.get("sv_maxclients"),
+                avg_ping=self.players.average_ping() if 'avg_ping' in keywords else None,
+                top_player=self.players.top_player() if 'top_player' in keywords else None
+            ))
+
+    @classmethod
+    def _update_many(cls, servers):
+        """
+        Query many Quake3 game servers with a single burst of getinfo (or getstatus) packets
+        """
+        for server in servers:
+            server.console.info("Updating info for %r" % server)
+        responses = {}
+        for query, query_many in (('getinfo', quake3_info_many), ('getstatus', quake3_status_many)):
+            addresses = [x.address for x in servers if x.query == query]
+            if not addresses:
+                continue
+            try:
+                responses.update(query_many(addresses))
+            except Exception, err:
+                servers[0].console.error(err)
+        for server in servers:
+            if server.address in responses:
+                server._on_response(responses[server.address])
             else:
-                self.console.error(err)
+                server._failure = 'timeout'
+                server._on_failure("%s : down" % server.address)
+
+
+class FrostbiteServerStatus(object):
+    """
+    Status of a Frostbite game server, as decoded from its serverInfo response.
+    Fields can also be read like the keys of a dict. Fields the game server did not send are None.
+    """
+    FIELDS = ('address', 'name', 'players', 'max_players', 'gamemode', 'map', 'roundsPlayed', 'roundsTotal',
+              'numTeams', 'team1score', 'team2score', 'team3score', 'team4score', 'targetScore', 'onlineState',
+              'isRanked', 'hasPunkbuster', 'hasPassword', 'serverUptime', 'roundTime', 'gameIpAndPort',
+              'punkBusterVersion', 'joinQueueEnabled', 'region', 'closestPingSite', 'country', 'matchMakingEnabled',
+              'blazePlayerCount', 'blazeGameState')
+    __slots__ = FIELDS
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key, None)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key, None)
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def items(self):
+        return [(x, getattr(self, x, None)) for x in self.FIELDS]
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ', '.join(
+            ["%s=%r" % (x, getattr(self, x)) for x in self.FIELDS if hasattr(self, x)]))
+
+
+class FrostbiteServerInfoDecoder(object):
+    """
+    Decode the words of the serverInfo response of a Frostbite game server into a FrostbiteServerStatus.
+    The words come in the same order for all Frostbite games: HEAD_FIELDS, then as many team scores as told by the
+    numTeams word, then the fields listed in 'tail_fields' which depend on the game.
+    Map and gamemode ids are translated with the given lookup tables.
+    """
+    HEAD_FIELDS = ('name', 'players', 'max_players', 'gamemode', 'map', 'roundsPlayed', 'roundsTotal', 'numTeams')
+    TEAM_SCORE_FIELDS = ('team1score', 'team2score', 'team3score', 'team4score')
+
+    def __init__(self, tail_fields, map_names, gamemode_names):
+        self.tail_fields = tail_fields
+        self.map_names = dict([(k.lower(), v) for k, v in map_names.items()])  # map ids case vary across games
+        self.gamemode_names = gamemode_names
+
+    def decode(self, words):
+        """
+        return a FrostbiteServerStatus from the words of a serverInfo response. Raise ValueError if malformed.
+        """
+        if not isinstance(words, (list, tuple)) or len(words) < len(self.HEAD_FIELDS) + 1:
+            raise ValueError("truncated serverInfo response %r" % (words,))
+        status = FrostbiteServerStatus()
+        for field, word in itertools.izip(self.HEAD_FIELDS, words):
+            setattr(status, field, word)
+        status.map = self.map_names.get(status.map.lower(), status.map)
+        status.gamemode = self.gamemode_names.get(status.gamemode, status.gamemode)
+        num_teams = int(status.numTeams) if status.numTeams else 0
+        if not 0 <= num_teams <= len(self.TEAM_SCORE_FIELDS):
+            raise ValueError("unexpected number of teams %r" % status.numTeams)
+        offset = len(self.HEAD_FIELDS)
+        for field, word in itertools.izip(self.TEAM_SCORE_FIELDS, itertools.islice(words, offset, offset + num_teams)):
+            setattr(status, field, word)
+        for field, word in itertools.izip(self.tail_fields, itertools.islice(words, offset + num_teams, None)):
+            setattr(status, field, word)
+        return status
+
+
+FROSTBITE2_TAIL_FIELDS = ('targetScore', 'onlineState', 'isRanked', 'hasPunkbuster', 'hasPassword', 'serverUptime',
+                          'roundTime', 'gameIpAndPort', 'punkBusterVersion', 'joinQueueEnabled', 'region',
+                          'closestPingSite', 'country')
+FROSTBITE3_TAIL_FIELDS = FROSTBITE2_TAIL_FIELDS + ('matchMakingEnabled', 'blazePlayerCount', 'blazeGameState')
+
+
+class FrostbiteServerInfo(ServerInfo):
+    """
+    ServerInfo base class for game servers based on the Frostbite engine, queried directly through their RCON port.
+    Subclasses set DECODER to the FrostbiteServerInfoDecoder suitable for their game.
+    """
+    TRANSPORT = frostbite_pool
+    DECODER = None
+
+    def frostbite_info(self):
+        """
+        return serverInfo response from a frostbite game server.
+        """
+        return frostbite_pool.send_request(self.console, self.address, 'serverInfo')[1:]
+
+    @ServerInfo.data.setter
+    def data(self, value):
+        try:
+            self._data = self.DECODER.decode(value)
+        except Exception, err:
+            self.console.error(err)
+            self._failure = 'parse_error'
+            self._data = None
+        else:
+            self._data.address = self.address
+        self.console.verbose(repr(self._data))
+
+    def _update(self):
+        self.console.info("Updating info for %r" % self)
+        try:
+            raw_data = self.frostbite_info()
+        except socket.timeout:
+            self._failure = 'timeout'
+            self._on_failure("%s : down" % self.address)
         except Exception, err:
             self.console.error(err)
+            self._on_failure()
         else:
+            self.console.verbose(repr(raw_data))
             self.data = raw_data
             if self.data:
-                self.info = self.msg_format.format(
-                    address=self.address,
-                    map="", # sadly no map info is provided by game-monitor.com
-                    players=self.data.get("player", "?"),
-                    max_players=self.data.get("maxplayer", "?"),
-                    name=self.data.get("name", "?")
-                )
+                self._render(self._set_status(name=self.data.name, map=self.data.map, gamemode=self.data.gamemode,
+                                              players=self.data.players, max_players=self.data.max_players))
+            else:
+                self.info = None
+
+
+@register_backend
+class BF3ServerInfo(FrostbiteServerInfo):
+    """
+    ServerInfo subclass which is able to query directly the status of BF3 game servers.
+    """
+    CONFIG_KEY = 'BF3 server'
+    DECODER = FrostbiteServerInfoDecoder(FROSTBITE2_TAIL_FIELDS, bf3_MAP_NAME_BY_ID, bf3_GAME_MODES_NAMES)
+
+
+@register_backend
+class BF4ServerInfo(FrostbiteServerInfo):
+    """
+    ServerInfo subclass which is able to query directly the status of BF4 game servers.
+    """
+    CONFIG_KEY = 'BF4 server'
+    DECODER = FrostbiteServerInfoDecoder(FROSTBITE3_TAIL_FIELDS, bf4_MAP_NAME_BY_ID, bf4_GAME_MODES_NAMES)
+
+
+@register_backend
+class BFHServerInfo(FrostbiteServerInfo):
+    """
+    ServerInfo subclass which is able to query directly the status of Battlefield Hardline game servers.
+    """
+    CONFIG_KEY = 'BFH server'
+    DECODER = FrostbiteServerInfoDecoder(FROSTBITE3_TAIL_FIELDS, bfh_MAP_NAME_BY_ID, bfh_GAME_MODES_NAMES)
+
+
+@register_backend
+class SourceServerInfo(ServerInfo):
+    """
+    ServerInfo subclass which is able to query directly the status of game servers based on the Source engine
+    (Counter-Strike, Team Fortress 2, ...) with A2S_INFO queries.
+    """
+    BATCH_UPDATE = True
+    CONFIG_KEY = 'source server'
+    TRANSPORT = udp_multiplexer
+
+    @ServerInfo.data.setter
+    def data(self, value):
+        try:
+            self._data = parse_a2s_info(value)
+        except ValueError, err:
+            self.console.error("Unexpected response from source server %s. %s. %r" % (self.address, err, value))
+            self._failure = 'parse_error'
+            self._data = None
+        else:
+            self.console.debug("data: %r" % self._data)
+
+    def _update(self):
+        self.console.info("Updating info for %r" % self)
+        try:
+            raw_data = a2s_info(self.address)
+        except socket.timeout:
+            self._failure = 'timeout'
+            self._on_failure("%s : down" % self.address)
+        except Exception, err:
+            self.console.error(err)
+            self._on_failure()
+        else:
+            self._on_response(raw_data)
+
+    def _on_response(self, raw_data):
+        self.console.verbose(repr(raw_data))
+        self._response_time = getattr(raw_data, 'rtt', None)
+        self.data = raw_data
+        if self.data:
+            self._render(self._set_status(name=self.data['name'], map=self.data['map'], players=self.data['players'],
+                                          max_players=self.data['max_players']))
+        else:
+            self.info = None
+
+    @classmethod
+    def _update_many(cls, servers):
+        """
+        Query many Source game servers with a single burst of A2S_INFO packets
+        """
+        for server in servers:
+            server.console.info("Updating info for %r" % server)
+        try:
+            responses = a2s_info_many([x.address for x in servers])
+        except Exception, err:
+            servers[0].console.error(err)
+            responses = {}
+        for server in servers:
+            if server.address in responses:
+                server._on_response(responses[server.address])
+            else:
+                server._failure = 'timeout'
+                server._on_failure("%s : down" % server.address)
+
+
+class ServerPoller(threading.Thread):
+    """
+    Thread refreshing the status of the plugin game servers in the background.
+    Each game server is refreshed every 'interval' seconds, give or take some jitter so probes don't line up.
+    """
+    JITTER = 0.1  # ratio of the interval
+    FIRST_POLL_SPREAD = 1  # seconds
+
+    def __init__(self, plugin, interval):
+        threading.Thread.__init__(self, name="servermonitor-poller")
+        self.setDaemon(True)
+        self.plugin = plugin
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._next_polls = {}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_stale(self, server):
+        """
+        tell if a server status is older than what the poller should provide
+        """
+        return server.age is None or server.age > self.interval * (1 + self.JITTER) + self.plugin.QUERY_DEADLINE
+
+    def run(self):
+        while not self._stop_event.isSet():
+            try:
+                self.poll()
+            except Exception, err:
+                self.plugin.error("Could not poll game servers. %s" % err)
+            self._stop_event.wait(self.time_to_next_poll())
+
+    def poll(self):
+        """
+        update the game servers which are due
+        """
+        now = time.time()
+        servers = list(self.plugin.servers)
+        # forget about servers removed by a reconfig
+        for server in self._next_polls.keys():
+            if server not in servers:
+                del self._next_polls[server]
+        for server in servers:
+            if server not in self._next_polls:
+                # spread the first polls a bit
+                self._next_polls[server] = now + random.uniform(0, self.FIRST_POLL_SPREAD)
+        due = [x for x in servers if self._next_polls[x] <= now]
+        if due:
+            try:
+                self.plugin.update_servers(due)
+            finally:
+                for server in due:
+                    self._next_polls[server] = time.time() + self.interval * random.uniform(1 - self.JITTER,
+                                                                                          1 + self.JITTER)
 
+    def time_to_next_poll(self):
+        if not self._next_polls:
+            return self.interval
+        return max(0, min(self._next_polls.values()) - time.time())
 
-class Quake3ServerInfo(ServerInfo):
+
+class ServerDiscovery(threading.Thread):
     """
-    ServerInfo subclass which is able to query directly the status of game servers based on the Quake3 engine.
+    Thread updating the game servers of the plugin from the list of a quake3 master server every 'interval' seconds
     """
+    def __init__(self, plugin, interval):
+        threading.Thread.__init__(self, name="servermonitor-discovery")
+        self.setDaemon(True)
+        self.plugin = plugin
+        self.interval = interval
+        self._stop_event = threading.Event()
 
-    @ServerInfo.data.setter
-    def data(self, value):
-        if value.startswith("\xff\xff\xff\xffinfoResponse\n"):
-            self._data = {}
-            for k, v in re.findall(r"\\([^\\]*)\\([^\\]*)", value):
-                self._data[k] = v
-            self.console.debug("data: %r" % self._data)
-        else:
-            self.console.error("Unexpected response from quake3 server %s. %r" % (self.address, value))
-            self._data = None
+    def stop(self):
+        self._stop_event.set()
 
-    def update(self):
-        self.console.info("Updating info for %r" % self)
-        self._data = None
-        self.info = None
-        try:
-            raw_data = quake3_info(self.address)
-        except socket.timeout:
-            self.info = "%s : down" % self.address
-        except Exception, err:
-            self.console.error(err)
-        else:
-            self.console.verbose(repr(raw_data))
-            self.data = raw_data
-            if self.data:
-                self.info = self.msg_format.format(
-                    address=self.address,
-                    map=self.data.get("mapname", "?"),
-                    players=self.data.get("clients", "?"),
-                    max_players=self.data.get("sv_maxclients", "?"),
-                    name=self.data.get("hostname", "?")
-                )
+    def run(self):
+        while not self._stop_event.isSet():
+            try:
+                self.plugin.discover_servers()
+            except Exception, err:
+                self.plugin.error("Could not discover game servers. %s" % err)
+            self._stop_event.wait(self.interval)
 
 
-class BF3ServerInfo(ServerInfo):
+class Advertiser(threading.Thread):
     """
-    ServerInfo subclass which is able to query directly the status of BF3 game servers.
+    Thread advertising game servers in the game chat so B3 event handling never waits for game server queries.
+    Messages are said at most one every 'say_interval' seconds. When 'max_chat_length' is set, the advertisements of
+    many game servers are packed into messages of that length.
     """
+    QUEUE_SIZE = 2  # max number of pending advertisements
 
-    def frostbite_info(self):
+    def __init__(self, plugin, say_interval, max_chat_length=0):
+        threading.Thread.__init__(self, name="servermonitor-advertiser")
+        self.setDaemon(True)
+        self.plugin = plugin
+        self.say_interval = say_interval
+        self.max_chat_length = max_chat_length
+        self.queue = Queue.Queue(self.QUEUE_SIZE)
+        self._stop_event = threading.Event()
+
+    def advertise(self, servers):
         """
-        return serverInfo response from a frostbite game server.
+        queue the advertisement of the given game servers.
+        Return False if it was dropped because too many advertisements are pending already.
         """
-        host = self.address.split(':')[0]
-        port = int(self.address.split(':')[1])
-        with closing(Frostbite1Connection(self.console, host, port)) as t_conn:
-            return t_conn.sendRequest(('serverInfo',))[1:]
-
-    @ServerInfo.data.setter
-    def data(self, value):
         try:
-            self._data = Bf3Parser.decodeServerinfo(value)
-        except Exception, err:
-            self.console.error(err)
-            self._data = None
-        else:
-            self._data['map'] = bf3_MAP_NAME_BY_ID.get(self.data['level'], self.data['level'])
-            del self._data['level']
-            self._data['gamemode'] = bf3_GAME_MODES_NAMES.get(self.data['gamemode'], self.data['gamemode'])
-            self._data['address'] = self.address
-            self._data['name'] = self._data['serverName']
-            del self._data['serverName']
-            self._data['players'] = self._data['numPlayers']
-            del self._data['numPlayers']
-            self._data['max_players'] = self._data['maxPlayers']
-            del self._data['maxPlayers']
-        self.console.verbose(repr(self._data))
+            self.queue.put_nowait(servers)
+            return True
+        except Queue.Full:
+            return False
 
-    def update(self):
-        self.console.info("Updating info for %r" % self)
-        self._data = None
-        self.info = None
+    def stop(self):
+        self._stop_event.set()
         try:
-            raw_data = self.frostbite_info()
-        except socket.timeout:
-            self.info = "%s : down" % self.address
-        except Exception, err:
-            self.console.error(err)
-        else:
-            self.console.verbose(repr(raw_data))
-            self.data = raw_data
-            if self.data:
-                self.info = self.msg_format.format(**self.data)
+            self.queue.put_nowait(None)
+        except Queue.Full:
+            pass
+
+    def run(self):
+        while not self._stop_event.isSet():
+            servers = self.queue.get()
+            try:
+                if servers is not None:
+                    self.say(servers)
+            except Exception, err:
+                self.plugin.error("Could not advertise game servers. %s" % err)
+            finally:
+                self.queue.task_done()
+
+    def say(self, servers):
+        self.plugin.refresh_servers(servers)
+        messages = pack_lines([self.plugin.advertisement(x) for x in servers], self.max_chat_length)
+        for i, message in enumerate(messages):
+            if i:
+                self._stop_event.wait(self.say_interval)
+            if self._stop_event.isSet():
+                return
+            self.plugin.console.say(message)
 
 
 class ServermonitorPlugin(Plugin):
@@ -268,24 +2365,89 @@ class ServermonitorPlugin(Plugin):
     """
     DEFAULT_ADVERTISE_ON_MAP_CHANGE = False
     DEFAULT_ADVERTISEMENT_FORMAT = """^7{address} ^0: ^4{map} ^5{players}^7/^5{max_players} ^4{name}"""
+    DEFAULT_POLL_INTERVAL = 0
+    DEFAULT_CACHE_TTL = 0
+    DEFAULT_QUAKE3_QUERY = 'getinfo'
+    DEFAULT_HISTORY_WINDOWS = (3600, 86400, 604800)
+    DEFAULT_MAX_CHAT_LENGTH = 0
+    DEFAULT_QUAKE3_MASTER_PROTOCOL = 68
+    QUERY_WORKERS = 32  # max number of game servers queried simultaneously
+    QUERY_DEADLINE = 5  # max number of seconds to wait for all game servers to answer
+    DEFAULT_SAY_INTERVAL = 1  # min number of seconds between two messages advertising game servers on map change
+    STATS_DUMP_INTERVAL = 60  # min number of seconds between two writes of the stats file
+    SNAPSHOT_INTERVAL = 60  # min number of seconds between two writes of the snapshot file
+    SLOWEST_SERVERS = 3  # number of game servers listed by the serverstats command
+    DISCOVERY_INTERVAL = 300  # number of seconds between two queries of the quake3 master server
 
     def __init__(self, console, config=None):
         self.advertise_on_map_change = ServermonitorPlugin.DEFAULT_ADVERTISE_ON_MAP_CHANGE
         self.servers = []
         self.advertisement_format = ServermonitorPlugin.DEFAULT_ADVERTISEMENT_FORMAT
+        self.advertisement_template = AdvertisementTemplate.compile(self.advertisement_format)
+        self.poll_interval = ServermonitorPlugin.DEFAULT_POLL_INTERVAL
+        self.cache_ttl = ServermonitorPlugin.DEFAULT_CACHE_TTL
+        self.quake3_query = ServermonitorPlugin.DEFAULT_QUAKE3_QUERY
+        self.stats_file = None
+        self._stats_dumped_at = 0
+        self._files_lock = threading.Lock()  # serializes the writing of the stats and snapshot files
+        self.history_directory = None
+        self.history_windows = list(ServermonitorPlugin.DEFAULT_HISTORY_WINDOWS)
+        self.snapshot_file = None
+        self._snapshot_saved_at = 0
+        self.max_chat_length = ServermonitorPlugin.DEFAULT_MAX_CHAT_LENGTH
+        self.say_interval = ServermonitorPlugin.DEFAULT_SAY_INTERVAL
+        self.quake3_master = None
+        self.quake3_master_protocol = ServermonitorPlugin.DEFAULT_QUAKE3_MASTER_PROTOCOL
+        self.quake3_master_filter = None
+        self.discovered = set()  # addresses of the game servers added from the quake3 master server
+        self.discovery = None
+        self._servers_lock = threading.Lock()  # held while replacing the list of game servers
+        self.poller = None
+        self.advertiser = None
         Plugin.__init__(self, console, config)
 
     def onLoadConfig(self):
         self.register_commands()
         self.load_conf_settings_advertise_on_map_change()
         self.load_conf_settings_advertisement_format()
-        self.servers = []
-        self.load_conf_servers_gamemonitor()
-        self.load_conf_servers_quake3()
-        self.load_conf_servers_BF3()
+        self.load_conf_settings_poll_interval()
+        self.load_conf_settings_cache_ttl()
+        self.load_conf_settings_quake3_query()
+        self.load_conf_settings_stats_file()
+        self.load_conf_settings_history_directory()
+        self.load_conf_settings_history_windows()
+        self.load_conf_settings_snapshot_file()
+        self.load_conf_settings_max_chat_length()
+        self.load_conf_settings_say_interval()
+        self.load_conf_settings_quake3_master_protocol()
+        self.load_conf_settings_quake3_master_filter()
+        if self.advertiser:
+            self.advertiser.say_interval = self.say_interval
+            self.advertiser.max_chat_length = self.max_chat_length
+        self.save_snapshot(force=True)
+        self.stop_discovery()
+        self.reload_servers()
+        self.start_discovery()
+        self.start_poller()
 
     def onStartup(self):
         self.registerEvent(EVT_GAME_MAP_CHANGE)
+        self.registerEvent(EVT_STOP)
+        self.registerEvent(EVT_EXIT)
+        self.start_advertiser()
+
+    def onEnable(self):
+        self.start_discovery()
+        self.start_poller()
+        self.start_advertiser()
+
+    def onDisable(self):
+        self.stop_discovery()
+        self.stop_poller()
+        self.stop_advertiser()
+        self.save_state()
+        for transport in set([x.TRANSPORT for x in backends if x.TRANSPORT is not None]):
+            transport.close_all()
 
 
     ###############################################################################################
@@ -294,7 +2456,13 @@ class ServermonitorPlugin(Plugin):
     #
     ###############################################################################################
 
-    def _load_conf_servers(self, server_info_class, config_option_name, findall_regexp):
+    def _load_conf_servers(self, server_info_class, reusable=None):
+        """
+        return the game servers of the given type listed in the config, reusing those from 'reusable' (a dict of game
+        servers by (type, address)) when possible
+        """
+        config_option_name = server_info_class.CONFIG_KEY
+        server_kwargs = server_info_class.config_kwargs(self)
         servers = []
         if not self.config.has_section('servers'):
             self.error("The config has no section 'servers'.")
@@ -302,22 +2470,62 @@ class ServermonitorPlugin(Plugin):
             self.warning("The config is missing '%s' in section 'servers'." % config_option_name)
         else:
             raw_server_list = self.config.get('servers', config_option_name)
-            for address in re.findall(findall_regexp, raw_server_list):
-                servers.append(server_info_class(self.console, address, self.advertisement_format))
+            for address in re.findall(server_info_class.ADDRESS_PATTERN, raw_server_list):
+                servers.append(self._new_server(server_info_class, address, server_kwargs, reusable))
+            # resolve host names now so that queries do not have to
+            for host in sorted(set([split_address(x.address)[0] for x in servers])):
+                try:
+                    dns_cache.resolve(host)
+                except socket.error:
+                    self.warning("Could not resolve host name %s" % host)
         if len(servers):
             self.info('servers loaded from config for datasource %r: ' % config_option_name + ', '.join([_.address for _ in servers]))
-            self.servers.extend(servers)
         else:
             self.info('No server loaded from config for datasource %s' % config_option_name)
+        return servers
 
-    def load_conf_servers_gamemonitor(self):
-        self._load_conf_servers(GamemonitorServerInfo, 'game-monitor.com', "(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])\.){3}(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9]):\d+")
-
-    def load_conf_servers_quake3(self):
-        self._load_conf_servers(Quake3ServerInfo, 'quake3 server', "\S+:\d+")
+    def _new_server(self, server_info_class, address, server_kwargs, reusable=None):
+        """
+        return a game server of the given type and address. The game server from 'reusable' is returned instead if it
+        was created with the same settings, so that its status, history and connections live on.
+        """
+        old = (reusable or {}).get((server_info_class, address))
+        if old is not None and old.template is self.advertisement_template \
+                and not [k for k, v in server_kwargs.items() if getattr(old, k) != v]:
+            old.cache_ttl = self.cache_ttl
+            if old.player_history is None or old.player_history.path != self.player_history_path(old):
+                old.player_history = self.open_player_history(old)
+            return old
+        server = server_info_class(self.console, address, self.advertisement_template, self.cache_ttl,
+                                   advertised_only=True, **server_kwargs)
+        server.add_listener(self.on_server_change)
+        if old is not None and old.player_history is not None \
+                and old.player_history.path == self.player_history_path(server):
+            server.player_history = old.player_history
+        else:
+            server.player_history = self.open_player_history(server)
+        return server
 
-    def load_conf_servers_BF3(self):
-        self._load_conf_servers(BF3ServerInfo, 'BF3 server', "\S+:\d+")
+    def load_conf_servers_quake3_master(self):
+        self.quake3_master = None
+        if not self.config.has_section('servers'):
+            self.error("The config has no section 'servers'.")
+        elif not self.config.has_option('servers', 'quake3 master'):
+            self.warning("The config is missing 'quake3 master' in section 'servers'.")
+        else:
+            value = self.config.get('servers', 'quake3 master').strip()
+            if value and not re.match(r"^\S+:\d+$", value):
+                self.error("Unexpected value for 'quake3 master' in section 'servers': %r. Expecting <host:port>" % value)
+            elif value:
+                self.quake3_master = value
+                try:
+                    dns_cache.resolve(split_address(value)[0])
+                except socket.error:
+                    self.warning("Could not resolve host name %s" % split_address(value)[0])
+        if self.quake3_master:
+            self.info('discover quake3 servers from master %s' % self.quake3_master)
+        else:
+            self.info('discover quake3 servers from a master server: no')
 
 
     def load_conf_settings_advertise_on_map_change(self):
@@ -338,6 +2546,7 @@ class ServermonitorPlugin(Plugin):
 
     def load_conf_settings_advertisement_format(self):
         self.advertisement_format = ServermonitorPlugin.DEFAULT_ADVERTISEMENT_FORMAT
+        self.advertisement_template = AdvertisementTemplate.compile(self.advertisement_format)
         if not self.config.has_section('settings'):
             self.error("The config has no section 'settings'.")
         elif not self.config.has_option('settings', 'advertisement format'):
@@ -348,7 +2557,7 @@ class ServermonitorPlugin(Plugin):
                 self.error("Invalid advertisement format. Cannot be empty")
             else:
                 try:
-                    ServerInfo.validate_advertisement_format(raw_format)
+                    template = AdvertisementTemplate.compile(raw_format)
                 except KeyError, err:
                     self.error("Invalid advertisement format %r. Invalid keyword {%s}" % (raw_format, err.message))
                 except ValueError, err:
@@ -357,9 +2566,228 @@ class ServermonitorPlugin(Plugin):
                     self.error("Invalid advertisement format %r. %s" % (raw_format, err.message), exc_info=err)
                 else:
                     self.advertisement_format = raw_format
+                    self.advertisement_template = template
         self.info('advertisement_format: %s' % self.advertisement_format)
 
 
+    def load_conf_settings_poll_interval(self):
+        self.poll_interval = ServermonitorPlugin.DEFAULT_POLL_INTERVAL
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'poll interval'):
+            self.warning("The config is missing 'poll interval' in section 'settings'.")
+        else:
+            try:
+                value = self.config.getint('settings', 'poll interval')
+                if value < 0:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'poll interval' in section 'settings': %r. Expecting a positive number of seconds" % self.config.get('settings', 'poll interval'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.poll_interval = value
+        if self.poll_interval:
+            self.info('poll game servers in the background every %ss' % self.poll_interval)
+        else:
+            self.info('poll game servers in the background: no')
+
+
+    def load_conf_settings_cache_ttl(self):
+        self.cache_ttl = ServermonitorPlugin.DEFAULT_CACHE_TTL
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'cache ttl'):
+            self.warning("The config is missing 'cache ttl' in section 'settings'.")
+        else:
+            try:
+                value = self.config.getint('settings', 'cache ttl')
+                if value < 0:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'cache ttl' in section 'settings': %r. Expecting a positive number of seconds" % self.config.get('settings', 'cache ttl'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.cache_ttl = value
+        if self.cache_ttl:
+            self.info('reuse game servers status for %ss' % self.cache_ttl)
+        else:
+            self.info('reuse game servers status: no')
+
+
+    def load_conf_settings_quake3_query(self):
+        self.quake3_query = ServermonitorPlugin.DEFAULT_QUAKE3_QUERY
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'quake3 query'):
+            self.warning("The config is missing 'quake3 query' in section 'settings'.")
+        else:
+            value = self.config.get('settings', 'quake3 query').strip().lower()
+            if value not in Quake3ServerInfo.QUERIES:
+                self.error("Unexpected value for setting 'quake3 query' in section 'settings': %r. Expecting 'getinfo' or 'getstatus'" % self.config.get('settings', 'quake3 query'))
+            else:
+                self.quake3_query = value
+        self.info('quake3 query: %s' % self.quake3_query)
+
+
+    def load_conf_settings_stats_file(self):
+        self.stats_file = None
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'stats file'):
+            self.warning("The config is missing 'stats file' in section 'settings'.")
+        else:
+            value = self.config.get('settings', 'stats file').strip()
+            if value:
+                self.stats_file = b3.getAbsolutePath(value)
+        if self.stats_file:
+            self.info('dump query statistics to %s' % self.stats_file)
+        else:
+            self.info('dump query statistics: no')
+
+
+    def load_conf_settings_history_directory(self):
+        self.history_directory = None
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'history directory'):
+            self.warning("The config is missing 'history directory' in section 'settings'.")
+        else:
+            value = self.config.get('settings', 'history directory').strip()
+            if value:
+                path = b3.getAbsolutePath(value)
+                try:
+                    if not os.path.isdir(path):
+                        os.makedirs(path)
+                except OSError, err:
+                    self.error("Could not create history directory %s. %s" % (path, err))
+                else:
+                    self.history_directory = path
+        if self.history_directory:
+            self.info('keep player count history in %s' % self.history_directory)
+        else:
+            self.info('keep player count history in memory')
+
+
+    def load_conf_settings_history_windows(self):
+        self.history_windows = list(ServermonitorPlugin.DEFAULT_HISTORY_WINDOWS)
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'history windows'):
+            self.warning("The config is missing 'history windows' in section 'settings'.")
+        else:
+            try:
+                value = [parse_duration(x) for x in self.config.get('settings', 'history windows').split()]
+                if not value:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'history windows' in section 'settings': %r. Expecting durations such as '1h 1d 1w'" % self.config.get('settings', 'history windows'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.history_windows = value
+        self.info('player count history windows: %s' % ', '.join(map(format_age, self.history_windows)))
+
+
+    def load_conf_settings_snapshot_file(self):
+        self.snapshot_file = None
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'snapshot file'):
+            self.warning("The config is missing 'snapshot file' in section 'settings'.")
+        else:
+            value = self.config.get('settings', 'snapshot file').strip()
+            if value:
+                self.snapshot_file = b3.getAbsolutePath(value)
+        if self.snapshot_file:
+            self.info('keep last known status of game servers in %s' % self.snapshot_file)
+        else:
+            self.info('keep last known status of game servers: no')
+
+
+    def load_conf_settings_max_chat_length(self):
+        self.max_chat_length = ServermonitorPlugin.DEFAULT_MAX_CHAT_LENGTH
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'max chat length'):
+            self.warning("The config is missing 'max chat length' in section 'settings'.")
+        else:
+            try:
+                value = self.config.getint('settings', 'max chat length')
+                if value < 0:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'max chat length' in section 'settings': %r. Expecting a positive number of characters" % self.config.get('settings', 'max chat length'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.max_chat_length = value
+        if self.max_chat_length:
+            self.info('pack advertisements into chat messages of up to %s characters' % self.max_chat_length)
+        else:
+            self.info('pack advertisements: no')
+
+
+    def load_conf_settings_say_interval(self):
+        self.say_interval = ServermonitorPlugin.DEFAULT_SAY_INTERVAL
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'say interval'):
+            self.warning("The config is missing 'say interval' in section 'settings'.")
+        else:
+            try:
+                value = self.config.getfloat('settings', 'say interval')
+                if value < 0:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'say interval' in section 'settings': %r. Expecting a positive number of seconds" % self.config.get('settings', 'say interval'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.say_interval = value
+        self.info('say advertisements every %gs' % self.say_interval)
+
+
+    def load_conf_settings_quake3_master_protocol(self):
+        self.quake3_master_protocol = ServermonitorPlugin.DEFAULT_QUAKE3_MASTER_PROTOCOL
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'quake3 master protocol'):
+            self.warning("The config is missing 'quake3 master protocol' in section 'settings'.")
+        else:
+            try:
+                value = self.config.getint('settings', 'quake3 master protocol')
+                if value <= 0:
+                    raise ValueError
+            except ValueError:
+                self.error("Unexpected value for setting 'quake3 master protocol' in section 'settings': %r. Expecting a protocol version number" % self.config.get('settings', 'quake3 master protocol'))
+            except Exception, err:
+                self.error(err)
+            else:
+                self.quake3_master_protocol = value
+        self.info('quake3 master protocol: %s' % self.quake3_master_protocol)
+
+
+    def load_conf_settings_quake3_master_filter(self):
+        self.quake3_master_filter = None
+        if not self.config.has_section('settings'):
+            self.error("The config has no section 'settings'.")
+        elif not self.config.has_option('settings', 'quake3 master filter'):
+            self.warning("The config is missing 'quake3 master filter' in section 'settings'.")
+        else:
+            value = self.config.get('settings', 'quake3 master filter').strip()
+            if value:
+                try:
+                    self.quake3_master_filter = re.compile(value, re.IGNORECASE)
+                except re.error, err:
+                    self.error("Unexpected value for setting 'quake3 master filter' in section 'settings': %r. Expecting a regular expression. %s" % (value, err))
+        if self.quake3_master_filter:
+            self.info('quake3 master filter: %s' % self.quake3_master_filter.pattern)
+        else:
+            self.info('quake3 master filter: no')
+
+
 
     ###############################################################################################
     #
@@ -368,11 +2796,17 @@ class ServermonitorPlugin(Plugin):
     ###############################################################################################
 
     def onEvent(self, event):
-        if len(self.servers):
+        if event.type in (EVT_STOP, EVT_EXIT):
+            self.save_state()
+        elif len(self.servers):
             if event.type == EVT_GAME_MAP_CHANGE and self.advertise_on_map_change:
-                for server in self.servers:
-                    server.update()
-                    self.console.say(str(server))
+                if not self.advertiser.advertise(list(self.servers)):
+                    self.warning("too many game server advertisements pending, skipping this one")
+
+
+    def on_server_change(self, server, changes):
+        self.debug("%s changed: %s" % (server.address, ', '.join(
+            ["%s %r -> %r" % (k, old, new) for k, (old, new) in sorted(changes.items())])))
 
 
     ###############################################################################################
@@ -389,9 +2823,9 @@ class ServermonitorPlugin(Plugin):
             cmd.sayLoudOrPM(client, "no server setup")
         else:
             if not data:
-                for server in self.servers:
-                    server.update()
-                    cmd.sayLoudOrPM(client, str(server))
+                self.refresh_servers(self.servers)
+                for message in pack_lines([self.advertisement(x) for x in self.servers], self.max_chat_length):
+                    cmd.sayLoudOrPM(client, message)
             else:
                 try:
                     server_index = int(data)
@@ -402,8 +2836,74 @@ class ServermonitorPlugin(Plugin):
                         client.message("invalid server index. Server indexes go from 1 to %s" % len(self.servers))
                     else:
                         server = self.servers[server_index - 1]
-                        server.update()
-                        cmd.sayLoudOrPM(client, str(server))
+                        self.refresh_servers([server])
+                        cmd.sayLoudOrPM(client, self.advertisement(server))
+
+
+    def cmd_serverhistory(self, data, client, cmd=None):
+        """\
+        <server #> - show the min, average and max number of players of a game server over the last hours and days
+        """
+        if not len(self.servers):
+            cmd.sayLoudOrPM(client, "no server setup")
+        elif not data:
+            client.message("missing server index. Try %shelp %s" % (cmd.prefix, cmd.command))
+        else:
+            try:
+                server_index = int(data)
+            except ValueError:
+                client.message("invalid server index. Try %shelp %s" % (cmd.prefix, cmd.command))
+            else:
+                if not 1 <= server_index <= len(self.servers):
+                    client.message("invalid server index. Server indexes go from 1 to %s" % len(self.servers))
+                else:
+                    server = self.servers[server_index - 1]
+                    now = time.time()
+                    for window in self.history_windows:
+                        summary = None
+                        if server.player_history is not None:
+                            summary = server.player_history.summary(now - window)
+                        if summary is None:
+                            text = "no data"
+                        elif summary[0] is None:
+                            text = "down"
+                        else:
+                            # B3 formats messages with their arguments, hence the escaped '%'
+                            text = "min %s, avg %.1f, max %s players, up %d%%%%" % (
+                                summary[0], summary[1], summary[2], round(summary[3] * 100))
+                        cmd.sayLoudOrPM(client, "#%s %s last %s: %s" % (server_index, server.address,
+                                                                       format_age(window), text))
+
+
+    def cmd_serverstats(self, data, client, cmd=None):
+        """\
+        [server #] - show game server query statistics. If a server number is given show that server only.
+        """
+        if not len(self.servers):
+            cmd.sayLoudOrPM(client, "no server setup")
+        elif not data:
+            queried_backends = []
+            for server in self.servers:
+                if server.__class__ not in queried_backends:
+                    queried_backends.append(server.__class__)
+            for backend in queried_backends:
+                cmd.sayLoudOrPM(client, "%s: %s" % (backend_name(backend), backend.backend_stats().summary()))
+            queried = [x for x in self.servers if x.stats.queries]
+            queried.sort(key=lambda x: (x.stats.percentile(95), x.stats.counts['timeout']), reverse=True)
+            for server in queried[:self.SLOWEST_SERVERS]:
+                cmd.sayLoudOrPM(client, "#%s %s: %s" % (self.servers.index(server) + 1, server.address,
+                                                       server.stats.summary()))
+        else:
+            try:
+                server_index = int(data)
+            except ValueError:
+                client.message("invalid server index. Try %shelp %s" % (cmd.prefix, cmd.command))
+            else:
+                if not 1 <= server_index <= len(self.servers):
+                    client.message("invalid server index. Server indexes go from 1 to %s" % len(self.servers))
+                else:
+                    server = self.servers[server_index - 1]
+                    cmd.sayLoudOrPM(client, "#%s %s: %s" % (server_index, server.address, server.stats.summary()))
 
 
     ###############################################################################################
@@ -412,6 +2912,297 @@ class ServermonitorPlugin(Plugin):
     #
     ###############################################################################################
 
+    def update_servers(self, servers):
+        """
+        Query the given game servers all at once
+        """
+        late_servers = update_concurrently(servers, self.QUERY_WORKERS, self.QUERY_DEADLINE)
+        if late_servers:
+            self.warning("no answer within %ss from %s" % (self.QUERY_DEADLINE, ', '.join([x.address for x in late_servers])))
+        self.dump_stats()
+        self.save_snapshot()
+
+    def dump_stats(self, force=False):
+        """
+        write the query statistics of the game servers to the stats file as JSON, at most once every
+        STATS_DUMP_INTERVAL seconds unless forced
+        """
+        if not self.stats_file:
+            return
+        self._files_lock.acquire()
+        try:
+            now = time.time()
+            if not force and now - self._stats_dumped_at < self.STATS_DUMP_INTERVAL:
+                return
+            self._stats_dumped_at = now
+            backends_stats = dict([(backend_name(x.__class__), x.backend_stats().as_dict()) for x in self.servers])
+            servers = []
+            for server in self.servers:
+                server_stats = server.stats.as_dict()
+                server_stats['address'] = server.address
+                server_stats['backend'] = backend_name(server.__class__)
+                servers.append(server_stats)
+            try:
+                write_json_file(self.stats_file, {'time': now, 'backends': backends_stats, 'servers': servers},
+                                indent=2, sort_keys=True)
+            except EnvironmentError, err:
+                self.error("Could not write stats file %s. %s" % (self.stats_file, err))
+        finally:
+            self._files_lock.release()
+
+    def reload_servers(self):
+        """
+        Load the game servers from the config. Game servers which did not change keep their status, history and
+        connections, game servers which were removed are torn down and game servers which were added are queried in
+        the background. Game servers found by the quake3 master server are kept as long as it does not change.
+        The new list of game servers replaces the previous one at once.
+        """
+        self._servers_lock.acquire()
+        try:
+            self._reload_servers()
+        finally:
+            self._servers_lock.release()
+
+    def _reload_servers(self):
+        previous = self.servers
+        previous_master = self.quake3_master
+        reusable = dict([((x.__class__, x.address), x) for x in previous])
+        servers = []
+        for backend in backends:
+            servers.extend(self._load_conf_servers(backend, reusable))
+        self.load_conf_servers_quake3_master()
+        configured = set([x.address for x in servers if isinstance(x, Quake3ServerInfo)])
+        discovered = set()
+        if self.quake3_master and self.quake3_master == previous_master:
+            server_kwargs = Quake3ServerInfo.config_kwargs(self)
+            for server in previous:
+                if server.address in self.discovered and server.address not in configured:
+                    servers.append(self._new_server(Quake3ServerInfo, server.address, server_kwargs, reusable))
+                    discovered.add(server.address)
+        current = set([id(x) for x in servers])
+        known = set([id(x) for x in previous])
+        added = [x for x in servers if id(x) not in known]
+        removed = [x for x in previous if id(x) not in current]
+        histories = set([id(x.player_history) for x in servers])
+        connected = set([x.address for x in servers if x.TRANSPORT is frostbite_pool])
+        self.servers = servers
+        self.discovered = discovered
+        for server in removed:
+            if server.player_history is not None:
+                if id(server.player_history) not in histories:
+                    server.player_history.close()
+                server.player_history = None
+            if server.TRANSPORT is frostbite_pool and server.address not in connected:
+                frostbite_pool.close(server.address)
+        restored = self.restore_snapshot(added)
+        if previous:
+            self.info("game servers reloaded: %s kept, %s added, %s removed" % (
+                len(servers) - len(added), len(added), len(removed)))
+            self.warm_up(added)
+        else:
+            self.warm_up(restored)
+
+    def warm_up(self, servers):
+        """
+        query the given game servers from another thread, unless polling in the background which will do so
+        """
+        if servers and not self.poll_interval:
+            refresh = threading.Thread(target=self.update_servers, args=(servers,), name="servermonitor-warm-up")
+            refresh.setDaemon(True)
+            refresh.start()
+
+    def discover_servers(self):
+        """
+        Add the quake3 game servers listed by the quake3 master server whose name matches the filter, and remove the
+        game servers it added before which are not listed anymore. Game servers from the config are left alone.
+        """
+        master = self.quake3_master
+        if not master:
+            return
+        try:
+            listed = quake3_master_servers(master, self.quake3_master_protocol)
+        except (socket.error, ValueError), err:
+            self.warning("Could not get the game servers list from quake3 master %s. %s" % (master, err))
+            return
+        known = set([x.address for x in self.servers])
+        candidates = [x for x in listed if x not in known]
+        if candidates and self.quake3_master_filter:
+            candidates = self.filter_by_name(candidates)
+        listed = set(listed)
+        self._servers_lock.acquire()
+        try:
+            if self.quake3_master != master:
+                # the config was reloaded meanwhile
+                return
+            servers = self.servers
+            known = set([x.address for x in servers])
+            candidates = [x for x in candidates if x not in known]
+            removed = [x for x in servers if x.address in self.discovered and x.address not in listed]
+            if not candidates and not removed:
+                return
+            server_kwargs = Quake3ServerInfo.config_kwargs(self)
+            added = [self._new_server(Quake3ServerInfo, x, server_kwargs) for x in candidates]
+            self.servers = [x for x in servers if x not in removed] + added
+            self.discovered = (self.discovered - set([x.address for x in removed])) | set(candidates)
+        finally:
+            self._servers_lock.release()
+        for server in removed:
+            if server.player_history is not None:
+                server.player_history.close()
+                server.player_history = None
+        self.info("quake3 master %s: %s game servers added, %s removed" % (master, len(added), len(removed)))
+
+    def filter_by_name(self, addresses):
+        """
+        return the given addresses of quake3 game servers whose name matches the quake3 master filter
+        """
+        responses = quake3_info_many(addresses)
+        matching = []
+        for address in addresses:
+            response = responses.get(address)
+            if response and response.startswith(QUAKE3_INFO_RESPONSE):
+                name = parse_infostring(response).get('hostname', '')
+                if self.quake3_master_filter.search(COLOR_CODE.sub('', name)):
+                    matching.append(address)
+        return matching
+
+    def save_snapshot(self, force=False):
+        """
+        write the last known status of the game servers to the snapshot file as JSON, at most once every
+        SNAPSHOT_INTERVAL seconds unless forced
+        """
+        if not self.snapshot_file:
+            return
+        self._files_lock.acquire()
+        try:
+            now = time.time()
+            if not force and now - self._snapshot_saved_at < self.SNAPSHOT_INTERVAL:
+                return
+            servers = [x.snapshot() for x in self.servers if x.last_update is not None]
+            if not servers:
+                return
+            self._snapshot_saved_at = now
+            try:
+                # game server names are not always UTF-8
+                write_json_file(self.snapshot_file, {'time': now, 'servers': servers}, encoding='latin-1')
+            except EnvironmentError, err:
+                self.error("Could not write snapshot file %s. %s" % (self.snapshot_file, err))
+        finally:
+            self._files_lock.release()
+
+    def save_state(self):
+        """
+        write the stats file, the snapshot file and the player count histories, as B3 stops or the plugin is disabled
+        """
+        self.dump_stats(force=True)
+        self.save_snapshot(force=True)
+        for server in self.servers:
+            if server.player_history is not None:
+                server.player_history.flush()
+
+    def restore_snapshot(self, servers):
+        """
+        advertise the given game servers with their status from the snapshot file until they are queried again.
+        return the restored game servers.
+        """
+        if not self.snapshot_file or not os.path.isfile(self.snapshot_file):
+            return []
+        try:
+            f = open(self.snapshot_file)
+            try:
+                snapshots = json.load(f)['servers']
+            finally:
+                f.close()
+            snapshots = dict([((x['backend'], x['address']), x) for x in snapshots])
+        except (IOError, ValueError, KeyError, TypeError), err:
+            self.error("Could not read snapshot file %s. %s" % (self.snapshot_file, err))
+            return []
+        restored = []
+        for server in servers:
+            snapshot = snapshots.get((backend_name(server.__class__), server.address))
+            if snapshot is not None:
+                try:
+                    server.restore(latin1_strings(snapshot))
+                except (KeyError, TypeError), err:
+                    self.warning("Could not restore %r from snapshot. %s" % (server, err))
+                else:
+                    restored.append(server)
+        if restored:
+            self.info("restored last known status of %s game servers" % len(restored))
+        return restored
+
+    def player_history_path(self, server):
+        """
+        return the file the player count history of the given game server is kept in, or None to keep it in memory
+        """
+        if self.history_directory:
+            return os.path.join(self.history_directory, "%s_%s.history" % (
+                backend_name(server.__class__), re.sub(r"[^\w.-]", "_", server.address)))
+        return None
+
+    def open_player_history(self, server):
+        """
+        return the PlayerCountHistory of the given game server, kept in the history directory if any
+        """
+        path = self.player_history_path(server)
+        if path:
+            try:
+                return PlayerCountHistory(path)
+            except EnvironmentError, err:
+                self.error("Could not open player count history %s. %s" % (path, err))
+        return PlayerCountHistory()
+
+    def refresh_servers(self, servers):
+        """
+        Make sure the given game servers have some info to advertise.
+        When polling in the background, only the game servers which were never polled yet are queried.
+        """
+        if self.poller:
+            self.update_servers([x for x in servers if x.last_update is None])
+        else:
+            # game servers restored from the snapshot are being refreshed in the background already
+            self.update_servers([x for x in servers if not x.restored])
+
+    def advertisement(self, server):
+        """
+        return the text advertising the given game server
+        """
+        if server.restored or (self.poller and server.last_update is not None and self.poller.is_stale(server)):
+            return "%s ^7(%s ago)" % (server, format_age(server.age))
+        return str(server)
+
+    def start_poller(self):
+        self.stop_poller()
+        if self.poll_interval:
+            self.poller = ServerPoller(self, self.poll_interval)
+            self.poller.start()
+
+    def stop_poller(self):
+        if self.poller:
+            self.poller.stop()
+            self.poller = None
+
+    def start_discovery(self):
+        self.stop_discovery()
+        if self.quake3_master:
+            self.discovery = ServerDiscovery(self, self.DISCOVERY_INTERVAL)
+            self.discovery.start()
+
+    def stop_discovery(self):
+        if self.discovery:
+            self.discovery.stop()
+            self.discovery = None
+
+    def start_advertiser(self):
+        self.stop_advertiser()
+        self.advertiser = Advertiser(self, self.say_interval, self.max_chat_length)
+        self.advertiser.start()
+
+    def stop_advertiser(self):
+        if self.advertiser:
+            self.advertiser.stop()
+            self.advertiser = None
+
     def register_commands(self):
         # get the admin plugin
         adminPlugin = self.console.getPlugin('admin')
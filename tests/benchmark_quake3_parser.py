@@ -0,0 +1,35 @@
+"""
+Micro-benchmark of the Quake3 infoResponse parser.
+
+USAGE:
+    PYTHONPATH=extplugins python tests/benchmark_quake3_parser.py
+"""
+import re
+import timeit
+
+RESPONSE = ('\xff\xff\xff\xffinfoResponse\n\\modversion\\4.2.009\\game\\q3ut4\\auth\\1\\pure\\1\\gametype\\4\\sv_maxcl'
+            'ients\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\^1Test ^7server ^4name\\protocol\\68\\sv_allowvote\\1'
+            '\\g_needpass\\0\\sv_joinmessage\\Welcome to our server, have fun!\\sv_dlURL\\http://example.com/q3ut4')
+
+
+def legacy_parse(value):
+    """
+    the parser used up to servermonitor 1.3
+    """
+    data = {}
+    for k, v in re.findall(r"\\([^\\]*)\\([^\\]*)", value):
+        data[k] = v
+    return data
+
+
+if __name__ == '__main__':
+    from servermonitor import parse_infostring
+    assert legacy_parse(RESPONSE) == parse_infostring(RESPONSE)
+    number = 100000
+    for label, statement in (
+        ("re.findall (1.3)", "legacy_parse(RESPONSE)"),
+        ("parse_infostring", "parse_infostring(RESPONSE)"),
+    ):
+        duration = min(timeit.repeat(statement, setup="from __main__ import legacy_parse, parse_infostring, RESPONSE",
+                                     repeat=3, number=number))
+        print "%-30s %6.2f us/response" % (label, duration / number * 1000000)
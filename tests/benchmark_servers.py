@@ -0,0 +1,239 @@
+"""
+Benchmark of the !servers command and of map change advertisements against local stand-ins of game servers and of
+game-monitor.com, with configurable latency, loss and share of dead game servers.
+
+For each datasource and number of game servers, reports the percentiles of the time each game server status took to
+be refreshed, and the wall time of the whole command (or of the whole advertisement for map changes, as well as how
+long the B3 event handler was held).
+
+USAGE:
+    PYTHONPATH=extplugins:. python tests/benchmark_servers.py [options]
+    PYTHONPATH=extplugins:. python tests/benchmark_servers.py --sizes 1,10,100 --latency 0.05 --loss 0.02 --dead 0.1
+"""
+import StringIO
+import logging
+import optparse
+import resource
+import sys
+import threading
+import time
+from mockito import when
+from tests import logging_disabled
+
+DATASOURCES = ('quake3', 'bf3', 'gamemonitor')
+
+
+def percentile(values, p):
+    """
+    return the p-th percentile (nearest rank) of the given values
+    """
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))]
+
+
+class StandIns(object):
+    """
+    Start 'size' local stand-ins for game servers of the given datasource, a share 'dead' of which never answer.
+    """
+    def __init__(self, datasource, size, latency, loss, dead):
+        from tests.fakeservers import FakeQuake3Server, FakeFrostbiteServer, FakeGamemonitorServer, \
+            BlackholeTCPServer, unused_udp_address
+        self.servers = []
+        self.addresses = []
+        dead_count = int(round(size * dead))
+        if datasource == 'quake3':
+            self.config_option = 'quake3 server'
+            for i in range(size):
+                if i < dead_count:
+                    self.addresses.append(unused_udp_address())
+                    continue
+                server = FakeQuake3Server(latency=latency, loss=loss, hostname="server %s" % i, mapname="ut4_casa",
+                                          clients=i % 12, sv_maxclients=12,
+                                          players=[(j, 50, "player%s" % j) for j in range(i % 12)])
+                server.start()
+                self.servers.append(server)
+                self.addresses.append(server.address)
+        elif datasource == 'bf3':
+            self.config_option = 'BF3 server'
+            for i in range(size):
+                if i < dead_count:
+                    server = BlackholeTCPServer()
+                else:
+                    server = FakeFrostbiteServer(latency=latency, loss=loss)
+                    server.start()
+                self.servers.append(server)
+                self.addresses.append(server.address)
+        elif datasource == 'gamemonitor':
+            from servermonitor import GamemonitorServerInfo
+            self.config_option = 'game-monitor.com'
+            self.addresses = ["10.%s.%s.%s:27960" % (i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(size)]
+            documents = dict([(address, '={"error":0,"player":%s,"maxplayer":12,"name":"server %s"}' % (i % 12, i))
+                              for i, address in enumerate(self.addresses) if i >= dead_count])
+            server = FakeGamemonitorServer(documents)
+            server.latency = latency
+            server.loss = loss
+            server.start()
+            self.servers.append(server)
+            GamemonitorServerInfo.URL = "http://%s/%%s/data/server.js" % server.address
+        else:
+            raise ValueError("unknown datasource %r" % datasource)
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+
+def create_plugin(config_content):
+    """
+    return a started ServermonitorPlugin and a player able to use the !servers command
+    """
+    from b3.config import CfgConfigParser, XmlConfigParser
+    from b3.plugins.admin import AdminPlugin
+    from b3.fake import FakeConsole, FakeClient
+    from servermonitor import ServermonitorPlugin
+    with logging_disabled():
+        parser_conf = XmlConfigParser()
+        parser_conf.loadFromString("""<configuration><settings name="server"><set name="game_log"></set></settings></configuration>""")
+        console = FakeConsole(parser_conf)
+        console.startup()
+        admin_plugin = AdminPlugin(console, '@b3/conf/plugin_admin.ini')
+        admin_plugin.onLoadConfig()
+        admin_plugin._commands = {}
+        admin_plugin.onStartup()
+    when(console).getPlugin('admin').thenReturn(admin_plugin)
+    console.say = lambda msg, *args: None
+    conf = CfgConfigParser()
+    conf.loadFromString(config_content)
+    plugin = ServermonitorPlugin(console, conf)
+    plugin.onLoadConfig()
+    plugin.onStartup()
+    plugin.advertiser.say_interval = 0
+    player = FakeClient(console, name="Player", guid="player_guid", groupBits=1)
+    player.message = lambda msg, *args: None
+    player.connects("1")
+    return plugin, player
+
+
+def reset_state(plugin):
+    """
+    forget what previous runs taught about the game servers (circuit breakers, observed latencies, reconnection
+    backoff) so that each run measures queries, and dead game servers are waited for rather than skipped
+    """
+    from servermonitor import CircuitBreaker, LatencyTracker, udp_multiplexer, frostbite_pool
+    for server in plugin.servers:
+        server.last_update = None
+        server.breaker = CircuitBreaker()
+    udp_multiplexer._latencies.clear()
+    for slot in frostbite_pool._slots.values():
+        slot.failures = 0
+        slot.retry_at = 0
+        slot.latency = LatencyTracker()
+
+
+def run_cmd_servers(plugin, player):
+    player.says("!servers")
+
+
+def run_map_change(plugin, player):
+    """
+    return how long the B3 event handler was held
+    """
+    start = time.time()
+    plugin.console.queueEvent(plugin.console.getEvent("EVT_GAME_MAP_CHANGE"))
+    held = time.time() - start
+    plugin.advertiser.queue.join()
+    return held
+
+
+class quiet(object):
+    """
+    context manager that silences what B3 fake objects print on stdout
+    """
+    def __enter__(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.stdout = self.stdout
+
+
+def benchmark(datasource, size, options):
+    from servermonitor import frostbite_pool, http_pool
+    stand_ins = StandIns(datasource, size, options.latency, options.loss, options.dead)
+    plugin, player = create_plugin("""\
+[commands]
+servers: guest
+[settings]
+advertise on map change: yes
+advertisement format: {address} : {map} {players}/{max_players} {name}
+poll interval: 0
+cache ttl: 0
+quake3 query: %s
+[servers]
+%s: %s
+""" % (options.quake3_query, stand_ins.config_option, ' '.join(stand_ins.addresses)))
+    results = []
+    try:
+        for label, run in (("!servers", run_cmd_servers), ("map change", run_map_change)):
+            refresh_times = []
+            wall_times = []
+            held_times = []
+            for i in range(options.runs):
+                reset_state(plugin)
+                start = time.time()
+                held = run(plugin, player)
+                wall_times.append(time.time() - start)
+                if held is not None:
+                    held_times.append(held)
+                refresh_times.extend([server.last_update - start for server in plugin.servers
+                                      if server.last_update is not None])
+            results.append((label, refresh_times, wall_times, held_times))
+    finally:
+        plugin.stop_poller()
+        plugin.stop_advertiser()
+        frostbite_pool.close_all()
+        http_pool.close_all()
+        stand_ins.stop()
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--datasources", default=','.join(DATASOURCES),
+                      help="comma separated datasources to benchmark among %s [default: %%default]" % ', '.join(DATASOURCES))
+    parser.add_option("--sizes", default="1,10,100,500", help="comma separated numbers of game servers [default: %default]")
+    parser.add_option("--runs", type="int", default=5, help="runs per benchmark [default: %default]")
+    parser.add_option("--latency", type="float", default=0.02, help="game server response time in seconds [default: %default]")
+    parser.add_option("--loss", type="float", default=0, help="probability a query gets no answer [default: %default]")
+    parser.add_option("--dead", type="float", default=0, help="share of game servers which never answer [default: %default]")
+    parser.add_option("--quake3-query", default="getinfo", help="getinfo or getstatus [default: %default]")
+    options, args = parser.parse_args()
+
+    logging.getLogger('output').setLevel(logging.CRITICAL)
+    # each game server stand-in needs a thread and a few file descriptors
+    threading.stack_size(512 * 1024)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+    print "latency: %ss, loss: %.0f%%, dead: %.0f%%, runs: %s" % (options.latency, options.loss * 100,
+                                                                options.dead * 100, options.runs)
+    print "%-12s %7s %-11s %9s %9s %9s %9s %9s %9s" % ("datasource", "servers", "action", "p50", "p95", "p99",
+                                                      "wall avg", "wall max", "held max")
+    for datasource in options.datasources.split(','):
+        for size in [int(x) for x in options.sizes.split(',')]:
+            with quiet():
+                results = benchmark(datasource, size, options)
+            for label, refresh_times, wall_times, held_times in results:
+                print "%-12s %7s %-11s %8.0fms %8.0fms %8.0fms %8.0fms %8.0fms %9s" % (
+                    datasource, size, label,
+                    percentile(refresh_times, 50) * 1000, percentile(refresh_times, 95) * 1000,
+                    percentile(refresh_times, 99) * 1000,
+                    sum(wall_times) / len(wall_times) * 1000, max(wall_times) * 1000,
+                    "%.1fms" % (max(held_times) * 1000) if held_times else "-")
+                sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
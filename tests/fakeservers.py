@@ -0,0 +1,427 @@
+#
+# Plugin for BigBrotherBot(B3) (www.bigbrotherbot.net)
+# Copyright (C) 2012 Courgette
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+Local stand-ins for the game servers and web services queried by the servermonitor plugin
+"""
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from b3.parsers.frostbite import protocol
+
+
+def is_lost(loss):
+    """
+    return True with a probability of 'loss'
+    """
+    return loss > 0 and random.random() < loss
+
+
+class FakeQuake3Server(threading.Thread):
+    """
+    UDP server answering getinfo and getstatus queries like a Quake3 game server would, echoing their challenge.
+    'latency' is the number of seconds to wait before replying and 'loss' the probability to ignore a query.
+
+    USAGE:
+        server = FakeQuake3Server(hostname="my server", mapname="ut4_casa")
+        server.start()
+        # query server.address
+        server.stop()
+    """
+    def __init__(self, replies=1, latency=0, loss=0, players=(), **cvars):
+        threading.Thread.__init__(self, name="FakeQuake3Server")
+        self.setDaemon(True)
+        self.cvars = cvars
+        self.replies = replies  # number of copies of each reply to send
+        self.latency = latency
+        self.loss = loss
+        self.players = players  # list of (score, ping, name)
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = "%s:%s" % self.sock.getsockname()
+
+    def infostring(self, challenge=None):
+        infostring = ''.join(['\\%s\\%s' % (k, v) for k, v in self.cvars.items()])
+        if challenge:
+            infostring += '\\challenge\\%s' % challenge
+        return infostring
+
+    def respond(self, query):
+        words = query[4:].split()
+        challenge = words[1] if len(words) > 1 else None
+        if query.startswith('\xff\xff\xff\xffgetinfo'):
+            return '\xff\xff\xff\xffinfoResponse\n' + self.infostring(challenge)
+        if query.startswith('\xff\xff\xff\xffgetstatus'):
+            return '\xff\xff\xff\xffstatusResponse\n' + self.infostring(challenge) + '\n' + ''.join(
+                ['%s %s "%s"\n' % player for player in self.players])
+
+    def run(self):
+        while True:
+            try:
+                data, source = self.sock.recvfrom(4096)
+            except socket.error:
+                return
+            self.queries.append(data)
+            if is_lost(self.loss):
+                continue
+            if self.latency:
+                time.sleep(self.latency)
+            response = self.respond(data)
+            if response is not None:
+                try:
+                    for i in range(self.replies):
+                        self.sock.sendto(response, source)
+                except socket.error:
+                    return  # stopped while replying
+
+    def stop(self):
+        self.sock.close()
+
+
+class FakeSourceServer(threading.Thread):
+    """
+    UDP server answering A2S_INFO queries like a Source engine game server would, optionally requiring a challenge.
+    'latency' is the number of seconds to wait before replying and 'loss' the probability to ignore a query.
+
+    USAGE:
+        server = FakeSourceServer(name="my server", map="de_dust2", players=3, max_players=16)
+        server.start()
+        # query server.address
+        server.stop()
+    """
+    CHALLENGE = 'C\x00\xffK'
+
+    def __init__(self, name="test server", map="de_dust2", players=0, max_players=16, challenge=False, latency=0,
+                 loss=0):
+        threading.Thread.__init__(self, name="FakeSourceServer")
+        self.setDaemon(True)
+        self.name = name
+        self.map = map
+        self.players = players
+        self.max_players = max_players
+        self.challenge = challenge
+        self.latency = latency
+        self.loss = loss
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = "%s:%s" % self.sock.getsockname()
+
+    def respond(self, query):
+        if not query.startswith('\xff\xff\xff\xffTSource Engine Query\x00'):
+            return None
+        if self.challenge and query[25:29] != self.CHALLENGE:
+            return '\xff\xff\xff\xffA' + self.CHALLENGE
+        return '\xff\xff\xff\xffI\x11' + '\x00'.join([self.name, self.map, 'cstrike', 'Counter-Strike: Source', '']) + \
+            struct.pack('<HBBBccBB', 240, self.players, self.max_players, 0, 'd', 'l', 0, 1) + '1.0.0.0\x00'
+
+    def run(self):
+        while True:
+            try:
+                data, source = self.sock.recvfrom(4096)
+            except socket.error:
+                return
+            self.queries.append(data)
+            if is_lost(self.loss):
+                continue
+            if self.latency:
+                time.sleep(self.latency)
+            response = self.respond(data)
+            if response is not None:
+                try:
+                    self.sock.sendto(response, source)
+                except socket.error:
+                    return  # stopped while replying
+
+    def stop(self):
+        self.sock.close()
+
+
+BF3_SERVER_INFO = ('BigBrotherBot #1 (NL)', '0', '16', 'ConquestSmall0', 'MP_001', '0', '1', '2', '250', '250', '0',
+                   '', 'true', 'false', 'false', '712096', '712083', '109.70.149.112:25200', '', 'true', 'EU', 'lhr',
+                   'GB', 'false')
+
+
+class FakeQuake3MasterServer(threading.Thread):
+    """
+    UDP server answering getservers queries like a Quake3 master server would, listing the given <ip:port> addresses
+    'per_packet' at a time over as many packets as needed. The last packet ends with the EOT marker unless 'eot' is
+    False.
+
+    USAGE:
+        master = FakeQuake3MasterServer(["127.0.0.1:27960", "127.0.0.1:27961"])
+        master.start()
+        # query master.address
+        master.stop()
+    """
+    def __init__(self, servers=(), per_packet=100, eot=True):
+        threading.Thread.__init__(self, name="FakeQuake3MasterServer")
+        self.setDaemon(True)
+        self.servers = list(servers)
+        self.per_packet = per_packet
+        self.eot = eot
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = "%s:%s" % self.sock.getsockname()
+
+    def packets(self):
+        entries = []
+        for address in self.servers:
+            ip, port = address.rsplit(':', 1)
+            entries.append('\\' + socket.inet_aton(ip) + struct.pack('!H', int(port)))
+        packets = []
+        for i in range(0, max(1, len(entries)), self.per_packet):
+            packets.append('\xff\xff\xff\xffgetserversResponse' + ''.join(entries[i:i + self.per_packet]))
+        if self.eot:
+            packets[-1] += '\\EOT\0\0\0'
+        return packets
+
+    def run(self):
+        while True:
+            try:
+                data, source = self.sock.recvfrom(4096)
+            except socket.error:
+                return
+            self.queries.append(data)
+            if data.startswith('\xff\xff\xff\xffgetservers '):
+                try:
+                    for packet in self.packets():
+                        self.sock.sendto(packet, source)
+                except socket.error:
+                    return  # stopped while replying
+
+    def stop(self):
+        self.sock.close()
+
+
+class FakeFrostbiteServer(threading.Thread):
+    """
+    TCP server answering serverInfo requests like the RCON interface of a BF3 game server would.
+    'latency' is the number of seconds to wait before replying and 'loss' the probability to drop the connection
+    instead of replying.
+
+    USAGE:
+        server = FakeFrostbiteServer()
+        server.start()
+        # query server.address
+        server.stop()
+    """
+    def __init__(self, server_info=BF3_SERVER_INFO, latency=0, loss=0):
+        threading.Thread.__init__(self, name="FakeFrostbiteServer")
+        self.setDaemon(True)
+        self.server_info = server_info
+        self.latency = latency
+        self.loss = loss
+        self.requests = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.address = "%s:%s" % self.listener.getsockname()
+        self._stopped = False
+
+    def respond(self, words):
+        if words[:1] == ['serverInfo']:
+            return ['OK'] + list(self.server_info)
+        return ['UnknownCommand']
+
+    def run(self):
+        # poll rather than select so that a benchmark can run more game servers than FD_SETSIZE file descriptors
+        poller = select.poll()
+        poller.register(self.listener, select.POLLIN)
+        sockets = {self.listener.fileno(): self.listener}
+        buffers = {}  # socket -> receive buffer
+        try:
+            while not self._stopped:
+                try:
+                    events = poller.poll(500)
+                except (select.error, socket.error):
+                    return
+                for fd, event in events:
+                    sock = sockets[fd]
+                    if sock is self.listener:
+                        try:
+                            connection = self.listener.accept()[0]
+                        except socket.error:
+                            return
+                        sockets[connection.fileno()] = connection
+                        buffers[connection] = ''
+                        poller.register(connection, select.POLLIN)
+                        continue
+                    try:
+                        data = sock.recv(4096)
+                    except socket.error:
+                        data = ''
+                    if data:
+                        buffers[sock] = self.handle(sock, buffers[sock] + data)
+                    if not data or buffers[sock] is None:
+                        poller.unregister(fd)
+                        del sockets[fd]
+                        del buffers[sock]
+                        sock.close()
+        finally:
+            for sock in buffers:
+                sock.close()
+
+    def handle(self, sock, receive_buffer):
+        """
+        reply to the complete packets found in the receive buffer and return what remains of it, or None if the
+        connection has to be dropped
+        """
+        while protocol.containsCompletePacket(receive_buffer):
+            size = protocol.DecodeInt32(receive_buffer[4:8])
+            packet, receive_buffer = receive_buffer[:size], receive_buffer[size:]
+            is_from_server, is_response, sequence, words = protocol.DecodePacket(packet)
+            self.requests.append(words)
+            if is_lost(self.loss):
+                return None
+            if self.latency:
+                time.sleep(self.latency)
+            sock.sendall(protocol.EncodePacket(False, True, sequence, self.respond(words)))
+        return receive_buffer
+
+    def stop(self):
+        self._stopped = True
+        self.listener.close()
+
+
+class BlackholeTCPServer(object):
+    """
+    TCP address which accepts connections (through the kernel backlog) but never answers, like a hung game server.
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.address = "%s:%s" % self.sock.getsockname()
+
+    def stop(self):
+        self.sock.close()
+
+
+def unused_udp_address():
+    """
+    return a <host:port> address nobody is listening to
+    """
+    return unused_address(socket.SOCK_DGRAM)
+
+
+def unused_tcp_address():
+    """
+    return a <host:port> address nobody accepts connections on
+    """
+    return unused_address(socket.SOCK_STREAM)
+
+
+def unused_address(socket_type):
+    sock = socket.socket(socket.AF_INET, socket_type)
+    sock.bind(('127.0.0.1', 0))
+    address = "%s:%s" % sock.getsockname()
+    sock.close()
+    return address
+
+
+class FakeGamemonitorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+        self.requests_handled = 0
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if is_lost(self.server.loss):
+            # drop the connection without answering
+            self.close_connection = 1
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.requests_handled += 1
+        if self.requests_handled == self.server.max_requests_per_connection:
+            self.close_connection = 1
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[1:] != ['data', 'server.js'] or parts[0] not in self.server.documents:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.server.documents[parts[0]]
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/javascript')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def end_headers(self):
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        BaseHTTPServer.BaseHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGamemonitorServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server serving game server documents like module.game-monitor.com does.
+    'latency' is the number of seconds to wait before answering a request and 'loss' the probability to drop the
+    connection instead of answering.
+
+    USAGE:
+        server = FakeGamemonitorServer({'1.2.3.4:27960': '={"error":0,"player":3}'})
+        server.start()
+        # download "http://%s/1.2.3.4:27960/data/server.js" % server.address
+        server.stop()
+    """
+    daemon_threads = True
+
+    def __init__(self, documents):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeGamemonitorHandler)
+        self.documents = documents
+        self.max_requests_per_connection = None
+        self.latency = 0
+        self.loss = 0
+        self.connections = 0
+        self.requests = []
+        self.address = "%s:%s" % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="FakeGamemonitorServer")
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
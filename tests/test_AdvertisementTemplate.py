@@ -0,0 +1,63 @@
+from unittest2 import TestCase
+from servermonitor import AdvertisementTemplate, ServerStatus
+
+
+class Test_AdvertisementTemplate(TestCase):
+
+    def test_keywords(self):
+        # WHEN
+        sut = AdvertisementTemplate("{address} : {map} {players}/{max_players} {players} {name}")
+        # THEN
+        self.assertTupleEqual(('address', 'map', 'players', 'max_players', 'name'), sut.keywords)
+
+    def test_compiled_once(self):
+        # WHEN
+        template1 = AdvertisementTemplate.compile("{address} : {name}")
+        template2 = AdvertisementTemplate.compile("{address} : {name}")
+        # THEN
+        self.assertIs(template1, template2)
+
+    def test_render(self):
+        # GIVEN
+        sut = AdvertisementTemplate("^7{address} ^0: ^4{map} ^5{players}^7/^5{max_players} ^4{name}")
+        # WHEN
+        text = sut.render(ServerStatus("1.2.3.4:27960", name="test", map="ut4_casa", players="2", max_players=12))
+        # THEN
+        self.assertEqual("^71.2.3.4:27960 ^0: ^4ut4_casa ^52^7/^512 ^4test", text)
+
+    def test_missing_fields(self):
+        # GIVEN
+        sut = AdvertisementTemplate("{address} : {map} [{gamemode}] {avg_ping}ms")
+        # WHEN
+        text = sut.render(ServerStatus("1.2.3.4:27960", map=""))
+        # THEN
+        self.assertEqual("1.2.3.4:27960 :  [?] ?ms", text)
+
+    def test_spec_conversion_and_index(self):
+        # GIVEN
+        sut = AdvertisementTemplate("{{{address}}} {players:>3}/{max_players:<3}|{name!r} {map[0]}")
+        # WHEN
+        text = sut.render(ServerStatus("1.2.3.4:27960", name="test", map="ut4_casa", players=2, max_players=12))
+        # THEN
+        self.assertEqual("{1.2.3.4:27960}   2/12 |'test' u", text)
+
+    def test_gamemode(self):
+        # WHEN
+        sut = AdvertisementTemplate("{address} [{gamemode}]")
+        # THEN
+        self.assertTupleEqual(('address', 'gamemode'), sut.keywords)
+
+    def test_unknown_keyword(self):
+        self.assertRaises(KeyError, AdvertisementTemplate, "{address} {f00}")
+
+    def test_positional_field(self):
+        self.assertRaises(KeyError, AdvertisementTemplate, "{address} {0}")
+
+    def test_missing_address(self):
+        self.assertRaises(ValueError, AdvertisementTemplate, "{name}")
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, AdvertisementTemplate, "{address} {")
+
+    def test_invalid_spec(self):
+        self.assertRaises(ValueError, AdvertisementTemplate, "{address} {players:d}")
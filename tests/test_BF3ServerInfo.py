@@ -1,9 +1,11 @@
 import socket
-from mock import Mock
+import time
+from mock import Mock, patch
 from unittest2 import TestCase
 from mockito import when
 import sys
-from servermonitor import BF3ServerInfo
+from servermonitor import BF3ServerInfo, FrostbiteConnectionPool
+from tests.fakeservers import BlackholeTCPServer
 import servermonitor
 
 class Test_BF3ServerInfo(TestCase):
@@ -55,3 +57,29 @@ class Test_BF3ServerInfo(TestCase):
         # THEN
         self.assertIsNone(sut.data)
         self.assertEqual('1.2.3.4:27960 : unknown', str(sut))
+
+
+class Test_BF3ServerInfo_hung_server(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.server = BlackholeTCPServer()
+        self.timeout_patcher = patch.object(FrostbiteConnectionPool, 'TIMEOUT', 0.5)
+        self.timeout_patcher.start()
+
+    def tearDown(self):
+        self.timeout_patcher.stop()
+        servermonitor.frostbite_pool.close(self.server.address)
+        self.server.stop()
+
+    def test_timeout(self):
+        # GIVEN
+        sut = BF3ServerInfo(self.console, self.server.address, "{address} : {map} {players}/{max_players} {name}")
+        # WHEN
+        start = time.time()
+        sut.update()
+        elapsed = time.time() - start
+        # THEN
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual('%s : down' % self.server.address, str(sut))
+        self.assertEqual(1, sut.stats.counts['timeout'])
+        self.assertEqual(0, sut.stats.counts['error'])
@@ -0,0 +1,80 @@
+import socket
+import time
+from mock import Mock
+from unittest2 import TestCase
+from servermonitor import DNSCache
+
+
+class Test_DNSCache(TestCase):
+    def setUp(self):
+        self.resolver = Mock(return_value="1.2.3.4")
+        self.sut = DNSCache(self.resolver)
+
+    def wait_for_refresh(self):
+        for i in range(20):
+            if not self.sut._refreshing:
+                return
+            time.sleep(.05)
+
+    def test_ip(self):
+        # WHEN
+        ip = self.sut.resolve("4.3.2.1")
+        # THEN
+        self.assertEqual("4.3.2.1", ip)
+        self.assertFalse(self.resolver.called)
+
+    def test_resolved_once(self):
+        # WHEN
+        ips = [self.sut.resolve("game.example.com") for i in range(3)]
+        # THEN
+        self.assertListEqual(["1.2.3.4"] * 3, ips)
+        self.resolver.assert_called_once_with("game.example.com")
+
+    def test_resolve_address(self):
+        self.assertEqual(("1.2.3.4", 27960), self.sut.resolve_address("game.example.com:27960"))
+
+    def test_unresolvable(self):
+        # GIVEN
+        self.resolver.side_effect = socket.gaierror("unknown host")
+        # WHEN
+        self.assertRaises(socket.gaierror, self.sut.resolve, "f00.invalid")
+        self.assertRaises(socket.gaierror, self.sut.resolve, "f00.invalid")
+        # THEN
+        self.assertEqual(1, self.resolver.call_count)
+
+    def test_stale_entry_is_refreshed_in_the_background(self):
+        # GIVEN
+        self.sut.resolve("game.example.com")
+        self.sut._entries["game.example.com"] = ("1.2.3.4", time.time() - DNSCache.TTL - 1)
+        self.resolver.return_value = "5.6.7.8"
+        # WHEN
+        ip = self.sut.resolve("game.example.com")
+        self.wait_for_refresh()
+        # THEN
+        self.assertEqual("1.2.3.4", ip)
+        self.assertEqual("5.6.7.8", self.sut.resolve("game.example.com"))
+        self.assertEqual(2, self.resolver.call_count)
+
+    def test_failed_refresh_keeps_last_ip(self):
+        # GIVEN
+        self.sut.resolve("game.example.com")
+        self.sut._entries["game.example.com"] = ("1.2.3.4", time.time() - DNSCache.TTL - 1)
+        self.resolver.side_effect = socket.gaierror("resolver down")
+        # WHEN
+        self.sut.resolve("game.example.com")
+        self.wait_for_refresh()
+        # THEN
+        self.assertEqual("1.2.3.4", self.sut.resolve("game.example.com"))
+        self.assertEqual(2, self.resolver.call_count)
+
+    def test_negative_entry_is_retried(self):
+        # GIVEN
+        self.resolver.side_effect = socket.gaierror("unknown host")
+        self.assertRaises(socket.gaierror, self.sut.resolve, "game.example.com")
+        self.sut._entries["game.example.com"] = (None, time.time() - DNSCache.NEGATIVE_TTL - 1)
+        self.resolver.side_effect = None
+        # WHEN
+        self.assertRaises(socket.gaierror, self.sut.resolve, "game.example.com")
+        self.wait_for_refresh()
+        # THEN
+        self.assertEqual("1.2.3.4", self.sut.resolve("game.example.com"))
@@ -0,0 +1,148 @@
+import socket
+import threading
+import time
+from mock import Mock
+from unittest2 import TestCase
+from servermonitor import FrostbiteConnectionPool
+from tests.fakeservers import FakeFrostbiteServer, BlackholeTCPServer, BF3_SERVER_INFO
+
+
+class Test_FrostbiteConnectionPool(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.connections = []
+        self.connection_factory = Mock(side_effect=self.new_connection)
+        self.sut = FrostbiteConnectionPool(self.connection_factory)
+
+    def new_connection(self, console, host, port):
+        connection = Mock()
+        connection.sendRequest.return_value = ['OK', 'server name']
+        self.connections.append(connection)
+        return connection
+
+    def test_connection_is_reused(self):
+        # WHEN
+        response1 = self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        response2 = self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        # THEN
+        self.assertListEqual(['OK', 'server name'], response1)
+        self.assertListEqual(['OK', 'server name'], response2)
+        self.connection_factory.assert_called_once_with(self.console, "1.2.3.4", 47200)
+        self.assertEqual(2, self.connections[0].sendRequest.call_count)
+
+    def test_one_connection_per_address(self):
+        # WHEN
+        self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        self.sut.send_request(self.console, "1.2.3.4:47201", 'serverInfo')
+        # THEN
+        self.assertEqual(2, len(self.connections))
+
+    def test_reconnect_when_connection_dropped(self):
+        # GIVEN
+        self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        self.connections[0].sendRequest.side_effect = socket.error("connection reset by peer")
+        # WHEN
+        response = self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        # THEN
+        self.assertListEqual(['OK', 'server name'], response)
+        self.assertEqual(2, len(self.connections))
+        self.assertTrue(self.connections[0].abort.called)
+        self.assertFalse(self.connections[0].close.called)
+
+    def test_backoff(self):
+        # GIVEN
+        self.connection_factory.side_effect = socket.error("connection refused")
+        self.assertRaises(socket.error, self.sut.send_request, self.console, "1.2.3.4:47200", 'serverInfo')
+        # WHEN
+        self.assertRaises(socket.timeout, self.sut.send_request, self.console, "1.2.3.4:47200", 'serverInfo')
+        # THEN
+        self.assertEqual(1, self.connection_factory.call_count)
+
+    def test_backoff_grows(self):
+        # GIVEN
+        self.connection_factory.side_effect = socket.error("connection refused")
+        slot = self.sut._get_slot("1.2.3.4:47200")
+        # WHEN
+        delays = []
+        for i in range(4):
+            slot.retry_at = 0
+            self.assertRaises(socket.error, self.sut.send_request, self.console, "1.2.3.4:47200", 'serverInfo')
+            delays.append(int(round(slot.retry_at - time.time())))
+        # THEN
+        self.assertListEqual([5, 10, 20, 40], delays)
+
+    def test_concurrent_callers_are_serialized(self):
+        # GIVEN
+        active = []
+        overlaps = []
+
+        def slow_request(*words):
+            if active:
+                overlaps.append(words)
+            active.append(words)
+            time.sleep(.05)
+            active.remove(words)
+            return ['OK']
+        self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        self.connections[0].sendRequest.side_effect = slow_request
+        # WHEN
+        threads = [threading.Thread(target=self.sut.send_request, args=(self.console, "1.2.3.4:47200", 'serverInfo'))
+                   for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # THEN
+        self.assertListEqual([], overlaps)
+        self.assertEqual(1, len(self.connections))
+
+    def test_close_all(self):
+        # GIVEN
+        self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        # WHEN
+        self.sut.close_all()
+        # THEN
+        self.assertTrue(self.connections[0].close.called)
+        self.sut.send_request(self.console, "1.2.3.4:47200", 'serverInfo')
+        self.assertEqual(2, len(self.connections))
+
+
+class Test_FrostbiteConnectionPool_network(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.sut = FrostbiteConnectionPool()
+        self.server = FakeFrostbiteServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.sut.close_all()
+        self.server.stop()
+
+    def test_server_info(self):
+        # WHEN
+        response1 = self.sut.send_request(self.console, self.server.address, 'serverInfo')
+        response2 = self.sut.send_request(self.console, self.server.address, 'serverInfo')
+        # THEN
+        self.assertListEqual(['OK'] + list(BF3_SERVER_INFO), response1)
+        self.assertListEqual(response1, response2)
+        self.assertListEqual([['serverInfo'], ['serverInfo']], self.server.requests)
+
+
+class Test_FrostbiteConnectionPool_hung_server(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.sut = FrostbiteConnectionPool()
+        self.server = BlackholeTCPServer()
+
+    def tearDown(self):
+        self.sut.close_all()
+        self.server.stop()
+
+    def test_failed_connection_is_dropped_without_quit(self):
+        # WHEN
+        start = time.time()
+        self.assertRaises(Exception, self.sut.send_request, self.console, self.server.address, 'serverInfo')
+        elapsed = time.time() - start
+        # THEN
+        self.assertLess(elapsed, FrostbiteConnectionPool.TIMEOUT + 1)
+        self.assertIsNone(self.sut._slots[self.server.address].connection)
@@ -0,0 +1,112 @@
+import sys
+from mock import Mock
+from mockito import when
+from unittest2 import TestCase
+from servermonitor import BF4ServerInfo, BFHServerInfo, FrostbiteServerInfoDecoder, FrostbiteServerStatus, \
+    FROSTBITE2_TAIL_FIELDS
+
+
+class Test_FrostbiteServerInfoDecoder(TestCase):
+    def setUp(self):
+        self.sut = FrostbiteServerInfoDecoder(FROSTBITE2_TAIL_FIELDS, {'MP_001': 'Grand Bazaar'},
+                                              {'ConquestSmall0': 'Conquest'})
+
+    def test_nominal(self):
+        # WHEN
+        status = self.sut.decode(['BigBrotherBot #1 (NL)', '0', '16', 'ConquestSmall0', 'MP_001', '0', '1', '2', '250',
+                                  '240', '0', '', 'true', 'false', 'false', '712096', '712083',
+                                  '109.70.149.112:25200', '', 'true', 'EU', 'lhr', 'GB'])
+        # THEN
+        self.assertIsInstance(status, FrostbiteServerStatus)
+        self.assertEqual('BigBrotherBot #1 (NL)', status.name)
+        self.assertEqual('Grand Bazaar', status['map'])
+        self.assertEqual('Conquest', status['gamemode'])
+        self.assertEqual('250', status['team1score'])
+        self.assertEqual('240', status['team2score'])
+        self.assertIsNone(status['team3score'])
+        self.assertEqual('0', status['targetScore'])
+        self.assertEqual('GB', status['country'])
+        self.assertIsNone(status['matchMakingEnabled'])
+
+    def test_no_team(self):
+        # WHEN
+        status = self.sut.decode(['name', '0', '16', 'ConquestSmall0', 'MP_001', '0', '1', '0', '100', 'NotConnected'])
+        # THEN
+        self.assertIsNone(status['team1score'])
+        self.assertEqual('100', status['targetScore'])
+        self.assertEqual('NotConnected', status['onlineState'])
+        self.assertIsNone(status['isRanked'])
+
+    def test_unknown_map_and_gamemode(self):
+        # WHEN
+        status = self.sut.decode(['name', '0', '16', 'f00', 'MP_999', '0', '1', '0', '100'])
+        # THEN
+        self.assertEqual('MP_999', status['map'])
+        self.assertEqual('f00', status['gamemode'])
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, self.sut.decode, 'f00')
+        self.assertRaises(ValueError, self.sut.decode, ['name', '0', '16'])
+        self.assertRaises(ValueError, self.sut.decode, ['name', '0', '16', 'f00', 'MP_999', '0', '1', 'x', '100'])
+        self.assertRaises(ValueError, self.sut.decode, ['name', '0', '16', 'f00', 'MP_999', '0', '1', '9', '100'])
+
+
+class Test_FrostbiteServerStatus(TestCase):
+
+    def test_mapping(self):
+        # GIVEN
+        status = FrostbiteServerStatus()
+        status.name = "my server"
+        # THEN
+        self.assertIn('name', status)
+        self.assertIn('region', status)
+        self.assertNotIn('f00', status)
+        self.assertEqual("my server", status.get('name'))
+        self.assertIsNone(status.get('region'))
+        self.assertEqual("?", status.get('f00', "?"))
+        self.assertRaises(KeyError, status.__getitem__, 'f00')
+        self.assertEqual("my server", "{name}".format(**status))
+        self.assertEqual(dict(status.items()), dict(status))
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, FrostbiteServerStatus(), 'f00', 1)
+
+
+class Test_BF4ServerInfo(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.console.error = lambda x: sys.stderr.write('ERROR: %s\n' % x)
+
+    def test_nominal(self):
+        # GIVEN
+        sut = BF4ServerInfo(self.console, "1.2.3.4:47200", "{address} : {map} [{gamemode}] {players}/{max_players} {name}")
+        when(sut).frostbite_info().thenReturn(
+            ['BigBrotherBot #2', '3', '64', 'ConquestLarge0', 'MP_Abandoned', '0', '2', '2', '300', '300', '0', '',
+             'true', 'true', 'false', '5148', '455', '1.2.3.4:25200', 'v1.826 | A1.386 C2.351', 'true', 'EU', 'ams',
+             'NL', 'false', '0', 'None'])
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertDictContainsSubset({'address': '1.2.3.4:47200', 'map': 'Zavod 311', 'gamemode': 'Conquest64',
+                                       'country': 'NL', 'blazeGameState': 'None'}, sut.data)
+        self.assertEqual('1.2.3.4:47200 : Zavod 311 [Conquest64] 3/64 BigBrotherBot #2', str(sut))
+        self.assertEqual(('BigBrotherBot #2', 'Zavod 311', 'Conquest64', 3, 64),
+                         (sut.status.name, sut.status.map, sut.status.gamemode, sut.status.players,
+                          sut.status.max_players))
+
+
+class Test_BFHServerInfo(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.console.error = lambda x: sys.stderr.write('ERROR: %s\n' % x)
+
+    def test_nominal(self):
+        # GIVEN
+        sut = BFHServerInfo(self.console, "1.2.3.4:47200", "{address} : {map} [{gamemode}] {players}/{max_players}")
+        when(sut).frostbite_info().thenReturn(
+            ['BigBrotherBot #3', '5', '32', 'Hotwire0', 'MP_Desert05', '0', '2', '0', '0', '', 'true', 'true', 'false',
+             '5148', '455'])
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('1.2.3.4:47200 : Dust Bowl [Hotwire] 5/32', str(sut))
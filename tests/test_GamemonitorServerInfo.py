@@ -1,9 +1,10 @@
 import socket
+import urllib2
 from mock import Mock
 from unittest2 import TestCase
-from mockito import when
+from mockito import when, unstub
 import sys
-from servermonitor import GamemonitorServerInfo
+from servermonitor import GamemonitorServerInfo, HTTPDocument
 import servermonitor
 
 class Test_GamemonitorServerInfo(TestCase):
@@ -11,6 +12,9 @@ class Test_GamemonitorServerInfo(TestCase):
         self.console = Mock()
         self.console.error = lambda x: sys.stderr.write('ERROR: %s\n' % x)
 
+    def tearDown(self):
+        unstub()
+
     def test_nominal(self):
         # GIVEN
         sut = GamemonitorServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players} {name}")
@@ -55,3 +59,53 @@ class Test_GamemonitorServerInfo(TestCase):
         # THEN
         self.assertIsNone(sut.data)
         self.assertEqual('1.2.3.4:27960 : unknown', str(sut))
+
+    def test_not_modified(self):
+        # GIVEN
+        url = "http://module.game-monitor.com/1.2.3.4:27960/data/server.js"
+        sut = GamemonitorServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).http_get(url).thenReturn(HTTPDocument(
+            """={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","error":0}""",
+            etag='"f00"'))
+        sut.update()
+        when(servermonitor).http_get(url, etag='"f00"').thenRaise(urllib2.HTTPError(url, 304, "Not Modified", {}, None))
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(15, sut.data['player'])
+        self.assertEqual('1.2.3.4:27960 :  15/20 test server 1.2.3.4', str(sut))
+
+    def test_modified(self):
+        # GIVEN
+        url = "http://module.game-monitor.com/1.2.3.4:27960/data/server.js"
+        sut = GamemonitorServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).http_get(url).thenReturn(HTTPDocument(
+            """={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","error":0}""",
+            etag='"f00"'))
+        sut.update()
+        when(servermonitor).http_get(url, etag='"f00"').thenReturn(HTTPDocument(
+            """={"ip":"1.2.3.4","port":27960,"player":16,"maxplayer":20,"name":"test server 1.2.3.4","error":0}""",
+            etag='"bar"'))
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('1.2.3.4:27960 :  16/20 test server 1.2.3.4', str(sut))
+        self.assertDictEqual({'etag': '"bar"'}, sut.validators)
+
+    def test_update_many(self):
+        # GIVEN
+        sut1 = GamemonitorServerInfo(self.console, "1.2.3.4:27960", "{address} : {players}/{max_players} {name}")
+        sut2 = GamemonitorServerInfo(self.console, "1.2.3.4:27961", "{address} : {players}/{max_players} {name}")
+        when(servermonitor).http_get_many([
+            ("http://module.game-monitor.com/1.2.3.4:27960/data/server.js", {}),
+            ("http://module.game-monitor.com/1.2.3.4:27961/data/server.js", {}),
+        ]).thenReturn([
+            """={"player":15,"maxplayer":20,"name":"test server 1","error":0}""",
+            socket.timeout(),
+        ])
+        # WHEN
+        GamemonitorServerInfo.update_many([sut1, sut2])
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : 15/20 test server 1', str(sut1))
+        self.assertEqual('1.2.3.4:27961 : unknown', str(sut2))
+        self.assertIsNotNone(sut2.last_update)
@@ -0,0 +1,56 @@
+from unittest2 import TestCase
+from servermonitor import LatencyTracker
+
+
+class Test_LatencyTracker(TestCase):
+    def setUp(self):
+        self.sut = LatencyTracker()
+
+    def test_no_sample(self):
+        # THEN
+        self.assertIsNone(self.sut.percentile(99))
+        self.assertEqual(3, self.sut.timeout(3))
+
+    def test_not_enough_samples(self):
+        # WHEN
+        self.sut.add(.1)
+        # THEN
+        self.assertEqual(3, self.sut.timeout(3))
+
+    def test_percentile(self):
+        # WHEN
+        for i in range(1, 11):
+            self.sut.add(i / 10.0)
+        # THEN
+        self.assertEqual(.5, self.sut.percentile(50))
+        self.assertEqual(1, self.sut.percentile(99))
+        self.assertEqual(.1, self.sut.percentile(1))
+
+    def test_only_recent_samples_are_kept(self):
+        # WHEN
+        self.sut.add(10)
+        for i in range(LatencyTracker.SAMPLES):
+            self.sut.add(.1)
+        # THEN
+        self.assertEqual(.1, self.sut.percentile(100))
+
+    def test_timeout_follows_rtt(self):
+        # WHEN
+        for i in range(10):
+            self.sut.add(.3)
+        # THEN
+        self.assertAlmostEqual(.9, self.sut.timeout(3))
+
+    def test_timeout_min(self):
+        # WHEN
+        for i in range(10):
+            self.sut.add(.01)
+        # THEN
+        self.assertEqual(LatencyTracker.MIN_TIMEOUT, self.sut.timeout(3))
+
+    def test_timeout_max(self):
+        # WHEN
+        for i in range(10):
+            self.sut.add(2)
+        # THEN
+        self.assertEqual(3, self.sut.timeout(3))
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest2 import TestCase
+from servermonitor import PlayerCountHistory, parse_duration
+
+
+class Test_PlayerCountHistory(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".history")
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_empty(self):
+        # WHEN
+        sut = PlayerCountHistory(capacity=4)
+        # THEN
+        self.assertEqual(0, len(sut))
+        self.assertListEqual([], sut.samples())
+        self.assertIsNone(sut.summary(0))
+
+    def test_samples_are_most_recent_first(self):
+        # GIVEN
+        sut = PlayerCountHistory(capacity=4)
+        # WHEN
+        sut.record(1000, 2, 12, True)
+        sut.record(1060, None, None, False)
+        # THEN
+        self.assertListEqual([(1060, None, None, False), (1000, 2, 12, True)], sut.samples())
+
+    def test_ring(self):
+        # GIVEN
+        sut = PlayerCountHistory(capacity=3)
+        # WHEN
+        for i in range(5):
+            sut.record(1000 + i, i, 12, True)
+        # THEN
+        self.assertEqual(3, len(sut))
+        self.assertListEqual([4, 3, 2], [players for timestamp, players, max_players, up in sut.samples()])
+
+    def test_summary(self):
+        # GIVEN
+        sut = PlayerCountHistory(capacity=10)
+        sut.record(1000, 10, 12, True)
+        sut.record(2000, 2, 12, True)
+        sut.record(2060, None, None, False)
+        sut.record(2120, 4, 12, True)
+        sut.record(2180, 6, 12, True)
+        # THEN
+        self.assertEqual((2, 4.0, 6, 0.75), sut.summary(2000))
+        self.assertEqual((2, 5.5, 10, 0.8), sut.summary(0))
+        self.assertEqual((6, 6.0, 6, 1.0), sut.summary(2150))
+        self.assertIsNone(sut.summary(3000))
+
+    def test_summary_down(self):
+        # GIVEN
+        sut = PlayerCountHistory(capacity=10)
+        sut.record(1000, None, None, False)
+        # THEN
+        self.assertEqual((None, None, None, 0.0), sut.summary(0))
+
+    def test_persistence(self):
+        # GIVEN
+        sut = PlayerCountHistory(self.path, capacity=3)
+        for i in range(4):
+            sut.record(1000 + i, i, 12, True)
+        sut.close()
+        # WHEN
+        sut = PlayerCountHistory(self.path, capacity=3)
+        sut.record(1004, 4, 12, True)
+        # THEN
+        self.assertListEqual([(1004, 4, 12, True), (1003, 3, 12, True), (1002, 2, 12, True)], sut.samples())
+        sut.close()
+
+    def test_capacity_change_starts_over(self):
+        # GIVEN
+        sut = PlayerCountHistory(self.path, capacity=3)
+        sut.record(1000, 1, 12, True)
+        sut.close()
+        # WHEN
+        sut = PlayerCountHistory(self.path, capacity=5)
+        # THEN
+        self.assertEqual(0, len(sut))
+        sut.close()
+
+    def test_junk_file_starts_over(self):
+        # GIVEN
+        f = open(self.path, 'wb')
+        f.write('f00' * 100)
+        f.close()
+        # WHEN
+        sut = PlayerCountHistory(self.path, capacity=3)
+        # THEN
+        self.assertEqual(0, len(sut))
+        sut.close()
+
+    def test_player_counts_are_clamped(self):
+        # GIVEN
+        sut = PlayerCountHistory(capacity=3)
+        # WHEN
+        sut.record(1000, 100000, 100000, True)
+        # THEN
+        self.assertListEqual([(1000, 0x7FFF, 0x7FFF, True)], sut.samples())
+
+
+class Test_parse_duration(TestCase):
+    def test_nominal(self):
+        self.assertEqual(90, parse_duration("90s"))
+        self.assertEqual(1800, parse_duration("30m"))
+        self.assertEqual(3600, parse_duration("1H"))
+        self.assertEqual(86400, parse_duration(" 1d "))
+        self.assertEqual(604800, parse_duration("1w"))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_duration, "")
+        self.assertRaises(ValueError, parse_duration, "1")
+        self.assertRaises(ValueError, parse_duration, "0h")
+        self.assertRaises(ValueError, parse_duration, "1y")
@@ -1,9 +1,9 @@
 import socket
 from mock import Mock
 from unittest2 import TestCase
-from mockito import when
+from mockito import when, unstub
 import sys
-from servermonitor import Quake3ServerInfo
+from servermonitor import Quake3ServerInfo, PlayerCountHistory, parse_infostring, parse_status_players
 import servermonitor
 
 class Test_Quake3ServerInfo(TestCase):
@@ -11,6 +11,9 @@ class Test_Quake3ServerInfo(TestCase):
         self.console = Mock()
         self.console.error = lambda x: sys.stderr.write('ERROR: %s\n' % x)
 
+    def tearDown(self):
+        unstub()
+
     def test_nominal(self):
         # GIVEN
         sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players} {name}")
@@ -33,6 +36,9 @@ class Test_Quake3ServerInfo(TestCase):
             'sv_maxclients': '12'},
             sut.data)
         self.assertEqual('1.2.3.4:27960 : ut4_casa 2/12 Test server name', str(sut))
+        self.assertEqual(('1.2.3.4:27960', 'Test server name', 'ut4_casa', 2, 12),
+                         (sut.status.address, sut.status.name, sut.status.map, sut.status.players,
+                          sut.status.max_players))
 
     def test_timeout(self):
         # GIVEN
@@ -78,3 +84,167 @@ class Test_Quake3ServerInfo(TestCase):
             'pb': '0',
         }, sut.data)
         self.assertEqual('1.2.3.4:27960 : mp_crossfire ?/22 ^4#^7Lf^1. TDM ^2HC ^4F^7R^1A', str(sut))
+
+    def test_update_many(self):
+        # GIVEN
+        sut1 = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players} {name}")
+        sut2 = Quake3ServerInfo(self.console, "1.2.3.4:27961", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\Test server name'})
+        # WHEN
+        Quake3ServerInfo.update_many([sut1, sut2])
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : ut4_casa 2/12 Test server name', str(sut1))
+        self.assertEqual('1.2.3.4:27961 : down', str(sut2))
+        self.assertIsNotNone(sut1.last_update)
+        self.assertIsNotNone(sut2.last_update)
+
+    def test_advertised_only(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {map} {players}/{max_players}",
+                               advertised_only=True)
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffinfoResponse\n\\modversion\\4.2.009\\game\\q3ut4\\auth\\1\\pure\\1\\gametype\\4\\sv_maxcli'
+            'ents\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\Test server name\\protocol\\68')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('Test server name', sut.data['hostname'])
+        self.assertEqual('Test server name', sut.status.name)
+        self.assertEqual('1.2.3.4:27960 : ut4_casa 2/12', str(sut))
+
+    def test_advertised_only_keeps_player_counts(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} {name}", advertised_only=True)
+        sut.player_history = PlayerCountHistory()
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffinfoResponse\n\\modversion\\4.2.009\\game\\q3ut4\\auth\\1\\pure\\1\\gametype\\4\\sv_maxcli'
+            'ents\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\Test server name\\protocol\\68')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('1.2.3.4:27960 Test server name', str(sut))
+        self.assertEqual((2, 12), (sut.status.players, sut.status.max_players))
+        self.assertEqual((2, 2.0, 2, 1.0), sut.player_history.summary(0))
+
+    def test_getstatus(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960",
+                               "{address} : {map} {players}/{max_players} {name} {avg_ping}ms {top_player}",
+                               advertised_only=True, query='getstatus')
+        when(servermonitor).quake3_status("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffstatusResponse\n\\sv_maxclients\\12\\mapname\\ut4_casa\\sv_hostname\\Test server '
+            'name\\g_gametype\\4\n5 50 "Joe"\n12 70 "Jack"\n-1 30 "Averell"\n')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertDictEqual({'mapname': 'ut4_casa', 'sv_maxclients': '12', 'sv_hostname': 'Test server name',
+                              'g_gametype': '4'}, sut.data)
+        self.assertEqual('1.2.3.4:27960 : ut4_casa 3/12 Test server name 50ms Jack', str(sut))
+
+    def test_getstatus_empty_server(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {players} {avg_ping} {top_player}",
+                               query='getstatus')
+        when(servermonitor).quake3_status("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffstatusResponse\n\\sv_maxclients\\12\\mapname\\ut4_casa\n')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : 0 ? ?', str(sut))
+
+    def test_getinfo_has_no_player_keywords(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {players} {avg_ping} {top_player}")
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\12\\clients\\2')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : 2 ? ?', str(sut))
+
+    def test_update_many_getstatus(self):
+        # GIVEN
+        sut1 = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {players} {top_player}", query='getstatus')
+        sut2 = Quake3ServerInfo(self.console, "1.2.3.4:27961", "{address} : {players}")
+        when(servermonitor).quake3_status_many(["1.2.3.4:27960"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffstatusResponse\n\\mapname\\ut4_casa\n3 50 "Joe"\n'})
+        when(servermonitor).quake3_info_many(["1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27961": '\xff\xff\xff\xffinfoResponse\n\\clients\\5'})
+        # WHEN
+        Quake3ServerInfo.update_many([sut1, sut2])
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : 1 Joe', str(sut1))
+        self.assertEqual('1.2.3.4:27961 : 5', str(sut2))
+
+    def test_stats(self):
+        # GIVEN
+        sut = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {players}")
+        response = servermonitor.UDPResponse('\xff\xff\xff\xffinfoResponse\n\\clients\\2')
+        response.rtt = 0.04
+        # WHEN
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn(response)
+        sut.update()
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenRaise(socket.timeout)
+        sut.update()
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn('f00')
+        sut.update()
+        # THEN
+        self.assertEqual(3, sut.stats.queries)
+        self.assertDictEqual({'success': 1, 'timeout': 1, 'parse_error': 1, 'error': 0}, sut.stats.counts)
+        self.assertEqual(1, sut.stats.histogram[1])  # the round trip time of the response was recorded
+
+    def test_update_many_stats(self):
+        # GIVEN
+        sut1 = Quake3ServerInfo(self.console, "1.2.3.4:27960", "{address} : {players}")
+        sut2 = Quake3ServerInfo(self.console, "1.2.3.4:27961", "{address} : {players}")
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\clients\\2'})
+        # WHEN
+        Quake3ServerInfo.update_many([sut1, sut2])
+        # THEN
+        self.assertEqual(1, sut1.stats.counts['success'])
+        self.assertEqual(1, sut2.stats.counts['timeout'])
+
+    def test_unknown_query(self):
+        self.assertRaises(ValueError, Quake3ServerInfo, self.console, "1.2.3.4:27960", "{address}", query='f00')
+
+
+class Test_parse_status_players(TestCase):
+
+    def test_empty(self):
+        players = parse_status_players([])
+        self.assertEqual(0, len(players))
+        self.assertIsNone(players.average_ping())
+        self.assertIsNone(players.top_player())
+
+    def test_nominal(self):
+        players = parse_status_players(['5 50 "Joe"', '12 999 "Jack Dalton"', '-3 0 "Averell"', ''])
+        self.assertEqual(3, len(players))
+        self.assertListEqual([5, 12, -3], list(players.scores))
+        self.assertListEqual([50, 999, 0], list(players.pings))
+        self.assertListEqual(['Joe', 'Jack Dalton', 'Averell'], players.names)
+        self.assertEqual(349, players.average_ping())
+        self.assertEqual('Jack Dalton', players.top_player())
+
+    def test_malformed_lines(self):
+        players = parse_status_players(['f00', 'a b "Joe"', '1 2'])
+        self.assertEqual(0, len(players))
+
+
+class Test_parse_infostring(TestCase):
+
+    def test_empty(self):
+        self.assertDictEqual({}, parse_infostring(''))
+        self.assertDictEqual({}, parse_infostring('\xff\xff\xff\xffinfoResponse\n'))
+
+    def test_nominal(self):
+        self.assertDictEqual({'sv_maxclients': '12', 'clients': '2'},
+                             parse_infostring('\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\12\\clients\\2'))
+
+    def test_empty_value(self):
+        self.assertDictEqual({'sv_maxclients': '', 'clients': '2'},
+                             parse_infostring('\\sv_maxclients\\\\clients\\2'))
+
+    def test_missing_last_value(self):
+        self.assertDictEqual({'sv_maxclients': '12'}, parse_infostring('\\sv_maxclients\\12\\clients'))
@@ -0,0 +1,73 @@
+from unittest2 import TestCase
+from servermonitor import QueryStats
+
+
+class Test_QueryStats(TestCase):
+
+    def test_nothing_recorded(self):
+        # GIVEN
+        sut = QueryStats()
+        # THEN
+        self.assertEqual(0, sut.queries)
+        self.assertIsNone(sut.percentile(50))
+        self.assertEqual("no query", sut.summary())
+
+    def test_record(self):
+        # GIVEN
+        sut = QueryStats()
+        # WHEN
+        sut.record('success', 0.01)
+        sut.record('success', 0.04)
+        sut.record('timeout', 3)
+        sut.record('parse_error', 0.02)
+        # THEN
+        self.assertEqual(4, sut.queries)
+        self.assertDictEqual({'success': 2, 'timeout': 1, 'parse_error': 1, 'error': 0}, sut.counts)
+        self.assertListEqual([2, 1, 0, 0, 0, 0, 0, 1, 0], sut.histogram)
+        self.assertEqual(3, sut.max_time)
+        self.assertEqual("4 queries, 2 ok, 1 timeouts, 1 parse errors, 0 errors, p50 25ms, p95 5000ms, max 3000ms",
+                         sut.summary())
+
+    def test_percentile(self):
+        # GIVEN
+        sut = QueryStats()
+        for i in range(90):
+            sut.record('success', 0.03)
+        for i in range(10):
+            sut.record('success', 0.3)
+        # THEN
+        self.assertEqual(0.05, sut.percentile(50))
+        self.assertEqual(0.05, sut.percentile(90))
+        self.assertEqual(0.5, sut.percentile(95))
+
+    def test_percentile_above_last_bucket(self):
+        # GIVEN
+        sut = QueryStats()
+        sut.record('timeout', 12)
+        # THEN
+        self.assertEqual(12, sut.percentile(99))
+
+    def test_parent(self):
+        # GIVEN
+        parent = QueryStats()
+        sut1 = QueryStats(parent)
+        sut2 = QueryStats(parent)
+        # WHEN
+        sut1.record('success', 0.01)
+        sut2.record('timeout', 3)
+        # THEN
+        self.assertEqual(1, sut1.queries)
+        self.assertEqual(1, sut2.queries)
+        self.assertEqual(2, parent.queries)
+        self.assertDictEqual({'success': 1, 'timeout': 1, 'parse_error': 0, 'error': 0}, parent.counts)
+
+    def test_as_dict(self):
+        # GIVEN
+        sut = QueryStats()
+        sut.record('success', 0.01)
+        # WHEN
+        data = sut.as_dict()
+        # THEN
+        self.assertDictContainsSubset({'queries': 1, 'success': 1, 'timeout': 0, 'p50': 0.025, 'max_time': 0.01}, data)
+        self.assertEqual(1, data['histogram']['0.025'])
+        self.assertEqual(0, data['histogram']['inf'])
@@ -0,0 +1,437 @@
+import threading
+import time
+from mock import Mock
+from unittest2 import TestCase
+from servermonitor import ServerInfo, CircuitBreaker, ServerStatus
+
+
+class CountingServerInfo(ServerInfo):
+    """
+    ServerInfo counting the queries sent to the game server
+    """
+    def __init__(self, console, address, cache_ttl=0, delay=0):
+        ServerInfo.__init__(self, console, address, "{address}", cache_ttl)
+        self.delay = delay
+        self.queries = 0
+
+    def _update(self):
+        self.queries += 1
+        time.sleep(self.delay)
+        self.info = "%s : query #%s" % (self.address, self.queries)
+        self._data = {'queries': self.queries}
+
+
+class DeadServerInfo(ServerInfo):
+    """
+    ServerInfo for a game server which does not answer
+    """
+    def __init__(self, console, address):
+        ServerInfo.__init__(self, console, address, "{address}")
+        self.queries = 0
+
+    def _update(self):
+        self.queries += 1
+        self._data = None
+        self.info = "%s : down" % self.address
+
+
+class Test_ServerInfo_cache(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_no_cache(self):
+        # GIVEN
+        sut = CountingServerInfo(self.console, "1.2.3.4:27960", cache_ttl=0)
+        # WHEN
+        sut.update()
+        sut.update()
+        # THEN
+        self.assertEqual(2, sut.queries)
+
+    def test_fresh(self):
+        # GIVEN
+        sut = CountingServerInfo(self.console, "1.2.3.4:27960", cache_ttl=10)
+        # WHEN
+        sut.update()
+        sut.update()
+        # THEN
+        self.assertEqual(1, sut.queries)
+        self.assertEqual("1.2.3.4:27960 : query #1", str(sut))
+
+    def test_expired(self):
+        # GIVEN
+        sut = CountingServerInfo(self.console, "1.2.3.4:27960", cache_ttl=10)
+        sut.update()
+        sut.last_update -= 11
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(2, sut.queries)
+        self.assertEqual("1.2.3.4:27960 : query #2", str(sut))
+
+    def test_concurrent_updates_are_coalesced(self):
+        # GIVEN
+        sut = CountingServerInfo(self.console, "1.2.3.4:27960", cache_ttl=0, delay=.3)
+        threads = [threading.Thread(target=sut.update) for i in range(5)]
+        # WHEN
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # THEN
+        self.assertEqual(1, sut.queries)
+
+    def test_update_many_skips_fresh_servers(self):
+        # GIVEN
+        fresh = CountingServerInfo(self.console, "1.2.3.4:27960", cache_ttl=10)
+        fresh.update()
+        expired = CountingServerInfo(self.console, "1.2.3.4:27961", cache_ttl=10)
+        # WHEN
+        CountingServerInfo.update_many([fresh, expired])
+        # THEN
+        self.assertEqual(1, fresh.queries)
+        self.assertEqual(1, expired.queries)
+
+
+class Test_ServerInfo_circuit_breaker(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_few_failures(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        # WHEN
+        sut.update()
+        sut.update()
+        # THEN
+        self.assertEqual(2, sut.queries)
+        self.assertEqual("1.2.3.4:27960 : down", str(sut))
+
+    def test_open_circuit(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            sut.update()
+        # WHEN
+        sut.update()
+        sut.update()
+        # THEN
+        self.assertEqual(CircuitBreaker.FAILURES_THRESHOLD, sut.queries)
+        self.assertEqual("1.2.3.4:27960 : down", str(sut))
+
+    def test_last_seen(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        sut.breaker.record_success()
+        sut.breaker.last_seen -= 7200
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            sut.update()
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual("1.2.3.4:27960 : down (last seen 2h ago)", str(sut))
+
+    def test_retry(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            sut.update()
+        sut.breaker.retry_at = time.time() - 1
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(CircuitBreaker.FAILURES_THRESHOLD + 1, sut.queries)
+
+    def test_backoff_grows(self):
+        # GIVEN
+        sut = CircuitBreaker()
+        # WHEN
+        delays = []
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD + 3):
+            sut.record_failure()
+            if sut.is_open():
+                delays.append(int(round(sut.retry_at - time.time())))
+        # THEN
+        self.assertListEqual([30, 60, 120, 240], delays)
+
+    def test_success_closes_circuit(self):
+        # GIVEN
+        sut = CircuitBreaker()
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            sut.record_failure()
+        # WHEN
+        sut.record_success()
+        # THEN
+        self.assertFalse(sut.is_open())
+        self.assertTrue(sut.allows_query())
+
+    def test_update_many_skips_open_circuits(self):
+        # GIVEN
+        dead = DeadServerInfo(self.console, "1.2.3.4:27960")
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            dead.update()
+        alive = CountingServerInfo(self.console, "1.2.3.4:27961")
+        # WHEN
+        ServerInfo.update_many([dead, alive])
+        # THEN
+        self.assertEqual(CircuitBreaker.FAILURES_THRESHOLD, dead.queries)
+        self.assertEqual(1, alive.queries)
+
+
+class FieldsServerInfo(ServerInfo):
+    """
+    ServerInfo returning preset advertisement fields
+    """
+    def __init__(self, console, address, msg_format):
+        ServerInfo.__init__(self, console, address, msg_format)
+        self.fields = None
+
+    def _update(self):
+        if self.fields is None:
+            self._data = None
+            self.info = "%s : down" % self.address
+        else:
+            self._data = self.fields
+            self._render(ServerStatus(**self.fields))
+
+
+class Test_ServerInfo_rendering(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.sut = FieldsServerInfo(self.console, "1.2.3.4:27960", "{address} : {players}/{max_players}")
+        self.listener = Mock()
+        self.sut.add_listener(self.listener)
+
+    def test_format_keywords(self):
+        # THEN
+        self.assertSetEqual(set(['address', 'players', 'max_players']), set(self.sut.format_keywords))
+
+    def test_first_update(self):
+        # GIVEN
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12, name="f00")
+        # WHEN
+        self.sut.update()
+        # THEN
+        self.assertEqual("1.2.3.4:27960 : 2/12", str(self.sut))
+        self.listener.assert_called_once_with(self.sut, {
+            'address': (None, "1.2.3.4:27960"), 'players': (None, 2), 'max_players': (None, 12)})
+
+    def test_no_change(self):
+        # GIVEN
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12, name="f00")
+        self.sut.update()
+        first_info = self.sut.info
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12, name="bar")
+        # WHEN
+        self.sut.update()
+        # THEN
+        self.assertIs(first_info, self.sut.info)
+        self.assertEqual(1, self.listener.call_count)
+
+    def test_change(self):
+        # GIVEN
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12)
+        self.sut.update()
+        self.sut.fields = dict(address="1.2.3.4:27960", players=3, max_players=12)
+        # WHEN
+        self.sut.update()
+        # THEN
+        self.assertEqual("1.2.3.4:27960 : 3/12", str(self.sut))
+        self.listener.assert_called_with(self.sut, {'players': (2, 3)})
+
+    def test_going_down(self):
+        # GIVEN
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12)
+        self.sut.update()
+        self.sut.fields = None
+        # WHEN
+        self.sut.update()
+        # THEN
+        self.assertEqual("1.2.3.4:27960 : down", str(self.sut))
+        self.listener.assert_called_with(self.sut, {
+            'address': ("1.2.3.4:27960", None), 'players': (2, None), 'max_players': (12, None)})
+
+    def test_failing_listener(self):
+        # GIVEN
+        self.listener.side_effect = ValueError("f00")
+        self.sut.fields = dict(address="1.2.3.4:27960", players=2, max_players=12)
+        # WHEN
+        self.sut.update()
+        # THEN
+        self.assertEqual("1.2.3.4:27960 : 2/12", str(self.sut))
+        self.assertTrue(self.console.error.called)
+
+
+class Test_ServerInfo_stats(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_success(self):
+        # GIVEN
+        sut = CountingServerInfo(self.console, "1.2.3.4:27960", delay=0.06)
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(1, sut.stats.counts['success'])
+        self.assertEqual(0.1, sut.stats.percentile(50))
+
+    def test_failure(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(1, sut.stats.counts['error'])
+
+    def test_no_query_when_circuit_open(self):
+        # GIVEN
+        sut = DeadServerInfo(self.console, "1.2.3.4:27960")
+        for i in range(CircuitBreaker.FAILURES_THRESHOLD):
+            sut.update()
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(CircuitBreaker.FAILURES_THRESHOLD, sut.stats.queries)
+
+    def test_backend_stats(self):
+        # GIVEN
+        backend_queries = CountingServerInfo.backend_stats().queries
+        sut1 = CountingServerInfo(self.console, "1.2.3.4:27960")
+        sut2 = CountingServerInfo(self.console, "1.2.3.4:27961")
+        # WHEN
+        sut1.update()
+        sut2.update()
+        # THEN
+        self.assertEqual(backend_queries + 2, CountingServerInfo.backend_stats().queries)
+        self.assertIsNot(CountingServerInfo.backend_stats(), DeadServerInfo.backend_stats())
+
+
+class StatusServerInfo(ServerInfo):
+    """
+    ServerInfo reporting an increasing number of players
+    """
+    HISTORY_SIZE = 3
+
+    def __init__(self, console, address):
+        ServerInfo.__init__(self, console, address, "{address}")
+        self.queries = 0
+        self.up = True
+
+    def _update(self):
+        if self.up:
+            self.queries += 1
+            self._data = {'players': self.queries}
+            self._set_status(name="server", players=str(self.queries), max_players="12")
+            self.info = "%s : up" % self.address
+        else:
+            self._data = None
+            self.info = "%s : down" % self.address
+
+
+class Test_ServerInfo_status(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_no_status(self):
+        # WHEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        # THEN
+        self.assertIsNone(sut.status)
+        self.assertListEqual([], list(sut.history))
+
+    def test_status(self):
+        # GIVEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        # WHEN
+        start = time.time()
+        sut.update()
+        # THEN
+        self.assertIsInstance(sut.status, ServerStatus)
+        self.assertEqual("1.2.3.4:27960", sut.status.address)
+        self.assertEqual("server", sut.status.name)
+        self.assertEqual(1, sut.status.players)
+        self.assertEqual(12, sut.status.max_players)
+        self.assertIsNone(sut.status.map)
+        self.assertIsNone(sut.status.ping)
+        self.assertGreaterEqual(sut.status.timestamp, start)
+
+    def test_ping(self):
+        # GIVEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        sut._response_time = 0.0421
+        # WHEN
+        sut._set_status(name="server")
+        # THEN
+        self.assertEqual(42, sut.status.ping)
+
+    def test_history_is_bounded(self):
+        # GIVEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        # WHEN
+        for i in range(5):
+            sut.update()
+        # THEN
+        self.assertListEqual([3, 4, 5], [x.players for x in sut.history])
+        self.assertIs(sut.history[-1], sut.status)
+
+    def test_down_keeps_last_known_status(self):
+        # GIVEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        sut.update()
+        # WHEN
+        sut.up = False
+        sut.update()
+        # THEN
+        self.assertIsNone(sut.data)
+        self.assertEqual(1, sut.status.players)
+        self.assertEqual(1, len(sut.history))
+
+
+class Test_ServerStatus(TestCase):
+    def test_slots(self):
+        # GIVEN
+        status = ServerStatus("1.2.3.4:27960")
+        # THEN
+        self.assertFalse(hasattr(status, '__dict__'))
+        self.assertRaises(AttributeError, setattr, status, 'foo', 'bar')
+
+    def test_unexpected_player_counts(self):
+        # WHEN
+        status = ServerStatus("1.2.3.4:27960", players="?", max_players=None)
+        # THEN
+        self.assertIsNone(status.players)
+        self.assertIsNone(status.max_players)
+
+
+class Test_ServerInfo_snapshot(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_restore(self):
+        # GIVEN
+        server = StatusServerInfo(self.console, "1.2.3.4:27960")
+        server.update()
+        snapshot = server.snapshot()
+        # WHEN
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        sut.restore(snapshot)
+        # THEN
+        self.assertTrue(sut.restored)
+        self.assertEqual("1.2.3.4:27960 : up", str(sut))
+        self.assertEqual(server.last_update, sut.last_update)
+        self.assertEqual(1, sut.status.players)
+        self.assertEqual(server.status.timestamp, sut.status.timestamp)
+        self.assertListEqual([sut.status], list(sut.history))
+
+    def test_restored_server_is_queried(self):
+        # GIVEN
+        server = StatusServerInfo(self.console, "1.2.3.4:27960")
+        server.update()
+        sut = StatusServerInfo(self.console, "1.2.3.4:27960")
+        sut.cache_ttl = 60
+        sut.restore(server.snapshot())
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertEqual(1, sut.queries)
+        self.assertFalse(sut.restored)
@@ -0,0 +1,127 @@
+import socket
+import struct
+import sys
+from mock import Mock, patch
+from mockito import when, unstub
+from unittest2 import TestCase
+import servermonitor
+from servermonitor import SourceServerInfo, parse_a2s_info, a2s_info_many
+from tests.fakeservers import FakeSourceServer, unused_udp_address
+
+A2S_INFO_RESPONSE = ('\xff\xff\xff\xffI\x11Test server name\x00de_dust2\x00cstrike\x00Counter-Strike: Source\x00' +
+                     struct.pack('<HBBBccBB', 240, 5, 16, 1, 'd', 'l', 0, 1) + '1.0.0.0\x00')
+
+
+class Test_SourceServerInfo(TestCase):
+    def setUp(self):
+        self.console = Mock()
+        self.console.error = lambda x: sys.stderr.write('ERROR: %s\n' % x)
+
+    def tearDown(self):
+        unstub()
+
+    def test_nominal(self):
+        # GIVEN
+        sut = SourceServerInfo(self.console, "1.2.3.4:27015", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).a2s_info("1.2.3.4:27015").thenReturn(A2S_INFO_RESPONSE)
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertDictContainsSubset({'map': 'de_dust2', 'players': 5, 'max_players': 16, 'name': 'Test server name'},
+                                      sut.data)
+        self.assertEqual('1.2.3.4:27015 : de_dust2 5/16 Test server name', str(sut))
+        self.assertEqual(('Test server name', 'de_dust2', None, 5, 16),
+                         (sut.status.name, sut.status.map, sut.status.gamemode, sut.status.players,
+                          sut.status.max_players))
+
+    def test_timeout(self):
+        # GIVEN
+        sut = SourceServerInfo(self.console, "1.2.3.4:27015", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).a2s_info("1.2.3.4:27015").thenRaise(socket.timeout)
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertIsNone(sut.data)
+        self.assertEqual('1.2.3.4:27015 : down', str(sut))
+        self.assertEqual(1, sut.stats.counts['timeout'])
+
+    def test_junk_response(self):
+        # GIVEN
+        sut = SourceServerInfo(self.console, "1.2.3.4:27015", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).a2s_info("1.2.3.4:27015").thenReturn('f00')
+        # WHEN
+        sut.update()
+        # THEN
+        self.assertIsNone(sut.data)
+        self.assertEqual('1.2.3.4:27015 : unknown', str(sut))
+        self.assertEqual(1, sut.stats.counts['parse_error'])
+
+    def test_update_many(self):
+        # GIVEN
+        sut1 = SourceServerInfo(self.console, "1.2.3.4:27015", "{address} : {map} {players}/{max_players} {name}")
+        sut2 = SourceServerInfo(self.console, "1.2.3.4:27016", "{address} : {map} {players}/{max_players} {name}")
+        when(servermonitor).a2s_info_many(["1.2.3.4:27015", "1.2.3.4:27016"]).thenReturn({
+            "1.2.3.4:27015": A2S_INFO_RESPONSE})
+        # WHEN
+        SourceServerInfo.update_many([sut1, sut2])
+        # THEN
+        self.assertEqual('1.2.3.4:27015 : de_dust2 5/16 Test server name', str(sut1))
+        self.assertEqual('1.2.3.4:27016 : down', str(sut2))
+
+
+class Test_parse_a2s_info(TestCase):
+
+    def test_nominal(self):
+        self.assertDictEqual({
+            'protocol': 17,
+            'name': 'Test server name',
+            'map': 'de_dust2',
+            'folder': 'cstrike',
+            'game': 'Counter-Strike: Source',
+            'appid': 240,
+            'players': 5,
+            'max_players': 16,
+            'bots': 1,
+            'server_type': 'd',
+            'environment': 'l',
+            'visibility': 0,
+            'vac': 1,
+        }, parse_a2s_info(A2S_INFO_RESPONSE))
+
+    def test_not_a2s_info(self):
+        self.assertRaises(ValueError, parse_a2s_info, '\xff\xff\xff\xffinfoResponse\n')
+
+    def test_truncated(self):
+        self.assertRaises(ValueError, parse_a2s_info, A2S_INFO_RESPONSE[:20])
+        self.assertRaises(ValueError, parse_a2s_info, A2S_INFO_RESPONSE[:-15])
+
+
+class Test_a2s_info_many(TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start_server(self, **kwargs):
+        server = FakeSourceServer(**kwargs)
+        server.start()
+        self.servers.append(server)
+        return server
+
+    def test_challenge(self):
+        # GIVEN
+        plain = self.start_server(name="plain", players=3)
+        challenging = self.start_server(name="challenging", players=7, challenge=True)
+        dead = unused_udp_address()
+        # WHEN
+        with patch.object(servermonitor, 'A2S_TIMEOUT', 0.5):
+            responses = a2s_info_many([plain.address, challenging.address, dead])
+        # THEN
+        self.assertListEqual(sorted([plain.address, challenging.address]), sorted(responses.keys()))
+        self.assertEqual("plain", parse_a2s_info(responses[plain.address])['name'])
+        self.assertEqual(7, parse_a2s_info(responses[challenging.address])['players'])
+        self.assertEqual(1, len(plain.queries))
+        self.assertEqual(2, len(challenging.queries))
+        self.assertTrue(challenging.queries[1].endswith(FakeSourceServer.CHALLENGE))
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from unittest2 import TestCase
+from servermonitor import UDPMultiplexer, QUAKE3_GETINFO, QUAKE3_INFO_RESPONSE, quake3_query
+from tests.fakeservers import FakeQuake3Server, unused_udp_address
+import socket
+
+
+class Test_UDPMultiplexer(TestCase):
+    def setUp(self):
+        self.sut = UDPMultiplexer()
+        self.fake_servers = []
+
+    def tearDown(self):
+        self.sut.close()
+        for server in self.fake_servers:
+            server.stop()
+
+    def start_fake_server(self, **kwargs):
+        server = FakeQuake3Server(**kwargs)
+        server.start()
+        self.fake_servers.append(server)
+        return server
+
+    def test_query(self):
+        # GIVEN
+        server = self.start_fake_server(hostname="test server")
+        # WHEN
+        response = self.sut.query(server.address, QUAKE3_GETINFO, 2)
+        # THEN
+        self.assertEqual('\xff\xff\xff\xffinfoResponse\n\\hostname\\test server', response)
+
+    def test_query_timeout(self):
+        # WHEN
+        start = time.time()
+        self.assertRaises(socket.timeout, self.sut.query, unused_udp_address(), QUAKE3_GETINFO, 0.3)
+        # THEN
+        self.assertLess(time.time() - start, 1)
+
+    def test_query_many(self):
+        # GIVEN
+        servers = [self.start_fake_server(hostname="server %s" % i) for i in range(5)]
+        dead_address = unused_udp_address()
+        # WHEN
+        start = time.time()
+        responses = self.sut.query_many([x.address for x in servers] + [dead_address], QUAKE3_GETINFO, 0.5)
+        # THEN
+        self.assertLess(time.time() - start, 1)
+        self.assertNotIn(dead_address, responses)
+        self.assertDictEqual(dict([(x.address, '\xff\xff\xff\xffinfoResponse\n\\hostname\\server %s' % i)
+                                   for i, x in enumerate(servers)]), responses)
+
+    def test_single_socket(self):
+        # GIVEN
+        servers = [self.start_fake_server(hostname="server %s" % i) for i in range(3)]
+        # WHEN
+        self.sut.query_many([x.address for x in servers], QUAKE3_GETINFO, 1)
+        sock = self.sut._socket
+        self.sut.query_many([x.address for x in servers], QUAKE3_GETINFO, 1)
+        # THEN
+        self.assertIs(sock, self.sut._socket)
+
+    def test_duplicated_replies(self):
+        # GIVEN
+        server = self.start_fake_server(replies=3, hostname="test server")
+        # WHEN
+        first_response = self.sut.query(server.address, QUAKE3_GETINFO, 1)
+        time.sleep(.1)
+        # THEN
+        self.assertEqual('\xff\xff\xff\xffinfoResponse\n\\hostname\\test server', first_response)
+        self.assertDictEqual({}, self.sut._pending)
+
+    def test_unresolvable_host(self):
+        # WHEN
+        responses = self.sut.query_many(["f00.invalid:27960"], QUAKE3_GETINFO, 0.3)
+        # THEN
+        self.assertDictEqual({}, responses)
+
+    def test_adaptive_timeout(self):
+        # GIVEN
+        server = self.start_fake_server(hostname="test server")
+        for i in range(10):
+            self.sut.query(server.address, QUAKE3_GETINFO, 3)
+        server.stop()
+        # WHEN
+        start = time.time()
+        self.assertRaises(socket.timeout, self.sut.query, server.address, QUAKE3_GETINFO, 3)
+        # THEN
+        self.assertLess(time.time() - start, 1)
+
+    def test_late_reply_is_not_taken_for_the_next_one(self):
+        # GIVEN
+        server = self.start_fake_server(latency=0.5, hostname="test server")
+        payload, expect = quake3_query('getinfo', QUAKE3_INFO_RESPONSE)
+        self.assertRaises(socket.timeout, self.sut.query, server.address, payload, 0.2, expect)
+        payload, expect = quake3_query('getinfo', QUAKE3_INFO_RESPONSE)
+        # WHEN
+        response = self.sut.query(server.address, payload, 2, expect)
+        # THEN
+        self.assertTrue(response.endswith(payload[4:].split()[1]))
+        self.assertGreater(response.rtt, 0.4)
+
+    def test_reply_without_challenge(self):
+        # GIVEN
+        server = self.start_fake_server(hostname="test server")
+        server.infostring = lambda challenge=None: '\\hostname\\test server'
+        payload, expect = quake3_query('getinfo', QUAKE3_INFO_RESPONSE)
+        # WHEN
+        response = self.sut.query(server.address, payload, 2, expect)
+        # THEN
+        self.assertEqual('\xff\xff\xff\xffinfoResponse\n\\hostname\\test server', response)
+
+    def test_close_releases_socket_and_thread(self):
+        # GIVEN
+        server = self.start_fake_server(hostname="test server")
+        self.sut.query(server.address, QUAKE3_GETINFO, 2)
+        self.sut.close()
+        threads = threading.activeCount()
+        fds = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+        # WHEN
+        for i in range(5):
+            self.sut.query(server.address, QUAKE3_GETINFO, 2)
+            self.sut.close()
+        # THEN
+        self.assertEqual(threads, threading.activeCount())
+        if fds is not None:
+            self.assertEqual(fds, len(os.listdir('/proc/self/fd')))
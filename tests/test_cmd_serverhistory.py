@@ -0,0 +1,101 @@
+import time
+from mockito import when, unstub
+import servermonitor
+from tests import ServermonitorTestCase
+
+
+class Test_cmd_serverhistory(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        self.logger.propagate = False
+        self.superadmin.connects("1")
+        self.superadmin.clearMessageHistory()
+        self.logger.propagate = True
+
+    def tearDown(self):
+        unstub()
+        ServermonitorTestCase.tearDown(self)
+
+    def init_quake3_plugin(self):
+        self.init_plugin("""\
+[commands]
+servers: guest
+serverhistory: guest
+[settings]
+history windows: 1h 1d
+[servers]
+quake3 server: 1.2.3.4:27960 1.2.3.4:27961
+""")
+
+    def test_no_server(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+serverhistory: guest
+[servers]
+quake3 server:
+""")
+        # WHEN
+        self.superadmin.says("!serverhistory 1")
+        # THEN
+        self.assertListEqual(['no server setup'], self.superadmin.message_history)
+
+    def test_no_param(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverhistory")
+        # THEN
+        self.assertListEqual(['missing server index. Try !help serverhistory'], self.superadmin.message_history)
+
+    def test_invalid_server_index(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverhistory 3")
+        # THEN
+        self.assertListEqual(['invalid server index. Server indexes go from 1 to 2'], self.superadmin.message_history)
+
+    def test_no_data(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverhistory 1")
+        # THEN
+        self.assertListEqual(['#1 1.2.3.4:27960 last 1h: no data', '#1 1.2.3.4:27960 last 1d: no data'],
+                             self.superadmin.message_history)
+
+    def test_queries_are_recorded(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        for clients in ('2', '4'):
+            when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+                "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\clients\\%s\\sv_maxclients\\12' % clients})
+            self.superadmin.says("!servers")
+        self.superadmin.clearMessageHistory()
+        # WHEN
+        self.superadmin.says("!serverhistory 1")
+        self.superadmin.says("!serverhistory 2")
+        # THEN
+        self.assertListEqual([
+            '#1 1.2.3.4:27960 last 1h: min 2, avg 3.0, max 4 players, up 100%',
+            '#1 1.2.3.4:27960 last 1d: min 2, avg 3.0, max 4 players, up 100%',
+            '#2 1.2.3.4:27961 last 1h: down',
+            '#2 1.2.3.4:27961 last 1d: down',
+        ], self.superadmin.message_history)
+
+    def test_old_samples_are_left_out(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        history = self.p.servers[0].player_history
+        history.record(time.time() - 7200, 10, 12, True)
+        history.record(time.time() - 60, 2, 12, True)
+        history.record(time.time(), None, None, False)
+        # WHEN
+        self.superadmin.says("!serverhistory 1")
+        # THEN
+        self.assertListEqual([
+            '#1 1.2.3.4:27960 last 1h: min 2, avg 2.0, max 2 players, up 50%',
+            '#1 1.2.3.4:27960 last 1d: min 2, avg 6.0, max 10 players, up 67%',
+        ], self.superadmin.message_history)
@@ -48,8 +48,13 @@ servers: guest
 [servers]
 game-monitor.com: 1.2.3.4:27960 4.3.2.1:27960
 """)
-        when(servermonitor).http_get("http://module.game-monitor.com/1.2.3.4:27960/data/server.js").thenReturn("""={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/1.2.3.4:27960/test_server.html","error":0,"query_time":"136ms"}""")
-        when(servermonitor).http_get("http://module.game-monitor.com/4.3.2.1:27960/data/server.js").thenReturn("""={"ip":"4.3.2.1","port":27960,"player":12,"maxplayer":15,"name":"test server 4.3.2.1","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/4.3.2.1:27960/test_server.html","error":0,"query_time":"136ms"}""")
+        when(servermonitor).http_get_many([
+            ("http://module.game-monitor.com/1.2.3.4:27960/data/server.js", {}),
+            ("http://module.game-monitor.com/4.3.2.1:27960/data/server.js", {})
+        ]).thenReturn([
+            """={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/1.2.3.4:27960/test_server.html","error":0,"query_time":"136ms"}""",
+            """={"ip":"4.3.2.1","port":27960,"player":12,"maxplayer":15,"name":"test server 4.3.2.1","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/4.3.2.1:27960/test_server.html","error":0,"query_time":"136ms"}"""
+        ])
         # WHEN
         self.superadmin.says("!servers")
         # THEN
@@ -74,6 +79,46 @@ quake3 server: 1.2.3.4:27960
         self.assertListEqual(['1.2.3.4:27960 : ut4_casa 2/12 Test server name'], self.superadmin.message_history)
 
 
+    def test_q3a_two_servers(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[servers]
+game-monitor.com:
+quake3 server: 1.2.3.4:27960 1.2.3.4:27961
+""")
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\Test server name',
+            "1.2.3.4:27961": '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\16\\clients\\0\\mapname\\ut4_turnpike\\hostname\\Other server'})
+        # WHEN
+        self.superadmin.says("!servers")
+        # THEN
+        self.assertListEqual(['1.2.3.4:27960 : ut4_casa 2/12 Test server name',
+                              '1.2.3.4:27961 : ut4_turnpike 0/16 Other server'], self.superadmin.message_history)
+
+
+    def test_q3a_two_servers_packed(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+max chat length: 100
+[servers]
+game-monitor.com:
+quake3 server: 1.2.3.4:27960 1.2.3.4:27961
+""")
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\12\\clients\\2\\mapname\\ut4_casa\\hostname\\Test server name',
+            "1.2.3.4:27961": '\xff\xff\xff\xffinfoResponse\n\\sv_maxclients\\16\\clients\\0\\mapname\\ut4_turnpike\\hostname\\Other server'})
+        # WHEN
+        self.superadmin.says("!servers")
+        # THEN
+        self.assertListEqual(['1.2.3.4:27960 : ut4_casa 2/12 Test server name | 1.2.3.4:27961 : ut4_turnpike 0/16 Other server'],
+                             self.superadmin.message_history)
+
+
 
 class Test_cmd_gamemonitor_with_param(ServermonitorTestCase):
 
@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+from mockito import when, unstub
+import servermonitor
+from tests import ServermonitorTestCase
+
+
+class Test_cmd_serverstats(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        servermonitor.backend_stats.clear()
+        self.logger.propagate = False
+        self.superadmin.connects("1")
+        self.superadmin.clearMessageHistory()
+        self.logger.propagate = True
+
+    def tearDown(self):
+        unstub()
+        ServermonitorTestCase.tearDown(self)
+
+    def init_quake3_plugin(self):
+        self.init_plugin("""\
+[commands]
+servers: guest
+serverstats: guest
+[servers]
+quake3 server: 1.2.3.4:27960 1.2.3.4:27961
+""")
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\clients\\2'})
+        self.superadmin.says("!servers")
+        self.superadmin.clearMessageHistory()
+
+    def test_no_server(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+serverstats: guest
+[servers]
+quake3 server:
+""")
+        # WHEN
+        self.superadmin.says("!serverstats")
+        # THEN
+        self.assertListEqual(['no server setup'], self.superadmin.message_history)
+
+    def test_no_param(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverstats")
+        # THEN
+        self.assertEqual(3, len(self.superadmin.message_history))
+        self.assertTrue(self.superadmin.message_history[0].startswith(
+            'Quake3: 2 queries, 1 ok, 1 timeouts, 0 parse errors, 0 errors'))
+        self.assertTrue(self.superadmin.message_history[1].startswith('#'))
+        self.assertTrue(self.superadmin.message_history[2].startswith('#'))
+
+    def test_one_server(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverstats 2")
+        # THEN
+        self.assertEqual(1, len(self.superadmin.message_history))
+        self.assertTrue(self.superadmin.message_history[0].startswith(
+            '#2 1.2.3.4:27961: 1 queries, 0 ok, 1 timeouts, 0 parse errors, 0 errors'))
+
+    def test_invalid_server_index(self):
+        # GIVEN
+        self.init_quake3_plugin()
+        # WHEN
+        self.superadmin.says("!serverstats 3")
+        # THEN
+        self.assertListEqual(['invalid server index. Server indexes go from 1 to 2'], self.superadmin.message_history)
+
+
+class Test_dump_stats(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        servermonitor.backend_stats.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stats_file = os.path.join(self.tmp_dir, 'stats.json')
+
+    def tearDown(self):
+        unstub()
+        shutil.rmtree(self.tmp_dir)
+        ServermonitorTestCase.tearDown(self)
+
+    def test_dump(self):
+        # GIVEN
+        self.init_plugin("""\
+[settings]
+stats file: %s
+[servers]
+quake3 server: 1.2.3.4:27960
+""" % self.stats_file)
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenRaise(socket.timeout)
+        # WHEN
+        self.p.update_servers(self.p.servers)
+        # THEN
+        stats = json.load(open(self.stats_file))
+        self.assertEqual(1, stats['backends']['Quake3']['timeout'])
+        self.assertEqual(1, len(stats['servers']))
+        self.assertDictContainsSubset({'address': '1.2.3.4:27960', 'backend': 'Quake3', 'queries': 1, 'timeout': 1},
+                                      stats['servers'][0])
+
+    def test_dump_interval(self):
+        # GIVEN
+        self.init_plugin("""\
+[settings]
+stats file: %s
+[servers]
+quake3 server: 1.2.3.4:27960
+""" % self.stats_file)
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenRaise(socket.timeout)
+        self.p.update_servers(self.p.servers)
+        # WHEN
+        self.p.update_servers(self.p.servers)
+        # THEN
+        stats = json.load(open(self.stats_file))
+        self.assertEqual(1, stats['servers'][0]['queries'])
+        # WHEN
+        self.p.dump_stats(force=True)
+        # THEN
+        stats = json.load(open(self.stats_file))
+        self.assertEqual(2, stats['servers'][0]['queries'])
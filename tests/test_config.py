@@ -1,11 +1,16 @@
 # -*- encoding: utf-8 -*-
 import logging
 import os
+import shutil
+import socket
+import tempfile
 from unittest2 import skipUnless
-from mock import patch, call
+from mock import patch, call, Mock
 from b3.config import CfgConfigParser
 from tests import ServermonitorTestCase
-from servermonitor import ServermonitorPlugin, __file__ as servermonitor__file__
+import servermonitor
+from servermonitor import DNSCache, ServermonitorPlugin, ServerInfo, register_backend, backends, \
+    GamemonitorServerInfo, Quake3ServerInfo, BF3ServerInfo, SourceServerInfo, __file__ as servermonitor__file__
 
 DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(servermonitor__file__), "conf/plugin_servermonitor.cfg")
 DEFAULT_ADVERTISEMENT_FORMAT = "^7{address} ^0: ^4{map} ^5{players}^7/^5{max_players} ^4{name}"
@@ -50,6 +55,21 @@ class Test_config(ConfigTestCase):
         self.assertListEqual([
             call("The config has no section 'settings'."),
             call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'settings'."),
+            call("The config has no section 'servers'."),
+            call("The config has no section 'servers'."),
+            call("The config has no section 'servers'."),
+            call("The config has no section 'servers'."),
             call("The config has no section 'servers'."),
             call("The config has no section 'servers'."),
             call("The config has no section 'servers'.")
@@ -59,9 +79,24 @@ class Test_config(ConfigTestCase):
         self.assertListEqual([
             call('advertise servers on map change: no'),
             call('advertisement_format: %s' % DEFAULT_ADVERTISEMENT_FORMAT),
+            call('poll game servers in the background: no'),
+            call('reuse game servers status: no'),
+            call('quake3 query: getinfo'),
+            call('dump query statistics: no'),
+            call('keep player count history in memory'),
+            call('player count history windows: 1h, 1d, 7d'),
+            call('keep last known status of game servers: no'),
+            call('pack advertisements: no'),
+            call('say advertisements every 1s'),
+            call('quake3 master protocol: 68'),
+            call('quake3 master filter: no'),
             call('No server loaded from config for datasource game-monitor.com'),
             call('No server loaded from config for datasource quake3 server'),
-            call('No server loaded from config for datasource BF3 server')
+            call('No server loaded from config for datasource BF3 server'),
+            call('No server loaded from config for datasource BF4 server'),
+            call('No server loaded from config for datasource BFH server'),
+            call('No server loaded from config for datasource source server'),
+            call('discover quake3 servers from a master server: no')
         ], self.info_mock.mock_calls)
 
     @skipUnless(os.path.isfile(DEFAULT_CONFIG_FILE), "Default config file not found at " + DEFAULT_CONFIG_FILE)
@@ -79,9 +114,24 @@ class Test_config(ConfigTestCase):
         self.assertListEqual([
             call('advertise servers on map change: yes'),
             call('advertisement_format: %s' % DEFAULT_ADVERTISEMENT_FORMAT),
+            call('poll game servers in the background: no'),
+            call('reuse game servers status for 10s'),
+            call('quake3 query: getinfo'),
+            call('dump query statistics: no'),
+            call('keep player count history in memory'),
+            call('player count history windows: 1h, 1d, 7d'),
+            call('keep last known status of game servers: no'),
+            call('pack advertisements: no'),
+            call('say advertisements every 1s'),
+            call('quake3 master protocol: 68'),
+            call('quake3 master filter: no'),
             call('No server loaded from config for datasource game-monitor.com'),
             call('No server loaded from config for datasource quake3 server'),
-            call('No server loaded from config for datasource BF3 server')
+            call('No server loaded from config for datasource BF3 server'),
+            call('No server loaded from config for datasource BF4 server'),
+            call('No server loaded from config for datasource BFH server'),
+            call('No server loaded from config for datasource source server'),
+            call('discover quake3 servers from a master server: no')
         ], self.info_mock.mock_calls)
 
 
@@ -111,9 +161,9 @@ class Test_config_servers(ConfigTestCase):
 game-monitor.com: 1.2.3.4:27960 4.5.6.7:27960
         """)
         # WHEN
-        self.p.load_conf_servers_gamemonitor()
+        servers = self.p._load_conf_servers(GamemonitorServerInfo)
         # THEN
-        self.assertListEqual(["GamemonitorServerInfo('1.2.3.4:27960')", "GamemonitorServerInfo('4.5.6.7:27960')"], map(repr, self.p.servers))
+        self.assertListEqual(["GamemonitorServerInfo('1.2.3.4:27960')", "GamemonitorServerInfo('4.5.6.7:27960')"], map(repr, servers))
         self.assertFalse(self.p.advertise_on_map_change)
         self.assertListEqual([], self.error_mock.mock_calls)
         self.assertListEqual([], self.warning_mock.mock_calls)
@@ -129,9 +179,9 @@ game-monitor.com: 1.2.3.4:27960 4.5.6.7:27960
 quake3 server: 1.2.3.4:27960 4.5.6.7:27960
         """)
         # WHEN
-        self.p.load_conf_servers_quake3()
+        servers = self.p._load_conf_servers(Quake3ServerInfo)
         # THEN
-        self.assertListEqual(["Quake3ServerInfo('1.2.3.4:27960')", "Quake3ServerInfo('4.5.6.7:27960')"], map(repr, self.p.servers))
+        self.assertListEqual(["Quake3ServerInfo('1.2.3.4:27960')", "Quake3ServerInfo('4.5.6.7:27960')"], map(repr, servers))
         self.assertFalse(self.p.advertise_on_map_change)
         self.assertListEqual([], self.error_mock.mock_calls)
         self.assertListEqual([], self.warning_mock.mock_calls)
@@ -139,6 +189,25 @@ quake3 server: 1.2.3.4:27960 4.5.6.7:27960
             call("servers loaded from config for datasource 'quake3 server': 1.2.3.4:27960, 4.5.6.7:27960")
         ], self.info_mock.mock_calls)
 
+    def test_host_names_are_resolved(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[servers]
+quake3 server: game.example.com:27960 game.example.com:27961 f00.invalid:27960
+        """)
+        resolver = Mock(side_effect=lambda host: {'game.example.com': '1.2.3.4'}.get(host) or fail(host))
+        def fail(host):
+            raise socket.gaierror("unknown host")
+        # WHEN
+        with patch.object(servermonitor, 'dns_cache', DNSCache(resolver)):
+            self.p._load_conf_servers(Quake3ServerInfo)
+            # THEN
+            self.assertEqual('1.2.3.4', servermonitor.dns_cache.resolve('game.example.com'))
+        self.assertListEqual([call('f00.invalid'), call('game.example.com')], resolver.mock_calls)
+        self.assertListEqual([
+            call("Could not resolve host name f00.invalid")
+        ], self.warning_mock.mock_calls)
+
     def test_BF3(self):
         # GIVEN
         self.conf.loadFromString("""
@@ -146,9 +215,9 @@ quake3 server: 1.2.3.4:27960 4.5.6.7:27960
 BF3 server: 1.2.3.4:27960 4.5.6.7:27960
         """)
         # WHEN
-        self.p.load_conf_servers_BF3()
+        servers = self.p._load_conf_servers(BF3ServerInfo)
         # THEN
-        self.assertListEqual(["BF3ServerInfo('1.2.3.4:27960')", "BF3ServerInfo('4.5.6.7:27960')"], map(repr, self.p.servers))
+        self.assertListEqual(["BF3ServerInfo('1.2.3.4:27960')", "BF3ServerInfo('4.5.6.7:27960')"], map(repr, servers))
         self.assertFalse(self.p.advertise_on_map_change)
         self.assertListEqual([], self.error_mock.mock_calls)
         self.assertListEqual([], self.warning_mock.mock_calls)
@@ -156,6 +225,52 @@ BF3 server: 1.2.3.4:27960 4.5.6.7:27960
             call("servers loaded from config for datasource 'BF3 server': 1.2.3.4:27960, 4.5.6.7:27960")
         ], self.info_mock.mock_calls)
 
+    def test_source(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[servers]
+source server: 1.2.3.4:27015 4.5.6.7:27015
+        """)
+        # WHEN
+        servers = self.p._load_conf_servers(SourceServerInfo)
+        # THEN
+        self.assertListEqual(["SourceServerInfo('1.2.3.4:27015')", "SourceServerInfo('4.5.6.7:27015')"], map(repr, servers))
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call("servers loaded from config for datasource 'source server': 1.2.3.4:27015, 4.5.6.7:27015")
+        ], self.info_mock.mock_calls)
+
+    def test_registered_backend(self):
+        # GIVEN
+        class FooServerInfo(ServerInfo):
+            CONFIG_KEY = 'foo server'
+            ADDRESS_PATTERN = r"foo://(\S+:\d+)"
+
+            def __init__(self, *args, **kwargs):
+                self.foo = kwargs.pop('foo')
+                ServerInfo.__init__(self, *args, **kwargs)
+
+            @classmethod
+            def config_kwargs(cls, plugin):
+                return {'foo': 42}
+
+        register_backend(FooServerInfo)
+        self.conf.loadFromString("""
+[servers]
+foo server: foo://1.2.3.4:27960 4.5.6.7:27960
+        """)
+        try:
+            # WHEN
+            self.p.onLoadConfig()
+        finally:
+            backends.remove(FooServerInfo)
+        # THEN
+        self.assertListEqual(["FooServerInfo('1.2.3.4:27960')"], map(repr, self.p.servers))
+        self.assertEqual(42, self.p.servers[0].foo)
+        self.assertIn(call("servers loaded from config for datasource 'foo server': 1.2.3.4:27960"),
+                      self.info_mock.mock_calls)
+
 
 class Test_load_conf_settings_advertise_on_map_change(ConfigTestCase):
 
@@ -274,4 +389,584 @@ advertisement format: {name} : {players}
         self.assertListEqual([], self.warning_mock.mock_calls)
         self.assertListEqual([
             call('advertisement_format: %s' % DEFAULT_ADVERTISEMENT_FORMAT)
-        ], self.info_mock.mock_calls)
\ No newline at end of file
+        ], self.info_mock.mock_calls)
+
+    def test_gamemode(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+advertisement format: {address} : {map} [{gamemode}] {players}/{max_players}
+        """)
+        # WHEN
+        self.p.load_conf_settings_advertisement_format()
+        # THEN
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertEqual('{address} : {map} [{gamemode}] {players}/{max_players}', self.p.advertisement_format)
+        self.assertTupleEqual(('address', 'map', 'gamemode', 'players', 'max_players'),
+                              self.p.advertisement_template.keywords)
+
+
+class Test_load_conf_settings_poll_interval(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_poll_interval()
+        # THEN
+        self.assertEqual(0, self.p.poll_interval)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call("The config is missing 'poll interval' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('poll game servers in the background: no')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+poll interval: 60
+        """)
+        # WHEN
+        self.p.load_conf_settings_poll_interval()
+        # THEN
+        self.assertEqual(60, self.p.poll_interval)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('poll game servers in the background every 60s')
+        ], self.info_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+poll interval: -5
+        """)
+        # WHEN
+        self.p.load_conf_settings_poll_interval()
+        # THEN
+        self.assertEqual(0, self.p.poll_interval)
+        self.assertListEqual([
+            call("Unexpected value for setting 'poll interval' in section 'settings': '-5'. Expecting a positive number of seconds")
+        ], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('poll game servers in the background: no')
+        ], self.info_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_cache_ttl(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_cache_ttl()
+        # THEN
+        self.assertEqual(0, self.p.cache_ttl)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call("The config is missing 'cache ttl' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('reuse game servers status: no')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+cache ttl: 15
+[servers]
+quake3 server: 1.2.3.4:27960
+        """)
+        # WHEN
+        self.p.load_conf_settings_cache_ttl()
+        servers = self.p._load_conf_servers(Quake3ServerInfo)
+        # THEN
+        self.assertEqual(15, self.p.cache_ttl)
+        self.assertEqual(15, servers[0].cache_ttl)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+cache ttl: f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_cache_ttl()
+        # THEN
+        self.assertEqual(0, self.p.cache_ttl)
+        self.assertListEqual([
+            call("Unexpected value for setting 'cache ttl' in section 'settings': 'f00'. Expecting a positive number of seconds")
+        ], self.error_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_quake3_query(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_query()
+        # THEN
+        self.assertEqual('getinfo', self.p.quake3_query)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call("The config is missing 'quake3 query' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('quake3 query: getinfo')
+        ], self.info_mock.mock_calls)
+
+    def test_getstatus(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 query: getstatus
+[servers]
+quake3 server: 1.2.3.4:27960
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_query()
+        servers = self.p._load_conf_servers(Quake3ServerInfo)
+        # THEN
+        self.assertEqual('getstatus', self.p.quake3_query)
+        self.assertEqual('getstatus', servers[0].query)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 query: f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_query()
+        # THEN
+        self.assertEqual('getinfo', self.p.quake3_query)
+        self.assertListEqual([
+            call("Unexpected value for setting 'quake3 query' in section 'settings': 'f00'. Expecting 'getinfo' or 'getstatus'")
+        ], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('quake3 query: getinfo')
+        ], self.info_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_stats_file(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_stats_file()
+        # THEN
+        self.assertIsNone(self.p.stats_file)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call("The config is missing 'stats file' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('dump query statistics: no')
+        ], self.info_mock.mock_calls)
+
+    def test_empty(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+stats file:
+        """)
+        # WHEN
+        self.p.load_conf_settings_stats_file()
+        # THEN
+        self.assertIsNone(self.p.stats_file)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+stats file: /tmp/servermonitor_stats.json
+        """)
+        # WHEN
+        self.p.load_conf_settings_stats_file()
+        # THEN
+        self.assertEqual('/tmp/servermonitor_stats.json', self.p.stats_file)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('dump query statistics to /tmp/servermonitor_stats.json')
+        ], self.info_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_history_directory(ConfigTestCase):
+
+    def tearDown(self):
+        ConfigTestCase.tearDown(self)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def setUp(self):
+        ConfigTestCase.setUp(self)
+        self.directory = os.path.join(tempfile.gettempdir(), "servermonitor_test_history")
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_history_directory()
+        # THEN
+        self.assertIsNone(self.p.history_directory)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call("The config is missing 'history directory' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('keep player count history in memory')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+history directory: %s
+        """ % self.directory)
+        # WHEN
+        self.p.load_conf_settings_history_directory()
+        # THEN
+        self.assertEqual(self.directory, self.p.history_directory)
+        self.assertTrue(os.path.isdir(self.directory))
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('keep player count history in %s' % self.directory)
+        ], self.info_mock.mock_calls)
+
+    def test_history_files(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+history directory: %s
+[servers]
+quake3 server: 1.2.3.4:27960
+        """ % self.directory)
+        # WHEN
+        self.p.onLoadConfig()
+        # THEN
+        self.assertEqual(os.path.join(self.directory, "Quake3_1.2.3.4_27960.history"),
+                         self.p.servers[0].player_history.path)
+        self.assertTrue(os.path.isfile(self.p.servers[0].player_history.path))
+
+
+
+class Test_load_conf_settings_history_windows(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_history_windows()
+        # THEN
+        self.assertListEqual([3600, 86400, 604800], self.p.history_windows)
+        self.assertListEqual([
+            call("The config is missing 'history windows' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+history windows: 30m 12h 2w
+        """)
+        # WHEN
+        self.p.load_conf_settings_history_windows()
+        # THEN
+        self.assertListEqual([1800, 43200, 1209600], self.p.history_windows)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('player count history windows: 30m, 12h, 14d')
+        ], self.info_mock.mock_calls)
+
+    def test_bad_value(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+history windows: 1h f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_history_windows()
+        # THEN
+        self.assertListEqual([3600, 86400, 604800], self.p.history_windows)
+        self.assertListEqual([
+            call("Unexpected value for setting 'history windows' in section 'settings': '1h f00'. Expecting durations such as '1h 1d 1w'")
+        ], self.error_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_max_chat_length(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_max_chat_length()
+        # THEN
+        self.assertEqual(0, self.p.max_chat_length)
+        self.assertListEqual([
+            call("The config is missing 'max chat length' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('pack advertisements: no')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+max chat length: 150
+        """)
+        # WHEN
+        self.p.load_conf_settings_max_chat_length()
+        # THEN
+        self.assertEqual(150, self.p.max_chat_length)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call('pack advertisements into chat messages of up to 150 characters')
+        ], self.info_mock.mock_calls)
+
+    def test_negative(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+max chat length: -1
+        """)
+        # WHEN
+        self.p.load_conf_settings_max_chat_length()
+        # THEN
+        self.assertEqual(0, self.p.max_chat_length)
+        self.assertListEqual([
+            call("Unexpected value for setting 'max chat length' in section 'settings': '-1'. Expecting a positive number of characters")
+        ], self.error_mock.mock_calls)
+
+
+
+class Test_load_conf_settings_say_interval(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_say_interval()
+        # THEN
+        self.assertEqual(1, self.p.say_interval)
+        self.assertListEqual([
+            call("The config is missing 'say interval' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('say advertisements every 1s')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+say interval: 2.5
+        """)
+        # WHEN
+        self.p.load_conf_settings_say_interval()
+        # THEN
+        self.assertEqual(2.5, self.p.say_interval)
+        self.assertListEqual([], self.error_mock.mock_calls)
+        self.assertListEqual([
+            call('say advertisements every 2.5s')
+        ], self.info_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+say interval: f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_say_interval()
+        # THEN
+        self.assertEqual(1, self.p.say_interval)
+        self.assertListEqual([
+            call("Unexpected value for setting 'say interval' in section 'settings': 'f00'. Expecting a positive number of seconds")
+        ], self.error_mock.mock_calls)
+
+    def test_reconfig_updates_advertiser(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+say interval: 2
+max chat length: 120
+        """)
+        self.p.start_advertiser()
+        # WHEN
+        self.p.onLoadConfig()
+        # THEN
+        self.assertEqual(2, self.p.advertiser.say_interval)
+        self.assertEqual(120, self.p.advertiser.max_chat_length)
+        self.p.stop_advertiser()
+
+
+class Test_load_conf_settings_quake3_master_protocol(ConfigTestCase):
+
+    def test_missing(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_protocol()
+        # THEN
+        self.assertEqual(68, self.p.quake3_master_protocol)
+        self.assertListEqual([
+            call("The config is missing 'quake3 master protocol' in section 'settings'.")
+        ], self.warning_mock.mock_calls)
+        self.assertListEqual([
+            call('quake3 master protocol: 68')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 master protocol: 71
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_protocol()
+        # THEN
+        self.assertEqual(71, self.p.quake3_master_protocol)
+        self.assertListEqual([], self.error_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 master protocol: f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_protocol()
+        # THEN
+        self.assertEqual(68, self.p.quake3_master_protocol)
+        self.assertListEqual([
+            call("Unexpected value for setting 'quake3 master protocol' in section 'settings': 'f00'. Expecting a protocol version number")
+        ], self.error_mock.mock_calls)
+
+
+class Test_load_conf_settings_quake3_master_filter(ConfigTestCase):
+
+    def test_empty(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 master filter:
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_filter()
+        # THEN
+        self.assertIsNone(self.p.quake3_master_filter)
+        self.assertListEqual([
+            call('quake3 master filter: no')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 master filter: ^my clan
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_filter()
+        # THEN
+        self.assertTrue(self.p.quake3_master_filter.search("My Clan #1"))
+        self.assertListEqual([
+            call('quake3 master filter: ^my clan')
+        ], self.info_mock.mock_calls)
+
+    def test_bad_regex(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[settings]
+quake3 master filter: (f00
+        """)
+        # WHEN
+        self.p.load_conf_settings_quake3_master_filter()
+        # THEN
+        self.assertIsNone(self.p.quake3_master_filter)
+        self.assertEqual(1, len(self.error_mock.mock_calls))
+
+
+class Test_load_conf_servers_quake3_master(ConfigTestCase):
+
+    def test_empty(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[servers]
+quake3 master:
+        """)
+        # WHEN
+        self.p.load_conf_servers_quake3_master()
+        # THEN
+        self.assertIsNone(self.p.quake3_master)
+        self.assertListEqual([
+            call('discover quake3 servers from a master server: no')
+        ], self.info_mock.mock_calls)
+
+    def test_nominal(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[servers]
+quake3 master: 127.0.0.1:27900
+        """)
+        # WHEN
+        self.p.load_conf_servers_quake3_master()
+        # THEN
+        self.assertEqual("127.0.0.1:27900", self.p.quake3_master)
+        self.assertListEqual([
+            call('discover quake3 servers from master 127.0.0.1:27900')
+        ], self.info_mock.mock_calls)
+
+    def test_junk(self):
+        # GIVEN
+        self.conf.loadFromString("""
+[servers]
+quake3 master: f00
+        """)
+        # WHEN
+        self.p.load_conf_servers_quake3_master()
+        # THEN
+        self.assertIsNone(self.p.quake3_master)
+        self.assertListEqual([
+            call("Unexpected value for 'quake3 master' in section 'servers': 'f00'. Expecting <host:port>")
+        ], self.error_mock.mock_calls)
@@ -0,0 +1,217 @@
+import re
+import socket
+from mock import patch
+from unittest2 import TestCase
+from servermonitor import parse_getservers_response, quake3_master_servers
+from tests import ServermonitorTestCase
+from tests.fakeservers import FakeQuake3Server, FakeQuake3MasterServer, unused_udp_address
+
+CONFIG = """\
+[commands]
+servers: guest
+[settings]
+advertisement format: {address} {name}
+poll interval: 0
+[servers]
+quake3 server: %s
+quake3 master:
+"""
+
+
+class Test_parse_getservers_response(TestCase):
+
+    def test_entries(self):
+        # GIVEN
+        data = '\\\x01\x02\x03\x04\x6d\x38\\\x05\x06\x07\x08\x6d\x39'
+        addresses = []
+        # WHEN
+        done = parse_getservers_response(data, addresses)
+        # THEN
+        self.assertFalse(done)
+        self.assertListEqual(['1.2.3.4:27960', '5.6.7.8:27961'], addresses)
+
+    def test_backslash_inside_entry(self):
+        # GIVEN
+        data = '\\\x5c\x5c\x03\x04\x6d\x5c\\EOT\0\0\0'
+        addresses = []
+        # WHEN
+        done = parse_getservers_response(data, addresses)
+        # THEN
+        self.assertTrue(done)
+        self.assertListEqual(['92.92.3.4:27996'], addresses)
+
+    def test_eot(self):
+        # GIVEN
+        data = '\\\x01\x02\x03\x04\x6d\x38\\EOT\0\0\0'
+        addresses = []
+        # WHEN
+        done = parse_getservers_response(data, addresses)
+        # THEN
+        self.assertTrue(done)
+        self.assertListEqual(['1.2.3.4:27960'], addresses)
+
+    def test_empty_entries_are_skipped(self):
+        # GIVEN
+        data = '\\\x00\x00\x00\x00\x00\x00\\\x01\x02\x03\x04\x00\x00\\EOT\0\0\0'
+        addresses = []
+        # WHEN
+        parse_getservers_response(data, addresses)
+        # THEN
+        self.assertListEqual([], addresses)
+
+    def test_truncated(self):
+        self.assertRaises(ValueError, parse_getservers_response, '\\\x01\x02\x03', [])
+
+    def test_garbage(self):
+        self.assertRaises(ValueError, parse_getservers_response, 'f00', [])
+
+
+class Test_quake3_master_servers(TestCase):
+
+    def setUp(self):
+        self.servers = ["127.0.0.%s:%s" % (i % 3 + 1, 27960 + i) for i in range(7)]
+
+    def test_multiple_packets(self):
+        # GIVEN
+        master = FakeQuake3MasterServer(self.servers, per_packet=2)
+        master.start()
+        try:
+            # WHEN
+            addresses = quake3_master_servers(master.address, 68, timeout=1)
+        finally:
+            master.stop()
+        # THEN
+        self.assertListEqual(self.servers, addresses)
+        self.assertListEqual(['\377\377\377\377getservers 68 full empty\n'], master.queries)
+
+    def test_no_eot(self):
+        # GIVEN
+        master = FakeQuake3MasterServer(self.servers, per_packet=2, eot=False)
+        master.start()
+        try:
+            # WHEN
+            addresses = quake3_master_servers(master.address, 68, timeout=0.3)
+        finally:
+            master.stop()
+        # THEN
+        self.assertListEqual(self.servers, addresses)
+
+    def test_no_answer(self):
+        self.assertRaises(socket.timeout, quake3_master_servers, unused_udp_address(), 68, timeout=0.2)
+
+
+class Test_discover_servers(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        self.game_servers = [FakeQuake3Server(hostname=name, mapname="ut4_casa", clients=0, sv_maxclients=12)
+                             for name in ("^1My^7Clan #1", "Other server", "myclan #2")]
+        for server in self.game_servers:
+            server.start()
+        self.master = FakeQuake3MasterServer([x.address for x in self.game_servers])
+        self.master.start()
+
+    def tearDown(self):
+        self.master.stop()
+        for server in self.game_servers:
+            server.stop()
+        ServermonitorTestCase.tearDown(self)
+
+    def init_discovery(self, configured="1.2.3.4:27960", pattern=None):
+        self.init_plugin(CONFIG % configured)
+        self.p.quake3_master = self.master.address
+        if pattern:
+            self.p.quake3_master_filter = re.compile(pattern, re.IGNORECASE)
+
+    def test_all_servers(self):
+        # GIVEN
+        self.init_discovery()
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960"] + [x.address for x in self.game_servers],
+                             [x.address for x in self.p.servers])
+
+    def test_filter(self):
+        # GIVEN
+        self.init_discovery(pattern=r"^myclan")
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960", self.game_servers[0].address, self.game_servers[2].address],
+                             [x.address for x in self.p.servers])
+
+    def test_configured_server_is_not_duplicated(self):
+        # GIVEN
+        self.init_discovery(configured=self.game_servers[1].address)
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertListEqual([x.address for x in self.game_servers[1:2] + self.game_servers[0:1] + self.game_servers[2:]],
+                             [x.address for x in self.p.servers])
+        self.assertSetEqual(set([self.game_servers[0].address, self.game_servers[2].address]), self.p.discovered)
+
+    def test_incremental_update(self):
+        # GIVEN
+        self.init_discovery()
+        self.p.discover_servers()
+        kept = self.p.servers[1]
+        self.master.servers = [self.game_servers[0].address, self.game_servers[2].address, "127.0.0.1:27999"]
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960", self.game_servers[0].address, self.game_servers[2].address,
+                              "127.0.0.1:27999"], [x.address for x in self.p.servers])
+        self.assertIs(kept, self.p.servers[1])
+
+    def test_configured_server_is_never_removed(self):
+        # GIVEN
+        self.init_discovery()
+        self.master.servers = []
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960"], [x.address for x in self.p.servers])
+
+    def test_master_down(self):
+        # GIVEN
+        self.init_discovery()
+        self.p.discover_servers()
+        servers = self.p.servers
+        self.p.quake3_master = unused_udp_address()
+        # WHEN
+        self.p.discover_servers()
+        # THEN
+        self.assertIs(servers, self.p.servers)
+
+    def test_reconfig_during_discovery(self):
+        # GIVEN
+        self.init_discovery()
+        def reconfig(*args):
+            self.conf.loadFromString(CONFIG % "5.6.7.8:27960")
+            self.p.onLoadConfig()
+            return [x.address for x in self.game_servers]
+        # WHEN
+        with patch('servermonitor.quake3_master_servers', side_effect=reconfig):
+            with patch.object(self.p, 'open_player_history', wraps=self.p.open_player_history) as open_mock:
+                self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["5.6.7.8:27960"], [x.address for x in self.p.servers])
+        self.assertSetEqual(set(), self.p.discovered)
+        self.assertEqual(1, open_mock.call_count)
+
+    def test_reconfig_same_master_during_discovery(self):
+        # GIVEN
+        self.init_discovery()
+        def reconfig(*args):
+            self.conf.loadFromString(CONFIG % "5.6.7.8:27960")
+            with patch.object(self.p, 'load_conf_servers_quake3_master'):
+                with patch.object(self.p, 'start_discovery'):
+                    self.p.onLoadConfig()
+            return [self.game_servers[0].address]
+        # WHEN
+        with patch('servermonitor.quake3_master_servers', side_effect=reconfig):
+            self.p.discover_servers()
+        # THEN
+        self.assertListEqual(["5.6.7.8:27960", self.game_servers[0].address], [x.address for x in self.p.servers])
+        self.assertSetEqual(set([self.game_servers[0].address]), self.p.discovered)
@@ -1,7 +1,10 @@
-from mock import patch, call
+import time
+from mock import patch, call, Mock
 from mockito import when
+from unittest2 import TestCase
 import sys
 import servermonitor
+from servermonitor import Advertiser
 from tests import ServermonitorTestCase
 
 
@@ -13,9 +16,13 @@ class Test_events(ServermonitorTestCase):
         self.say_mock = self.say_patcher.start()
 
     def tearDown(self):
+        self.p.stop_advertiser()
         ServermonitorTestCase.tearDown(self)
         self.say_patcher.stop()
 
+    def wait_for_advertisements(self):
+        self.p.advertiser.queue.join()
+
     def test_map_change_no_server(self):
         # GIVEN
         self.init_plugin("""\
@@ -29,6 +36,7 @@ game-monitor.com:
 """)
         # WHEN
         self.console.queueEvent(self.console.getEventID("EVT_GAME_MAP_CHANGE"))
+        self.wait_for_advertisements()
         # THEN
         self.assertListEqual([], self.say_mock.mock_calls)
 
@@ -47,6 +55,7 @@ game-monitor.com: 1.2.3.4:27960
         when(servermonitor).http_get("http://module.game-monitor.com/1.2.3.4:27960/data/server.js").thenReturn("""={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/1.2.3.4:27960/test_server.html","error":0,"query_time":"136ms"}""")
         # WHEN
         self.console.queueEvent(self.console.getEvent("EVT_GAME_MAP_CHANGE"))
+        self.wait_for_advertisements()
         # THEN
         self.assertListEqual([call('1.2.3.4:27960 : 15/20 test server 1.2.3.4')], self.say_mock.mock_calls)
 
@@ -65,5 +74,70 @@ game-monitor.com: 1.2.3.4:27960
         when(servermonitor).http_get("http://module.game-monitor.com/1.2.3.4:27960/data/server.js").thenReturn("""={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","premium":"0","link":"http://www.game-monitor.com/cod4_GameServer/1.2.3.4:27960/test_server.html","error":0,"query_time":"136ms"}""")
         # WHEN
         self.console.queueEvent(self.console.getEvent("EVT_GAME_MAP_CHANGE"))
+        self.wait_for_advertisements()
         # THEN
         self.assertListEqual([], self.say_mock.mock_calls)
+
+
+    def test_map_change_does_not_wait_for_game_servers(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+advertise on map change: yes
+advertisement format: {address} : {players}/{max_players} {name}
+[servers]
+game-monitor.com: 1.2.3.4:27960
+""")
+        when(servermonitor).http_get("http://module.game-monitor.com/1.2.3.4:27960/data/server.js").thenAnswer(
+            lambda url: time.sleep(.5) or """={"player":15,"maxplayer":20,"name":"test server 1.2.3.4","error":0}""")
+        # WHEN
+        start = time.time()
+        self.console.queueEvent(self.console.getEvent("EVT_GAME_MAP_CHANGE"))
+        elapsed = time.time() - start
+        # THEN
+        self.assertLess(elapsed, .2)
+        self.wait_for_advertisements()
+        self.assertListEqual([call('1.2.3.4:27960 : 15/20 test server 1.2.3.4')], self.say_mock.mock_calls)
+
+
+class Test_Advertiser(TestCase):
+
+    def setUp(self):
+        self.plugin = Mock()
+        self.plugin.advertisement = str
+        self.sut = Advertiser(self.plugin, say_interval=.2)
+
+    def tearDown(self):
+        self.sut.stop()
+
+    def test_rate_limit(self):
+        # GIVEN
+        servers = ["server 1", "server 2", "server 3"]
+        self.sut.start()
+        # WHEN
+        start = time.time()
+        self.sut.advertise(servers)
+        self.sut.queue.join()
+        # THEN
+        self.assertGreaterEqual(time.time() - start, .4)
+        self.assertListEqual([call("server 1"), call("server 2"), call("server 3")], self.plugin.console.say.mock_calls)
+
+    def test_packed_messages(self):
+        # GIVEN
+        servers = ["^1server 1", "^2server 2", "^3server 3"]
+        self.sut.max_chat_length = 20
+        self.sut.start()
+        # WHEN
+        self.sut.advertise(servers)
+        self.sut.queue.join()
+        # THEN
+        self.assertListEqual([call("^1server 1 ^7| ^2server 2"), call("^3server 3")],
+                             self.plugin.console.say.mock_calls)
+
+    def test_bounded_queue(self):
+        # WHEN
+        accepted = [self.sut.advertise(["server 1"]) for i in range(Advertiser.QUEUE_SIZE + 2)]
+        # THEN
+        self.assertListEqual([True] * Advertiser.QUEUE_SIZE + [False] * 2, accepted)
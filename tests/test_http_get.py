@@ -0,0 +1,119 @@
+import urllib2
+from unittest2 import TestCase
+import servermonitor
+from servermonitor import http_get, http_get_many
+from tests.fakeservers import FakeGamemonitorServer, unused_tcp_address
+
+
+class Test_http_get(TestCase):
+    def setUp(self):
+        self.server = FakeGamemonitorServer({'1.2.3.4:27960': '={"error":0,"player":3}'})
+        self.server.start()
+        self.url = "http://%s/1.2.3.4:27960/data/server.js" % self.server.address
+
+    def tearDown(self):
+        servermonitor.http_pool.close_all()
+        self.server.stop()
+
+    def test_nominal(self):
+        # WHEN
+        document = http_get(self.url)
+        # THEN
+        self.assertEqual('={"error":0,"player":3}', document)
+        self.assertIsNotNone(document.etag)
+
+    def test_not_found(self):
+        # WHEN
+        try:
+            http_get("http://%s/f00" % self.server.address)
+        except urllib2.HTTPError, err:
+            # THEN
+            self.assertEqual(404, err.code)
+        else:
+            self.fail("expecting HTTPError")
+
+    def test_keep_alive(self):
+        # WHEN
+        for i in range(5):
+            http_get(self.url)
+        # THEN
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_not_modified(self):
+        # GIVEN
+        document = http_get(self.url)
+        # WHEN
+        try:
+            http_get(self.url, etag=document.etag)
+        except urllib2.HTTPError, err:
+            # THEN
+            self.assertEqual(304, err.code)
+        else:
+            self.fail("expecting HTTPError 304")
+
+    def test_modified(self):
+        # GIVEN
+        document = http_get(self.url)
+        self.server.documents['1.2.3.4:27960'] = '={"error":0,"player":4}'
+        # WHEN
+        new_document = http_get(self.url, etag=document.etag)
+        # THEN
+        self.assertEqual('={"error":0,"player":4}', new_document)
+        self.assertNotEqual(document.etag, new_document.etag)
+
+
+class Test_http_get_many(TestCase):
+    def setUp(self):
+        self.server = FakeGamemonitorServer(dict([('1.2.3.%s:27960' % i, '={"error":0,"player":%s}' % i)
+                                                  for i in range(5)]))
+        self.server.start()
+
+    def tearDown(self):
+        servermonitor.http_pool.close_all()
+        self.server.stop()
+
+    def url(self, address):
+        return "http://%s/%s/data/server.js" % (self.server.address, address)
+
+    def test_pipelining(self):
+        # WHEN
+        results = http_get_many([(self.url('1.2.3.%s:27960' % i), {}) for i in range(5)])
+        # THEN
+        self.assertListEqual(['={"error":0,"player":%s}' % i for i in range(5)], results)
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_errors(self):
+        # WHEN
+        results = http_get_many([(self.url('1.2.3.0:27960'), {}), (self.url('6.6.6.6:27960'), {})])
+        # THEN
+        self.assertEqual('={"error":0,"player":0}', results[0])
+        self.assertIsInstance(results[1], urllib2.HTTPError)
+        self.assertEqual(404, results[1].code)
+
+    def test_not_modified(self):
+        # GIVEN
+        document = http_get(self.url('1.2.3.0:27960'))
+        # WHEN
+        results = http_get_many([(self.url('1.2.3.0:27960'), {'etag': document.etag}),
+                                 (self.url('1.2.3.1:27960'), {})])
+        # THEN
+        self.assertIsInstance(results[0], urllib2.HTTPError)
+        self.assertEqual(304, results[0].code)
+        self.assertEqual('={"error":0,"player":1}', results[1])
+
+    def test_server_closing_connections(self):
+        # GIVEN
+        self.server.max_requests_per_connection = 2
+        # WHEN
+        results = http_get_many([(self.url('1.2.3.%s:27960' % i), {}) for i in range(5)])
+        # THEN
+        self.assertListEqual(['={"error":0,"player":%s}' % i for i in range(5)], results)
+        self.assertEqual(3, self.server.connections)
+
+    def test_server_down(self):
+        # WHEN
+        results = http_get_many([("http://%s/1.2.3.0:27960/data/server.js" % unused_tcp_address(), {})])
+        # THEN
+        self.assertIsInstance(results[0], Exception)
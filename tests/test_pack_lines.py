@@ -0,0 +1,30 @@
+from unittest2 import TestCase
+from servermonitor import pack_lines, visible_length
+
+
+class Test_visible_length(TestCase):
+    def test_nominal(self):
+        self.assertEqual(0, visible_length(""))
+        self.assertEqual(3, visible_length("f00"))
+        self.assertEqual(7, visible_length("^1f00 ^7bar"))
+        self.assertEqual(3, visible_length("^af00"))
+
+
+class Test_pack_lines(TestCase):
+    def test_no_line(self):
+        self.assertListEqual([], pack_lines([], 80))
+
+    def test_disabled(self):
+        self.assertListEqual(["a", "b", "c"], pack_lines(["a", "b", "c"], 0))
+
+    def test_nominal(self):
+        self.assertListEqual(["aaaa | bbbb", "cccc"], pack_lines(["aaaa", "bbbb", "cccc"], 11, separator=" | "))
+
+    def test_exact_fit(self):
+        self.assertListEqual(["aaaa | bbbb | cccc"], pack_lines(["aaaa", "bbbb", "cccc"], 18, separator=" | "))
+
+    def test_color_codes_do_not_count(self):
+        self.assertListEqual(["^1aaaa ^7| ^2bbbb"], pack_lines(["^1aaaa", "^2bbbb"], 11))
+
+    def test_long_line(self):
+        self.assertListEqual(["a", "bbbbbbbbbbbb", "c"], pack_lines(["a", "bbbbbbbbbbbb", "c"], 8, separator=" | "))
@@ -0,0 +1,156 @@
+import socket
+import threading
+import time
+from mock import Mock, patch
+from mockito import when, verify, unstub
+import servermonitor
+from servermonitor import ServerPoller
+from tests import ServermonitorTestCase
+
+GAMEMONITOR_URL = "http://module.game-monitor.com/1.2.3.4:27960/data/server.js"
+QUAKE3_RESPONSE = "\377\377\377\377infoResponse\n\\hostname\\my server\\mapname\\ut4_casa\\clients\\3\\sv_maxclients\\12"
+GAMEMONITOR_RESPONSE = """={"ip":"1.2.3.4","port":27960,"player":15,"maxplayer":20,"name":"test server 1.2.3.4","error":0}"""
+
+
+class Test_poller(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        self.logger.propagate = False
+        self.superadmin.connects("1")
+        self.superadmin.clearMessageHistory()
+        self.logger.propagate = True
+        when(servermonitor).http_get(GAMEMONITOR_URL).thenReturn(GAMEMONITOR_RESPONSE)
+
+    def tearDown(self):
+        self.p.stop_poller()
+        ServermonitorTestCase.tearDown(self)
+        unstub()
+
+    def wait_for_first_poll(self, timeout=5):
+        end = time.time() + timeout
+        while time.time() < end and any([x.last_update is None for x in self.p.servers]):
+            time.sleep(.05)
+
+    def test_no_poller(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+poll interval: 0
+[servers]
+game-monitor.com: 1.2.3.4:27960
+""")
+        # THEN
+        self.assertIsNone(self.p.poller)
+
+    def test_servers_answered_from_cache(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+poll interval: 600
+advertisement format: {address} : {players}/{max_players} {name}
+[servers]
+game-monitor.com: 1.2.3.4:27960
+""")
+        self.wait_for_first_poll()
+        # WHEN
+        self.superadmin.says("!servers")
+        self.superadmin.says("!servers")
+        # THEN
+        self.assertListEqual(['1.2.3.4:27960 : 15/20 test server 1.2.3.4'] * 2, self.superadmin.message_history)
+        verify(servermonitor, times=1).http_get(GAMEMONITOR_URL)
+
+    def test_stale_status(self):
+        # GIVEN
+        self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+poll interval: 600
+advertisement format: {address} : {players}/{max_players} {name}
+[servers]
+game-monitor.com: 1.2.3.4:27960
+""")
+        self.wait_for_first_poll()
+        self.p.servers[0].last_update -= 3600
+        # WHEN
+        self.superadmin.says("!servers")
+        # THEN
+        self.assertListEqual(['1.2.3.4:27960 : 15/20 test server 1.2.3.4 (1h ago)'], self.superadmin.message_history)
+
+    def test_status_kept_while_polling(self):
+        # GIVEN
+        with patch('servermonitor.quake3_info', return_value=QUAKE3_RESPONSE):
+            self.init_plugin("""\
+[commands]
+servers: guest
+[settings]
+poll interval: 600
+advertisement format: {address} : {map} {players}/{max_players} {name}
+[servers]
+quake3 server: 1.2.3.4:27960
+""")
+            self.wait_for_first_poll()
+        server = self.p.servers[0]
+        querying = threading.Event()
+        release = threading.Event()
+        def blocked_query(address):
+            querying.set()
+            release.wait(5)
+            raise socket.timeout()
+        server.last_update -= 3600
+        with patch('servermonitor.quake3_info', side_effect=blocked_query):
+            poll = threading.Thread(target=server.update)
+            poll.start()
+            querying.wait(5)
+            # WHEN
+            info = str(server)
+            release.set()
+            poll.join(5)
+        # THEN
+        self.assertEqual('1.2.3.4:27960 : ut4_casa 3/12 my server', info)
+        self.assertEqual('1.2.3.4:27960 : down', str(server))
+
+    def test_reconfig_stops_poller(self):
+        # GIVEN
+        self.init_plugin("""\
+[settings]
+poll interval: 600
+""")
+        poller = self.p.poller
+        self.assertTrue(poller.isAlive())
+        # WHEN
+        self.conf.loadFromString("""\
+[settings]
+poll interval: 0
+""")
+        self.p.onLoadConfig()
+        # THEN
+        self.assertIsNone(self.p.poller)
+        poller.join(2)
+        self.assertFalse(poller.isAlive())
+
+
+class Test_ServerPoller(ServermonitorTestCase):
+
+    def test_poller_survives_errors(self):
+        # GIVEN
+        plugin = Mock()
+        plugin.servers = [Mock()]
+        plugin.update_servers.side_effect = [ValueError("f00"), None, None, None]
+        poller = ServerPoller(plugin, 0.05)
+        poller.FIRST_POLL_SPREAD = 0
+        # WHEN
+        poller.start()
+        end = time.time() + 5
+        while time.time() < end and plugin.update_servers.call_count < 2:
+            time.sleep(.01)
+        poller.stop()
+        poller.join(2)
+        # THEN
+        self.assertGreaterEqual(plugin.update_servers.call_count, 2)
+        plugin.error.assert_called_once_with("Could not poll game servers. f00")
@@ -0,0 +1,140 @@
+from mock import patch
+from servermonitor import frostbite_pool
+from tests import ServermonitorTestCase
+from tests.fakeservers import FakeFrostbiteServer
+
+CONFIG = """\
+[commands]
+servers: guest
+[settings]
+advertisement format: %s
+poll interval: 0
+[servers]
+quake3 server: %s
+BF3 server: %s
+"""
+
+
+class Test_reconfig(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        self.init_plugin(CONFIG % ("{address} {name}", "1.2.3.4:27960 1.2.3.4:27961", "1.2.3.4:47200"))
+        self.warm_up_patcher = patch.object(self.p, 'warm_up')
+        self.warm_up_mock = self.warm_up_patcher.start()
+
+    def tearDown(self):
+        self.warm_up_patcher.stop()
+        ServermonitorTestCase.tearDown(self)
+
+    def reconfig(self, config):
+        self.conf.loadFromString(config)
+        self.p.onLoadConfig()
+
+    def test_unchanged(self):
+        # GIVEN
+        servers = list(self.p.servers)
+        servers[0].info = "1.2.3.4:27960 cached"
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960 1.2.3.4:27961", "1.2.3.4:47200"))
+        # THEN
+        self.assertListEqual(map(id, servers), map(id, self.p.servers))
+        self.assertEqual("1.2.3.4:27960 cached", self.p.servers[0].info)
+        self.assertIsNotNone(self.p.servers[0].player_history)
+        self.warm_up_mock.assert_called_once_with([])
+
+    def test_diff(self):
+        # GIVEN
+        kept, removed, bf3 = self.p.servers
+        history = removed.player_history
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960 5.6.7.8:27960", "1.2.3.4:47200"))
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960", "5.6.7.8:27960", "1.2.3.4:47200"], [x.address for x in self.p.servers])
+        self.assertIs(kept, self.p.servers[0])
+        self.assertIs(bf3, self.p.servers[2])
+        self.assertIsNone(removed.player_history)
+        self.assertListEqual([], history.samples())
+        self.warm_up_mock.assert_called_once_with([self.p.servers[1]])
+
+    def test_same_address_other_datasource(self):
+        # GIVEN
+        old = self.p.servers[2]
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960 1.2.3.4:27961 1.2.3.4:47200", ""))
+        # THEN
+        self.assertListEqual(["Quake3ServerInfo('1.2.3.4:27960')", "Quake3ServerInfo('1.2.3.4:27961')",
+                              "Quake3ServerInfo('1.2.3.4:47200')"], map(repr, self.p.servers))
+        self.assertIsNone(old.player_history)
+
+    def test_format_change(self):
+        # GIVEN
+        old = self.p.servers[0]
+        old.player_history.record(1000, 2, 12, True)
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {map}", "1.2.3.4:27960 1.2.3.4:27961", "1.2.3.4:47200"))
+        # THEN
+        server = self.p.servers[0]
+        self.assertIsNot(old, server)
+        self.assertEqual("{address} {map}", server.msg_format)
+        self.assertListEqual([(1000, 2, 12, True)], server.player_history.samples())
+        self.assertEqual(3, len(self.warm_up_mock.call_args[0][0]))
+
+    def test_cache_ttl_change(self):
+        # GIVEN
+        servers = list(self.p.servers)
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960 1.2.3.4:27961", "1.2.3.4:47200")
+                      + "[settings]\ncache ttl: 30\n")
+        # THEN
+        self.assertListEqual(map(id, servers), map(id, self.p.servers))
+        self.assertListEqual([30, 30, 30], [x.cache_ttl for x in self.p.servers])
+
+    def test_discovered_servers_are_kept(self):
+        # GIVEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960", "") + "quake3 master: 127.0.0.1:27950\n")
+        self.p.stop_discovery()
+        with patch('servermonitor.quake3_master_servers', return_value=["9.9.9.9:27960"]):
+            self.p.discover_servers()
+        discovered = self.p.servers[-1]
+        # WHEN
+        self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960 1.2.3.4:27961", "") + "quake3 master: 127.0.0.1:27950\n")
+        self.p.stop_discovery()
+        # THEN
+        self.assertListEqual(["1.2.3.4:27960", "1.2.3.4:27961", "9.9.9.9:27960"], [x.address for x in self.p.servers])
+        self.assertIs(discovered, self.p.servers[-1])
+        self.assertSetEqual(set(["9.9.9.9:27960"]), self.p.discovered)
+
+    def test_removed_frostbite_connection_is_closed(self):
+        # GIVEN
+        game_server = FakeFrostbiteServer()
+        game_server.start()
+        try:
+            self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960", game_server.address))
+            self.p.servers[1].update()
+            connection = frostbite_pool._slots[game_server.address].connection
+            self.assertIsNotNone(connection)
+            # WHEN
+            self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960", ""))
+        finally:
+            game_server.stop()
+        # THEN
+        self.assertNotIn(game_server.address, frostbite_pool._slots)
+        self.assertIsNone(connection._serverSocket)
+
+    def test_frostbite_connection_kept_while_address_in_use(self):
+        # GIVEN
+        game_server = FakeFrostbiteServer()
+        game_server.start()
+        try:
+            self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960", game_server.address))
+            self.p.servers[1].update()
+            connection = frostbite_pool._slots[game_server.address].connection
+            # WHEN
+            self.reconfig(CONFIG % ("{address} {name}", "1.2.3.4:27960", "")
+                          + "BF4 server: %s\n" % game_server.address)
+            # THEN
+            self.assertIs(connection, frostbite_pool._slots[game_server.address].connection)
+        finally:
+            frostbite_pool.close(game_server.address)
+            game_server.stop()
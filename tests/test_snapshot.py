@@ -0,0 +1,166 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from mockito import when, unstub
+import servermonitor
+from tests import ServermonitorTestCase
+
+CONFIG = """\
+[commands]
+servers: guest
+[settings]
+snapshot file: %s
+%s
+[servers]
+quake3 server: 1.2.3.4:27960 1.2.3.4:27961
+"""
+
+
+class Test_snapshot(ServermonitorTestCase):
+
+    def setUp(self):
+        ServermonitorTestCase.setUp(self)
+        fd, self.snapshot_file = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.remove(self.snapshot_file)
+        self.logger.propagate = False
+        self.superadmin.connects("1")
+        self.superadmin.clearMessageHistory()
+        self.logger.propagate = True
+
+    def tearDown(self):
+        unstub()
+        if self.p.poller:
+            self.p.stop_poller()
+        if os.path.exists(self.snapshot_file):
+            os.remove(self.snapshot_file)
+        ServermonitorTestCase.tearDown(self)
+
+    def write_snapshot(self, age=120):
+        f = open(self.snapshot_file, 'w')
+        json.dump({'time': time.time(), 'servers': [{
+            'backend': 'Quake3',
+            'address': '1.2.3.4:27960',
+            'info': '1.2.3.4:27960 : ut4_casa 2/12 Caf\xe9',
+            'last_update': time.time() - age,
+            'status': {'name': 'Caf\xe9', 'map': 'ut4_casa', 'gamemode': None, 'players': 2, 'max_players': 12,
+                       'ping': 42, 'timestamp': time.time() - age},
+        }]}, f, encoding='latin-1')
+        f.close()
+
+    def test_no_snapshot_file(self):
+        # WHEN
+        self.init_plugin(CONFIG % (self.snapshot_file, ""))
+        # THEN
+        self.assertFalse(os.path.exists(self.snapshot_file))
+        self.assertFalse([x for x in self.p.servers if x.restored])
+
+    def test_save(self):
+        # GIVEN
+        self.init_plugin(CONFIG % (self.snapshot_file, ""))
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\clients\\2\\sv_maxclients\\12\\hostname\\Caf\xe9'})
+        # WHEN
+        self.superadmin.says("!servers")
+        # THEN
+        f = open(self.snapshot_file)
+        snapshot = json.load(f)
+        f.close()
+        self.assertListEqual([u'1.2.3.4:27960', u'1.2.3.4:27961'], [x['address'] for x in snapshot['servers']])
+        self.assertEqual(u'Caf\xe9', snapshot['servers'][0]['status']['name'])
+        self.assertIsNone(snapshot['servers'][1]['status'])
+
+    def test_warm_start(self):
+        # GIVEN
+        self.write_snapshot()
+        # WHEN
+        self.init_plugin(CONFIG % (self.snapshot_file, "poll interval: 3600"))
+        self.p.stop_poller()
+        # THEN
+        server = self.p.servers[0]
+        self.assertTrue(server.restored)
+        self.assertEqual('Caf\xe9', server.status.name)
+        self.assertEqual(2, server.status.players)
+        self.assertEqual(42, server.status.ping)
+        self.assertFalse(self.p.servers[1].restored)
+
+    def test_restored_servers_are_refreshed_in_the_background(self):
+        # GIVEN
+        self.write_snapshot()
+        when(servermonitor).quake3_info("1.2.3.4:27960").thenReturn(
+            '\xff\xff\xff\xffinfoResponse\n\\clients\\3\\sv_maxclients\\12\\hostname\\Caf\xe9')
+        # WHEN
+        self.init_plugin(CONFIG % (self.snapshot_file, ""))
+        # THEN
+        server = self.p.servers[0]
+        for i in range(20):
+            if not server.restored:
+                break
+            time.sleep(.1)
+        self.assertFalse(server.restored)
+        self.assertEqual(3, server.status.players)
+
+    def test_restored_server_is_advertised_as_stale(self):
+        # GIVEN
+        self.write_snapshot()
+        self.init_plugin(CONFIG % (self.snapshot_file, "poll interval: 3600"))
+        self.p.stop_poller()
+        # WHEN
+        self.superadmin.says("!servers 1")
+        # THEN
+        self.assertListEqual(['1.2.3.4:27960 : ut4_casa 2/12 Caf\xe9 (2m ago)'], self.superadmin.message_history)
+
+    def test_unknown_servers_are_ignored(self):
+        # GIVEN
+        self.write_snapshot()
+        # WHEN
+        self.init_plugin(CONFIG.replace("1.2.3.4:27960 ", "") % (self.snapshot_file, "poll interval: 3600"))
+        # THEN
+        self.assertListEqual(['1.2.3.4:27961'], [x.address for x in self.p.servers])
+        self.assertFalse(self.p.servers[0].restored)
+
+    def test_junk_snapshot_file(self):
+        # GIVEN
+        f = open(self.snapshot_file, 'w')
+        f.write('f00')
+        f.close()
+        # WHEN
+        self.init_plugin(CONFIG % (self.snapshot_file, "poll interval: 3600"))
+        # THEN
+        self.assertFalse([x for x in self.p.servers if x.restored])
+
+    def test_saved_when_b3_stops(self):
+        # GIVEN
+        self.init_plugin(CONFIG % (self.snapshot_file, "poll interval: 0"))
+        when(servermonitor).quake3_info_many(["1.2.3.4:27960", "1.2.3.4:27961"]).thenReturn({
+            "1.2.3.4:27960": '\xff\xff\xff\xffinfoResponse\n\\clients\\2\\sv_maxclients\\12\\hostname\\test'})
+        self.superadmin.says("!servers")
+        os.remove(self.snapshot_file)
+        # WHEN
+        self.p.parseEvent(self.console.getEvent('EVT_STOP', ''))
+        # THEN
+        f = open(self.snapshot_file)
+        snapshot = json.load(f)
+        f.close()
+        self.assertEqual(2, len(snapshot['servers']))
+
+    def test_concurrent_saves(self):
+        # GIVEN
+        self.init_plugin(CONFIG % (self.snapshot_file, "poll interval: 0"))
+        for server in self.p.servers:
+            server.last_update = time.time()
+            server.info = "%s : up" % server.address
+        # WHEN
+        writers = [threading.Thread(target=self.p.save_snapshot, args=(True,)) for i in range(10)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        # THEN
+        f = open(self.snapshot_file)
+        snapshot = json.load(f)
+        f.close()
+        self.assertEqual(2, len(snapshot['servers']))
+        self.assertFalse(os.path.exists(self.snapshot_file + '.tmp'))
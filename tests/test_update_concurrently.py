@@ -0,0 +1,118 @@
+import time
+from mock import Mock
+from unittest2 import TestCase
+from servermonitor import ServerInfo, update_concurrently, query_jobs
+
+
+class SlowServerInfo(ServerInfo):
+    """
+    ServerInfo which takes 'delay' seconds to update
+    """
+    def __init__(self, console, address, delay):
+        ServerInfo.__init__(self, console, address, "{address}")
+        self.delay = delay
+
+    def update(self):
+        time.sleep(self.delay)
+        self.info = "%s : up" % self.address
+
+
+class Test_update_concurrently(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_no_server(self):
+        # WHEN
+        late = update_concurrently([], max_workers=4, deadline=1)
+        # THEN
+        self.assertListEqual([], late)
+
+    def test_servers_are_queried_simultaneously(self):
+        # GIVEN
+        servers = [SlowServerInfo(self.console, "1.1.1.%s:27960" % i, 0.5) for i in range(10)]
+        # WHEN
+        start = time.time()
+        late = update_concurrently(servers, max_workers=10, deadline=3)
+        elapsed = time.time() - start
+        # THEN
+        self.assertListEqual([], late)
+        self.assertLess(elapsed, 1.5)
+        self.assertListEqual(["1.1.1.%s:27960 : up" % i for i in range(10)], map(str, servers))
+
+    def test_deadline(self):
+        # GIVEN
+        fast = SlowServerInfo(self.console, "1.1.1.1:27960", 0)
+        slow = SlowServerInfo(self.console, "2.2.2.2:27960", 5)
+        # WHEN
+        start = time.time()
+        late = update_concurrently([fast, slow], max_workers=2, deadline=0.5)
+        elapsed = time.time() - start
+        # THEN
+        self.assertListEqual([slow], late)
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual("1.1.1.1:27960 : up", str(fast))
+        self.assertEqual("2.2.2.2:27960 : unknown", str(slow))
+
+    def test_failing_update(self):
+        # GIVEN
+        server = SlowServerInfo(self.console, "1.1.1.1:27960", 0)
+        server.update = Mock(side_effect=ValueError("f00"))
+        # WHEN
+        late = update_concurrently([server], max_workers=2, deadline=1)
+        # THEN
+        self.assertListEqual([], late)
+        self.assertTrue(self.console.error.called)
+
+
+class MultiplexedTransport(object):
+    MULTIPLEXED = True
+
+
+class PooledTransport(object):
+    MULTIPLEXED = False
+
+
+class BatchServerInfo(SlowServerInfo):
+    BATCH_UPDATE = True
+    TRANSPORT = MultiplexedTransport()
+
+
+class OtherBatchServerInfo(SlowServerInfo):
+    BATCH_UPDATE = True
+    TRANSPORT = BatchServerInfo.TRANSPORT
+
+
+class PooledBatchServerInfo(SlowServerInfo):
+    BATCH_UPDATE = True
+    TRANSPORT = PooledTransport()
+
+
+class Test_query_jobs(TestCase):
+    def setUp(self):
+        self.console = Mock()
+
+    def test_no_transport(self):
+        # GIVEN
+        servers = [SlowServerInfo(self.console, "1.1.1.%s:27960" % i, 0) for i in range(3)]
+        # WHEN
+        jobs = query_jobs(servers)
+        # THEN
+        self.assertListEqual([[x] for x in servers], [batch for job, batch in jobs])
+
+    def test_multiplexed_transport(self):
+        # GIVEN
+        servers = [BatchServerInfo(self.console, "1.1.1.%s:27960" % i, 0) for i in range(3)]
+        other = OtherBatchServerInfo(self.console, "2.2.2.2:27960", 0)
+        single = SlowServerInfo(self.console, "3.3.3.3:27960", 0)
+        # WHEN
+        jobs = query_jobs([single] + servers + [other])
+        # THEN
+        self.assertListEqual([servers, [single], [other]], [batch for job, batch in jobs])
+
+    def test_pooled_transport(self):
+        # GIVEN
+        servers = [PooledBatchServerInfo(self.console, "1.1.1.%s:27960" % i, 0) for i in range(3)]
+        # WHEN
+        jobs = query_jobs(servers)
+        # THEN
+        self.assertListEqual([[x] for x in servers], [batch for job, batch in jobs])